@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+from docker_rate_limit_check.server_mode import HTTPServerMode
+
+from .common import free_port
+from .common import print_result
+from .common import run_load
+from .common import start_exporter
+from .fake_docker_hub import FakeDockerHub
+
+
+def main() -> None:
+    """
+    Measure throughput and latency of the HTTP server for every server
+    mode and output format
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        '--modes', nargs='+', default=[mode.value for mode in HTTPServerMode],
+        help='Server modes to measure')
+    parser.add_argument(
+        '--formats', nargs='+', default=[fmt.value for fmt in RateLimitOutputFormat],
+        help='Output formats to measure')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per measurement')
+    parser.add_argument('--cache-ttl', type=int, default=30, help='Cache TTL of exporter')
+    parser.add_argument('--latency', type=float, default=0.05, help='Latency of fake Docker Hub')
+    args = parser.parse_args()
+
+    hub = FakeDockerHub(latency=args.latency).start()
+    try:
+        for mode in args.modes:
+            port = free_port()
+            exporter = start_exporter(
+                hub, port,
+                '--server-mode', mode,
+                '--cache-ttl', str(args.cache_ttl))
+            try:
+                for output_format in args.formats:
+                    result = run_load(
+                        port,
+                        [f'/?format={output_format}'],
+                        args.concurrency,
+                        args.duration)
+                    print_result(
+                        'http_server',
+                        mode=mode,
+                        format=output_format,
+                        concurrency=args.concurrency,
+                        **result)
+            finally:
+                exporter.terminate()
+                exporter.wait()
+    finally:
+        hub.stop()
+
+
+if __name__ == '__main__':
+    main()
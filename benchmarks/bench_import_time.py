@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+
+from .common import print_result
+from .fake_docker_hub import FakeDockerHub
+
+
+# Modules that are expensive to import and only needed by some commands
+HEAVY_MODULES = ('asyncio', 'http.server', 'requests', 'yaml')
+
+# Imports command line interface and reports duration and loaded modules
+IMPORT_SCRIPT = f'''
+import json, sys, time
+start = time.perf_counter()
+import docker_rate_limit_check.__main__
+duration = time.perf_counter() - start
+print(json.dumps({{
+    "duration": duration,
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+'''
+
+
+def main() -> None:
+    """
+    Measure time to import the command line interface and wall time of
+    the query command when it is answered from the disk cache
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--runs', type=int, default=20, help='Runs per measurement')
+    args = parser.parse_args()
+
+    durations = []
+    loaded = []
+    for _ in range(args.runs):
+        output = subprocess.run(  # noqa: S603
+            [sys.executable, '-c', IMPORT_SCRIPT],
+            check=True, stdout=subprocess.PIPE).stdout
+        result = json.loads(output)
+        durations.append(result['duration'])
+        loaded = result['loaded']
+
+    print_result(
+        'import_time',
+        runs=args.runs,
+        median_ms=round(statistics.median(durations) * 1000, 1),
+        min_ms=round(min(durations) * 1000, 1),
+        heavy_modules_loaded=loaded)
+
+    hub = FakeDockerHub().start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for output_format in RateLimitOutputFormat:
+                command = [
+                    sys.executable, '-m', 'docker_rate_limit_check', 'query',
+                    '--format', output_format.value,
+                    '--token-endpoint', hub.token_endpoint,
+                    '--rate-limit-endpoint', hub.rate_limit_endpoint,
+                    '--cache-ttl', '3600',
+                    '--cache-file', os.path.join(directory, 'query.json'),
+                ]
+                durations = []
+                # First run fills the cache and is not measured
+                for _ in range(args.runs + 1):
+                    start = time.perf_counter()
+                    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)  # noqa: S603
+                    durations.append(time.perf_counter() - start)
+
+                print_result(
+                    'query_cached',
+                    format=output_format.value,
+                    runs=args.runs,
+                    median_ms=round(statistics.median(durations[1:]) * 1000, 1),
+                    min_ms=round(min(durations[1:]) * 1000, 1))
+    finally:
+        hub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+
+from .common import print_result
+from .fake_docker_hub import FakeDockerHub
+
+
+def main() -> None:
+    """
+    Measure wall time of the query command including interpreter start
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--runs', type=int, default=10, help='Runs per output format')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency of fake Docker Hub')
+    args = parser.parse_args()
+
+    hub = FakeDockerHub(latency=args.latency).start()
+    try:
+        for output_format in RateLimitOutputFormat:
+            durations = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                subprocess.run([  # noqa: S603
+                    sys.executable, '-m', 'docker_rate_limit_check', 'query',
+                    '--format', output_format.value,
+                    '--token-endpoint', hub.token_endpoint,
+                    '--rate-limit-endpoint', hub.rate_limit_endpoint,
+                ], check=True, stdout=subprocess.DEVNULL)
+                durations.append(time.perf_counter() - start)
+
+            print_result(
+                'query',
+                format=output_format.value,
+                runs=args.runs,
+                min_ms=round(min(durations) * 1000, 1),
+                median_ms=round(statistics.median(durations) * 1000, 1),
+                max_ms=round(max(durations) * 1000, 1))
+    finally:
+        hub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+import timeit
+
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
+
+from .common import print_result
+
+
+# Renderers of DockerRateLimit and DockerRateLimitGroup to compare
+RENDERERS = (
+    'to_json',
+    'to_prometheus',
+    'to_yaml',
+    'to_compact_json',
+    'to_ndjson',
+    'to_csv',
+    'to_openmetrics',
+)
+
+
+def main() -> None:
+    """
+    Measure time to render the rate limit of a single account and of
+    many accounts with every renderer, without any HTTP server involved
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--accounts', type=int, default=100, help='Accounts of group')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetitions per renderer')
+    args = parser.parse_args()
+
+    rate_limit = DockerRateLimit(
+        rate_limit_max=200,
+        rate_limit_remaining=150,
+        identifier='203.0.113.1',
+        refreshed_at=time.time())
+    group = DockerRateLimitGroup({
+        f'account-{index}': DockerRateLimit(
+            rate_limit_max=200,
+            rate_limit_remaining=index % 200,
+            identifier=f'203.0.113.{index % 256}',
+            refreshed_at=time.time())
+        for index in range(args.accounts)
+    })
+
+    for accounts, subject in ((1, rate_limit), (args.accounts, group)):
+        for renderer in RENDERERS:
+            render = getattr(subject, renderer)
+            timer = timeit.Timer(render)
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+            print_result(
+                'renderers',
+                renderer=renderer,
+                accounts=accounts,
+                us_per_call=round(best * 1e6, 2),
+                bytes=len(render()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from .common import free_port
+from .common import print_result
+from .common import run_load
+from .common import start_exporter
+from .fake_docker_hub import FakeDockerHub
+
+
+def main() -> None:
+    """
+    Count requests sent to Docker Hub per cache TTL window while the
+    exporter is under load. Ideally there is one rate limit request per
+    window and one token request per token lifetime.
+    """
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--server-mode', default='threaded', help='Server mode of exporter')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--cache-ttl', type=int, default=2, help='Cache TTL of exporter')
+    parser.add_argument('--windows', type=int, default=5, help='Number of TTL windows to measure')
+    parser.add_argument('--latency', type=float, default=0.2, help='Latency of fake Docker Hub')
+    parser.add_argument(
+        '--failure-rate', type=float, default=0.0,
+        help='Share of failed rate limit requests')
+    parser.add_argument(
+        '--extra-args', nargs='*', default=[],
+        help='Additional arguments for exporter, e.g. --stale-while-revalidate=5')
+    args = parser.parse_args()
+
+    hub = FakeDockerHub(latency=args.latency, failure_rate=args.failure_rate).start()
+    port = free_port()
+    exporter = start_exporter(
+        hub, port,
+        '--server-mode', args.server_mode,
+        '--cache-ttl', str(args.cache_ttl),
+        *args.extra_args)
+    try:
+        result = run_load(port, ['/'], args.concurrency, args.cache_ttl * args.windows)
+        token_requests, rate_limit_requests = hub.upstream_calls()
+        print_result(
+            'upstream_calls',
+            mode=args.server_mode,
+            cache_ttl=args.cache_ttl,
+            windows=args.windows,
+            failure_rate=args.failure_rate,
+            token_requests=token_requests,
+            rate_limit_requests=rate_limit_requests,
+            rate_limit_requests_per_window=round(rate_limit_requests / args.windows, 2),
+            **result)
+    finally:
+        exporter.terminate()
+        exporter.wait()
+        hub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import math
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Sequence
+
+from .fake_docker_hub import FakeDockerHub
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """
+    Return percentile of values using the nearest-rank method
+
+    :param values: Values sorted in ascending order
+    :param percent: Percentile to return (0 - 100)
+    :return: Value at percentile or NaN if there are no values
+    """
+
+    if len(values) == 0:
+        return math.nan
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def print_result(benchmark: str, **result: Any) -> None:
+    """
+    Print result of benchmark as single line of JSON
+
+    :param benchmark: Name of benchmark
+    :param **result: Measured values
+    """
+
+    print(json.dumps({'benchmark': benchmark, **result}), flush=True)
+
+
+def free_port() -> int:
+    """
+    Return port on localhost that is currently not in use
+
+    :return: Port number
+    """
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return int(sock.getsockname()[1])
+
+
+def wait_for_port(port: int, timeout: float=10.0) -> None:
+    """
+    Wait until something listens on port on localhost
+
+    :param port: Port to wait for
+    :param timeout: Number of seconds to wait at most
+    :raises TimeoutError: If nothing listens on port after timeout
+    """
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f'Nothing listens on port {port}')
+
+
+def start_exporter(hub: FakeDockerHub, port: int, *args: str) -> 'subprocess.Popen[bytes]':
+    """
+    Start HTTP server of exporter in a separate process querying the fake
+    Docker Hub
+
+    :param hub: Fake Docker Hub to query
+    :param port: Port for exporter to listen on
+    :param *args: Additional command line arguments for http command
+    :raises TimeoutError: If exporter does not listen on port in time
+    :return: Running process
+    """
+
+    process = subprocess.Popen([  # noqa: S603 # pylint: disable=consider-using-with
+        sys.executable, '-m', 'docker_rate_limit_check', 'http',
+        '--host', '127.0.0.1',
+        '--port', str(port),
+        '--token-endpoint', hub.token_endpoint,
+        '--rate-limit-endpoint', hub.rate_limit_endpoint,
+        *args,
+    ], stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+    except TimeoutError:
+        process.kill()
+        raise
+    return process
+
+
+def run_load(
+        port: int,
+        paths: Sequence[str],
+        concurrency: int,
+        duration: float) -> Dict[str, Any]:
+    """
+    Send GET requests to server on localhost from multiple threads, each
+    reusing its connection, and measure latency of every request.
+
+    :param port: Port of server on localhost
+    :param paths: Paths to request in turn
+    :param concurrency: Number of concurrent clients
+    :param duration: Number of seconds to send requests for
+    :return: Number of requests and errors, requests per second and
+        latency percentiles in milliseconds
+    """
+
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client() -> None:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        local_latencies = []
+        local_errors = 0
+        index = 0
+        while time.monotonic() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+                local_latencies.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+
+# Paths of fake endpoints
+TOKEN_PATH = '/token'
+RATE_LIMIT_PATH = '/v2/ratelimitpreview/test/manifests/latest'
+
+
+class FakeDockerHub(ThreadingHTTPServer):  # pylint: disable=too-many-instance-attributes
+    """
+    Local stand-in for the Docker Hub token endpoint and registry
+    answering like Docker Hub does when asked for the rate limit.
+
+    :param host: Host to bind on
+    :param port: Port to listen on (0 for a random free port)
+    :param latency: Number of seconds to wait before answering
+    :param rate_limit_max: Reported maximum number of pulls
+    :param rate_limit_remaining: Reported remaining number of pulls
+    :param rate_limited: Whether to answer every HEAD request with HTTP-429
+    :param failure_rate: Share of HEAD requests answered with HTTP-503
+    :param token_lifetime: Reported lifetime of tokens in seconds
+    """
+
+    daemon_threads = True
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            host: str='127.0.0.1',
+            port: int=0,
+            latency: float=0.0,
+            rate_limit_max: int=100,
+            rate_limit_remaining: int=100,
+            rate_limited: bool=False,
+            failure_rate: float=0.0,
+            token_lifetime: int=300) -> None:
+
+        self.latency = latency
+        self.rate_limit_max = rate_limit_max
+        self.rate_limit_remaining = rate_limit_remaining
+        self.rate_limited = rate_limited
+        self.failure_rate = failure_rate
+        self.token_lifetime = token_lifetime
+
+        # Number of requests received by endpoint
+        self.lock = threading.Lock()
+        self.token_requests = 0
+        self.rate_limit_requests = 0
+
+        super().__init__((host, port), FakeDockerHubRequestHandler)
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """
+        URL of this server
+
+        :return: URL without trailing slash
+        """
+
+        host, port = self.server_address[:2]
+        return f'http://{str(host)}:{port}'
+
+    @property
+    def token_endpoint(self) -> str:
+        """
+        URL to use instead of Docker Hub token endpoint
+
+        :return: URL of fake token endpoint
+        """
+
+        return f'{self.base_url}{TOKEN_PATH}?service=registry.docker.io'
+
+    @property
+    def rate_limit_endpoint(self) -> str:
+        """
+        URL to use instead of Docker Hub rate limit endpoint
+
+        :return: URL of fake manifest
+        """
+
+        return f'{self.base_url}{RATE_LIMIT_PATH}'
+
+    def upstream_calls(self) -> Tuple[int, int]:
+        """
+        Return number of requests received so far
+
+        :return: Number of token requests and number of rate limit requests
+        """
+
+        with self.lock:
+            return self.token_requests, self.rate_limit_requests
+
+    def start(self) -> 'FakeDockerHub':
+        """
+        Serve requests in a background thread
+
+        :return: This server
+        """
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving requests and close socket
+        """
+
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class FakeDockerHubRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers requests to :class:`FakeDockerHub`
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server: FakeDockerHub
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=redefined-builtin
+        """
+        Do not log requests
+
+        :param format: Format string of message
+        :param *args: Arguments for format string
+        """
+
+    def send_body(self, code: int, body: bytes, **headers: str) -> None:
+        """
+        Send response after configured latency
+
+        :param code: HTTP status code
+        :param body: Body of response (not sent for HEAD requests)
+        :param **headers: Additional headers
+        """
+
+        time.sleep(self.server.latency)
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace('_', '-'), value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    # pylint: disable=invalid-name
+    def do_GET(self) -> None:
+        """
+        Answer token request
+        """
+
+        if not self.path.startswith(TOKEN_PATH):
+            self.send_body(404, b'')
+            return
+
+        with self.server.lock:
+            self.server.token_requests += 1
+        body = json.dumps({
+            'token': 'fake-token',
+            'expires_in': self.server.token_lifetime,
+        }).encode('utf-8')
+        self.send_body(200, body, content_type='application/json')
+
+    # pylint: disable=invalid-name
+    def do_HEAD(self) -> None:
+        """
+        Answer rate limit request
+        """
+
+        if self.path != RATE_LIMIT_PATH:
+            self.send_body(404, b'')
+            return
+
+        with self.server.lock:
+            self.server.rate_limit_requests += 1
+        if self.headers.get('Authorization') != 'Bearer fake-token':
+            self.send_body(401, b'')
+        elif random.random() < self.server.failure_rate:  # noqa: S311
+            self.send_body(503, b'')
+        elif self.server.rate_limited:
+            self.send_body(429, b'')
+        else:
+            self.send_body(
+                200, b'',
+                ratelimit_limit=f'{self.server.rate_limit_max};w=21600',
+                ratelimit_remaining=f'{self.server.rate_limit_remaining};w=21600',
+                docker_ratelimit_source='127.0.0.1')
+
+
+def main() -> None:
+    """
+    Run fake Docker Hub in the foreground
+    """
+
+    parser = argparse.ArgumentParser(description=FakeDockerHub.__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--rate-limit-max', type=int, default=100)
+    parser.add_argument('--rate-limit-remaining', type=int, default=100)
+    parser.add_argument('--rate-limited', action='store_true')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeDockerHub(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        rate_limit_max=args.rate_limit_max,
+        rate_limit_remaining=args.rate_limit_remaining,
+        rate_limited=args.rate_limited,
+        failure_rate=args.failure_rate)
+    print(f'Token endpoint:      {server.token_endpoint}')
+    print(f'Rate limit endpoint: {server.rate_limit_endpoint}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,34 @@
 #!/usr/bin/env python3
 
+import functools
+import os
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
 from typing import Optional
+from typing import Union
 from typing_extensions import Annotated
 
 import typer
 
-from .docker_hub_requestor import DockerHubRequestor
-from .http_server import DockerRateLimitHTTPServer
+from .disk_cache import DiskCache
+from .disk_cache import default_cache_path
+from .disk_cache import disk_cache_key
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .endpoints import RATE_LIMIT_ENDPOINT
+from .endpoints import TOKEN_RECEIVE_ENDPOINT
+from .history import DEFAULT_HISTORY_SIZE
 from .output_format import RateLimitOutputFormat
+from .output_format import RateLimitStreamFormat
+from .server_mode import HTTPServerMode
+
 
+# Modules only needed by some commands, e.g. requests, PyYAML, asyncio and
+# the HTTP servers, are imported where they are used, so commands start
+# quickly. The query command is run often and does not need most of them.
 
 app = typer.Typer(
     no_args_is_help=True,
@@ -29,17 +49,93 @@ typer_pass_option = typer.Option(
     User password to use for authentication to Docker Hub''',
     show_default=False)
 
+typer_connect_timeout_option = typer.Option(
+    '--connect-timeout',
+    metavar='SECONDS',
+    min=0,
+    help='''
+    Seconds to wait for a connection to Docker Hub to be established''')
+
+typer_read_timeout_option = typer.Option(
+    '--read-timeout',
+    metavar='SECONDS',
+    min=0,
+    help='''
+    Seconds to wait for Docker Hub to respond''')
+
+typer_token_endpoint_option = typer.Option(
+    '--token-endpoint',
+    metavar='URL',
+    help='''
+    URL of Docker Hub token endpoint''')
+
+typer_rate_limit_endpoint_option = typer.Option(
+    '--rate-limit-endpoint',
+    metavar='URL',
+    help='''
+    URL of manifest whose HEAD response reports the rate limit''')
+
+
 
 @app.command(help='''
 Query Docker Hub for rate limit''')
-# pylint: disable=too-many-arguments
+# pylint: disable=too-many-arguments,too-many-locals
 def query(
         user: Annotated[Optional[str], typer_user_option]=None,
         password: Annotated[Optional[str], typer_pass_option]=None,
         output_format: Annotated[RateLimitOutputFormat, typer.Option(
             '--format', '-f',
             help='''
-            Output format of rate limit information''')]=RateLimitOutputFormat.JSON
+            Output format of rate limit information''')]=RateLimitOutputFormat.JSON,
+        connect_timeout: Annotated[float, typer_connect_timeout_option]=10,
+        read_timeout: Annotated[float, typer_read_timeout_option]=10,
+        token_endpoint: Annotated[str, typer_token_endpoint_option]=TOKEN_RECEIVE_ENDPOINT,
+        rate_limit_endpoint: Annotated[str, typer_rate_limit_endpoint_option]=RATE_LIMIT_ENDPOINT,
+        cache_ttl: Annotated[int, typer.Option(
+            '--cache-ttl', '-t',
+            metavar='TTL',
+            min=0,
+            help='''
+            Cache TTL in seconds. Response by Docker Hub will be cached on
+            disk for this many seconds and shared by all invocations of
+            this command. Concurrent invocations wait for a single request
+            to Docker Hub. Set to 0 to disable the cache.''')]=0,
+        cache_file: Annotated[Optional[str], typer.Option(
+            '--cache-file',
+            metavar='PATH',
+            help='''
+            File to cache response by Docker Hub in. Defaults to
+            query.json in the docker-rate-limit-check directory of the user
+            cache directory ($XDG_CACHE_HOME or ~/.cache).''',
+            show_default=False)]=None,
+        unix_socket: Annotated[Optional[str], typer.Option(
+            '--socket',
+            metavar='PATH',
+            help='''
+            Ask exporter running in HTTP server mode and listening on this
+            Unix domain socket (see --unix-socket of the http command)
+            instead of Docker Hub.''',
+            show_default=False)]=None,
+        watch: Annotated[Optional[float], typer.Option(
+            '--watch',
+            metavar='INTERVAL',
+            min=0.1,
+            help='''
+            Keep running and refresh the rate limit every INTERVAL seconds,
+            writing one line per account and refresh in the format given
+            by --watch-format instead of --format. Connections and tokens
+            are reused between refreshes.''',
+            show_default=False)]=None,
+        watch_format: Annotated[RateLimitStreamFormat, typer.Option(
+            '--watch-format',
+            help='''
+            Format of lines written by --watch: newline-delimited JSON or
+            a compact key=value format.''')]=RateLimitStreamFormat.NDJSON,
+        changes_only: Annotated[bool, typer.Option(
+            '--changes-only',
+            help='''
+            Only write rate limits that differ from the last one written
+            by --watch.''')]=False
     ) -> None:
     """
     Query Docker Hub for rate limit
@@ -47,28 +143,85 @@ def query(
     :param user: User name to use for authentication to Docker Hub
     :param password: User password to use for authentication to Docker Hub
     :param output_format: Output format of rate limit information
+    :param connect_timeout: Seconds to wait for connection to Docker Hub
+    :param read_timeout: Seconds to wait for response by Docker Hub
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of manifest reporting the rate limit
+    :param cache_ttl: For how many seconds to cache response on disk
+    :param cache_file: File to cache response by Docker Hub in
+    :param unix_socket: Unix domain socket of exporter to ask instead
+    :param watch: Seconds between refreshes if running continuously
+    :param watch_format: Format of lines written when running continuously
+    :param changes_only: Whether to only write rate limits that changed
+    :raises BadParameter: If exporter to ask is combined with options
+        only applying to Docker Hub
     """
 
+    # Created once, so every refresh in watch mode reuses its connections
+    # and token
+    @functools.lru_cache(maxsize=None)
+    def create_requestor() -> Callable[[], DockerRateLimit]:
+        # Importing requests is skipped if rate limit is cached on disk
+        # pylint: disable-next=import-outside-toplevel
+        from .docker_hub_requestor import DockerHubRequestor
+
+        docker_hub_requestor = DockerHubRequestor(
+            user=user,
+            password=password,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            token_endpoint=token_endpoint,
+            rate_limit_endpoint=rate_limit_endpoint)
+        return docker_hub_requestor.get_rate_limit
+
+    def request_rate_limit() -> DockerRateLimit:
+        return create_requestor()()
+
     # Get rate limit
-    docker_hub_requestor = DockerHubRequestor(
-        user=user,
-        password=password)
-    rate_limit = docker_hub_requestor.get_rate_limit()
+    get_rate_limit: Callable[[], Union[DockerRateLimit, DockerRateLimitGroup]]
+    if unix_socket is not None:
+        if user is not None or password is not None or cache_ttl > 0:
+            raise typer.BadParameter(
+                '--socket can not be combined with --user/--pass or --cache-ttl')
+
+        # pylint: disable-next=import-outside-toplevel
+        from .exporter_client import request_rate_limit_from_exporter
+        get_rate_limit = functools.partial(
+            request_rate_limit_from_exporter,
+            unix_socket,
+            connect_timeout + read_timeout)
+    elif cache_ttl > 0:
+        disk_cache = DiskCache(
+            path=cache_file if cache_file is not None else default_cache_path(),
+            ttl=cache_ttl)
+        get_rate_limit = functools.partial(
+            disk_cache.get_or_refresh,
+            disk_cache_key(user, rate_limit_endpoint),
+            request_rate_limit)
+    else:
+        get_rate_limit = request_rate_limit
+
+    # Keep writing rate limit until interrupted
+    if watch is not None:
+        # pylint: disable-next=import-outside-toplevel
+        from .query_watch import RateLimitStreamer
+        RateLimitStreamer(get_rate_limit, watch, watch_format, changes_only).run()
+        return
 
     # Output in correct format
-    output = rate_limit.to_output_format(output_format)
+    output = get_rate_limit().to_output_format(output_format)
     print(output)
 
 @app.command(help='''
 Run HTTP server that responds with rate limit''')
-# pylint: disable=too-many-arguments
+# pylint: disable=too-many-arguments,too-many-locals,too-many-statements,too-many-branches
 def http(
-        port: Annotated[int, typer.Option(
+        port: Annotated[Optional[int], typer.Option(
             '--port', '-p',
             metavar='PORT',
             help='''
             Port to listen on''',
-            show_default=False)],
+            show_default=False)]=None,
         host: Annotated[str, typer.Option(
             '--host',
             metavar='HOST',
@@ -87,7 +240,176 @@ def http(
             help='''
             Cache TTL in seconds. Response by Docker Hub will be cached for
             this many seconds. Subsequent requests will only be served the
-            cached result until cache age exceeds given TTL.''')]=30
+            cached result until cache age exceeds given TTL.''')]=30,
+        refresh_ahead: Annotated[int, typer.Option(
+            '--refresh-ahead',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Refresh cached result in the background this many seconds
+            before it expires, so requests never have to wait for
+            Docker Hub. Has to be shorter than --cache-ttl. Set to 0 to
+            only refresh when requested.''')]=0,
+        stale_while_revalidate: Annotated[int, typer.Option(
+            '--stale-while-revalidate',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            For this many seconds after the cache expired respond with the
+            stale result immediately and refresh it in the
+            background.''')]=0,
+        stale_if_error: Annotated[int, typer.Option(
+            '--stale-if-error',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            For this many seconds after the cache expired respond with the
+            stale result if Docker Hub can not be reached.''')]=0,
+        server_mode: Annotated[HTTPServerMode, typer.Option(
+            '--server-mode',
+            help='''
+            How to handle concurrent requests. "single" handles one request
+            at a time, "threaded" starts a new thread for every request and
+            "pool" handles requests using a fixed number of worker
+            threads. "asyncio" handles all requests and all requests to
+            Docker Hub in a single event loop. It does not support proxies
+            (HTTP_PROXY, HTTPS_PROXY) or redirects. "prefork" handles requests
+            in multiple worker processes sharing a single cached result,
+            which is refreshed by the main process.''')]=HTTPServerMode.SINGLE,
+        workers: Annotated[int, typer.Option(
+            '--workers',
+            metavar='WORKERS',
+            min=1,
+            help='''
+            Number of worker threads when using "pool" server mode or
+            number of worker processes when using "prefork" server
+            mode.''')]=8,
+        max_watchers: Annotated[int, typer.Option(
+            '--max-watchers',
+            metavar='CLIENTS',
+            min=1,
+            help='''
+            Maximum number of clients waiting on /watch when using "pool"
+            server mode. Further clients are answered with HTTP-503.''')]=100,
+        keep_alive_timeout: Annotated[float, typer.Option(
+            '--keep-alive-timeout',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Close client connections after being idle for this many
+            seconds. Connections are not kept open in "single" server
+            mode.''')]=15,
+        max_keep_alive_requests: Annotated[int, typer.Option(
+            '--max-keep-alive-requests',
+            metavar='REQUESTS',
+            min=1,
+            help='''
+            Close client connections after answering this many
+            requests.''')]=100,
+        connect_timeout: Annotated[float, typer_connect_timeout_option]=10,
+        read_timeout: Annotated[float, typer_read_timeout_option]=10,
+        token_endpoint: Annotated[str, typer_token_endpoint_option]=TOKEN_RECEIVE_ENDPOINT,
+        rate_limit_endpoint: Annotated[str, typer_rate_limit_endpoint_option]=RATE_LIMIT_ENDPOINT,
+        pool_size: Annotated[int, typer.Option(
+            '--pool-size',
+            metavar='CONNECTIONS',
+            min=1,
+            help='''
+            Maximum number of connections to each Docker Hub host that are
+            kept open for reuse.''')]=10,
+        debug_metrics: Annotated[bool, typer.Option(
+            '--debug-metrics',
+            help='''
+            Expose internal counters, e.g. about cache hits and connection
+            reuse, as JSON on the /debug endpoint.''')]=False,
+        self_metrics: Annotated[bool, typer.Option(
+            '--self-metrics/--no-self-metrics',
+            help='''
+            Append metrics describing the exporter itself (latency of
+            requests to Docker Hub, cache hits, ...) to responses in
+            prometheus format. Not supported in prefork server mode.''')]=True,
+        credentials_file: Annotated[Optional[str], typer.Option(
+            '--credentials-file',
+            metavar='PATH',
+            help='''
+            YAML file listing multiple Docker Hub accounts to monitor
+            instead of a single one given by --user/--pass.''',
+            show_default=False)]=None,
+        max_concurrent_refreshes: Annotated[int, typer.Option(
+            '--max-concurrent-refreshes',
+            metavar='REFRESHES',
+            min=1,
+            help='''
+            Maximum number of accounts from credentials file that are
+            refreshed at the same time.''')]=8,
+        history_size: Annotated[int, typer.Option(
+            '--history-size',
+            metavar='SAMPLES',
+            min=1,
+            help='''
+            Number of refreshed results kept per account for the /history
+            endpoint, which also reports the recent consumption rate and
+            when the rate limit will be exhausted at that rate.''')]=DEFAULT_HISTORY_SIZE,
+        adaptive_refresh: Annotated[bool, typer.Option(
+            '--adaptive-refresh',
+            help='''
+            Choose the cache TTL after every refresh instead of using
+            --cache-ttl: refresh rarely while many pulls remain and often
+            while the remaining pulls run low or are consumed quickly.
+            --cache-ttl is used until the first refresh.''')]=False,
+        min_refresh_interval: Annotated[int, typer.Option(
+            '--min-refresh-interval',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Shortest cache TTL chosen by --adaptive-refresh.''')]=10,
+        max_refresh_interval: Annotated[int, typer.Option(
+            '--max-refresh-interval',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Longest cache TTL chosen by --adaptive-refresh.''')]=600,
+        failure_threshold: Annotated[int, typer.Option(
+            '--failure-threshold',
+            metavar='FAILURES',
+            min=0,
+            help='''
+            Stop querying Docker Hub for a while after this many consecutive
+            failed refreshes and answer with the last known result instead.
+            The pause doubles (with jitter) while Docker Hub keeps failing.
+            A Retry-After header sent by Docker Hub is always honored.
+            Set to 0 to keep querying.''')]=3,
+        max_backoff: Annotated[float, typer.Option(
+            '--max-backoff',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Longest pause in querying Docker Hub after failed
+            refreshes.''')]=300,
+        unix_socket: Annotated[Optional[str], typer.Option(
+            '--unix-socket',
+            metavar='PATH',
+            help='''
+            Unix domain socket to listen on, e.g. for sidecar containers
+            sharing a volume. Can be combined with --port to listen on
+            both.''',
+            show_default=False)]=None,
+        unix_socket_mode: Annotated[str, typer.Option(
+            '--unix-socket-mode',
+            metavar='MODE',
+            help='''
+            Permissions of Unix domain socket as octal number''')]='660',
+        compression: Annotated[bool, typer.Option(
+            '--compression/--no-compression',
+            help='''
+            Compress responses with gzip or deflate if the client accepts
+            it (Accept-Encoding request header).''')]=True,
+        compression_min_size: Annotated[int, typer.Option(
+            '--compression-min-size',
+            metavar='BYTES',
+            min=0,
+            help='''
+            Only compress responses of at least this size.''')]=1024
     ) -> None:
     """
     Run http server to abstract calls to Docker Hub
@@ -98,20 +420,547 @@ def http(
     :param password: User password to use for authentication to Docker Hub
     :param output_format: Default output format if not specified in request
     :param cache_ttl: For how many seconds to cache response by Docker Hub
+    :param refresh_ahead: Seconds before cache expiry to refresh in background
+    :param stale_while_revalidate: Seconds to serve stale cache while refreshing
+    :param stale_if_error: Seconds to serve stale cache if refreshing failed
+    :param server_mode: Concurrency model of the HTTP server
+    :param workers: Number of worker threads or processes
+    :param max_watchers: Clients waiting on /watch in "pool" server mode
+    :param keep_alive_timeout: Seconds to keep idle client connections open
+    :param max_keep_alive_requests: Requests to answer per client connection
+    :param connect_timeout: Seconds to wait for connection to Docker Hub
+    :param read_timeout: Seconds to wait for response by Docker Hub
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of manifest reporting the rate limit
+    :param pool_size: Connections per Docker Hub host to keep open
+    :param debug_metrics: Whether to expose internal counters on /debug
+    :param self_metrics: Whether to expose metrics of exporter on /metrics
+    :param credentials_file: File listing multiple accounts to monitor
+    :param max_concurrent_refreshes: Accounts to refresh at the same time
+    :param history_size: Refreshed results to keep per account for /history
+    :param adaptive_refresh: Whether to choose cache TTL after every refresh
+    :param min_refresh_interval: Shortest cache TTL in adaptive refresh mode
+    :param max_refresh_interval: Longest cache TTL in adaptive refresh mode
+    :param failure_threshold: Failed refreshes after which to pause querying
+    :param max_backoff: Longest pause in querying Docker Hub after failures
+    :param unix_socket: Path of Unix domain socket to listen on
+    :param unix_socket_mode: Permissions of Unix domain socket in octal
+    :param compression: Whether to compress responses if clients accept it
+    :param compression_min_size: Size in bytes of smallest body to compress
+    :raises BadParameter: If neither port nor Unix domain socket is given,
+        both credentials file and user are given, "prefork" server mode is
+        not supported on this platform, "asyncio" server mode would have to
+        use a proxy, adaptive refresh is configured incorrectly or refresh
+        ahead is not shorter than the cache TTL
     """
 
-    docker_hub_requestor = DockerHubRequestor(
-        user=user,
-        password=password,
-        cache_ttl=cache_ttl)
+    # Engines of other server modes are not imported
+    # pylint: disable=import-outside-toplevel
+    from .account_pool import load_credentials_file
+    from .adaptive_refresh import AdaptiveRefreshPolicy
+
+    # Listen on port, Unix domain socket or both
+    listeners: List[Dict[str, Any]] = []
+    if port is not None:
+        listeners.append({'host': host, 'port': port})
+    if unix_socket is not None:
+        try:
+            mode = int(unix_socket_mode, 8)
+        except ValueError as err:
+            raise typer.BadParameter(
+                f'--unix-socket-mode "{unix_socket_mode}" is not an octal number') from err
+        listeners.append({'port': 0, 'unix_socket': unix_socket, 'unix_socket_mode': mode})
+    if not listeners:
+        raise typer.BadParameter('Either --port or --unix-socket has to be given')
+
+    if server_mode == HTTPServerMode.PREFORK and not hasattr(os, 'fork'):
+        raise typer.BadParameter(
+            '"prefork" server mode is not supported on this platform')
+
+    refresh_policy = None
+    if adaptive_refresh:
+        if server_mode == HTTPServerMode.PREFORK:
+            raise typer.BadParameter(
+                '--adaptive-refresh is not supported in "prefork" server mode')
+        try:
+            refresh_policy = AdaptiveRefreshPolicy(min_refresh_interval, max_refresh_interval)
+        except ValueError as err:
+            raise typer.BadParameter(str(err)) from err
+
+    # Refreshing ahead by at least the TTL would query Docker Hub continuously
+    if refresh_ahead > 0:
+        shortest_ttl = min(cache_ttl, min_refresh_interval) if adaptive_refresh else cache_ttl
+        if refresh_ahead >= shortest_ttl:
+            raise typer.BadParameter(
+                f'--refresh-ahead has to be shorter than the cache TTL ({shortest_ttl} seconds)')
+
+    accounts = None
+    if credentials_file is not None:
+        if user is not None or password is not None:
+            raise typer.BadParameter(
+                '--credentials-file can not be combined with --user/--pass')
+
+        try:
+            accounts = load_credentials_file(credentials_file)
+        except (OSError, ValueError) as err:
+            raise typer.BadParameter(str(err)) from err
+
+    # Serve all requests from a single event loop
+    if server_mode == HTTPServerMode.ASYNCIO:
+        import asyncio
+
+        from .async_http_client import AsyncHTTPClient
+        from .async_http_client import proxy_for_url
+        from .async_http_server import AsyncDockerRateLimitHTTPServer
+        from .async_http_server import AsyncRateLimitRequestor
+        from .async_requestor import AsyncDockerHubAccountPool
+        from .async_requestor import AsyncDockerHubRequestor
 
-    # Start server
-    server = DockerRateLimitHTTPServer(
-            host=host,
-            port=port,
+        # Fail instead of bypassing a proxy that has to be used
+        for endpoint in (token_endpoint, rate_limit_endpoint):
+            if proxy_for_url(endpoint) is not None:
+                raise typer.BadParameter(
+                    f'"asyncio" server mode does not support proxies, but "{endpoint}" '
+                    'has to be requested through a proxy. Use another server mode or '
+                    'exclude Docker Hub with NO_PROXY.')
+
+        async_requestor: AsyncRateLimitRequestor
+        client = AsyncHTTPClient(
+            pool_size=max(pool_size, max_concurrent_refreshes),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout)
+        if accounts is not None:
+            async_requestor = AsyncDockerHubAccountPool(
+                accounts=accounts,
+                cache_ttl=cache_ttl,
+                max_concurrency=max_concurrent_refreshes,
+                stale_while_revalidate=stale_while_revalidate,
+                stale_if_error=stale_if_error,
+                client=client,
+                token_endpoint=token_endpoint,
+                rate_limit_endpoint=rate_limit_endpoint,
+                history_size=history_size,
+                adaptive_refresh=refresh_policy,
+                failure_threshold=failure_threshold,
+                max_backoff=max_backoff)
+        else:
+            async_requestor = AsyncDockerHubRequestor(
+                user=user,
+                password=password,
+                cache_ttl=cache_ttl,
+                stale_while_revalidate=stale_while_revalidate,
+                stale_if_error=stale_if_error,
+                client=client,
+                token_endpoint=token_endpoint,
+                rate_limit_endpoint=rate_limit_endpoint,
+                history_size=history_size,
+                adaptive_refresh=refresh_policy,
+                failure_threshold=failure_threshold,
+                max_backoff=max_backoff)
+
+        # All listeners share the requestor, refresh it in one of them
+        async_servers = [
+            AsyncDockerRateLimitHTTPServer(
+                default_format=output_format,
+                docker_hub_requestor=async_requestor,
+                debug_metrics=debug_metrics,
+                refresh_ahead=refresh_ahead if index == 0 else 0,
+                keep_alive_timeout=keep_alive_timeout,
+                max_keep_alive_requests=max_keep_alive_requests,
+                self_metrics=self_metrics,
+                compression_min_size=compression_min_size if compression else None,
+                **listener)
+            for index, listener in enumerate(listeners)]
+
+        async def serve_all() -> None:
+            await asyncio.gather(*(
+                async_server.serve_forever() for async_server in async_servers))
+
+        asyncio.run(serve_all())
+        return
+
+    from .account_pool import DockerHubAccountPool
+    from .docker_hub_requestor import DockerHubRequestor
+    from .docker_hub_requestor import create_session
+    from .http_server import RateLimitRequestor
+    from .http_server import create_http_server
+
+    # In pre-fork mode the result is cached in memory shared by the worker
+    # processes, the main process queries Docker Hub whenever asked to
+    prefork = server_mode == HTTPServerMode.PREFORK
+
+    docker_hub_requestor: RateLimitRequestor
+    if accounts is not None:
+        docker_hub_requestor = DockerHubAccountPool(
+            accounts=accounts,
+            cache_ttl=0 if prefork else cache_ttl,
+            max_concurrency=max_concurrent_refreshes,
+            stale_while_revalidate=0 if prefork else stale_while_revalidate,
+            stale_if_error=0 if prefork else stale_if_error,
+            session=create_session(max(pool_size, max_concurrent_refreshes)),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            token_endpoint=token_endpoint,
+            rate_limit_endpoint=rate_limit_endpoint,
+            history_size=history_size,
+            adaptive_refresh=refresh_policy,
+            failure_threshold=failure_threshold,
+            max_backoff=max_backoff)
+        requestors = list(docker_hub_requestor.requestors.values())
+        executor = docker_hub_requestor.executor
+    else:
+        docker_hub_requestor = DockerHubRequestor(
+            user=user,
+            password=password,
+            cache_ttl=0 if prefork else cache_ttl,
+            stale_while_revalidate=0 if prefork else stale_while_revalidate,
+            stale_if_error=0 if prefork else stale_if_error,
+            session=create_session(pool_size),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            token_endpoint=token_endpoint,
+            rate_limit_endpoint=rate_limit_endpoint,
+            history_size=history_size,
+            adaptive_refresh=refresh_policy,
+            failure_threshold=failure_threshold,
+            max_backoff=max_backoff)
+        requestors = [docker_hub_requestor]
+        executor = None
+
+    if prefork:
+        from .prefork_server import PreforkServer
+        from .prefork_server import SharedCacheRefresher
+        from .shared_cache import SharedCacheRequestor
+        from .shared_cache import SharedRateLimitCache
+
+        shared_cache = SharedRateLimitCache()
+        shared_cache_requestor = SharedCacheRequestor(
+            shared_cache,
+            cache_ttl=cache_ttl,
+            stale_while_revalidate=stale_while_revalidate,
+            stale_if_error=stale_if_error,
+            # Refresh might need a token and a retry
+            refresh_timeout=3 * (connect_timeout + read_timeout))
+        prefork_servers = [
+            create_http_server(
+                default_format=output_format,
+                docker_hub_requestor=shared_cache_requestor,
+                mode=server_mode,
+                debug_metrics=debug_metrics,
+                keep_alive_timeout=keep_alive_timeout,
+                max_keep_alive_requests=max_keep_alive_requests,
+                # Metrics of the exporter are kept per process, workers
+                # would only report about themselves
+                self_metrics=False,
+                compression_min_size=compression_min_size if compression else None,
+                **listener)
+            for listener in listeners]
+        prefork_server = PreforkServer(
+            server=prefork_servers[0],
+            refresher=SharedCacheRefresher(
+                requestor=docker_hub_requestor,
+                shared_cache=shared_cache,
+                cache_ttl=cache_ttl,
+                refresh_ahead=refresh_ahead),
+            processes=workers,
+            additional_servers=prefork_servers[1:])
+        try:
+            prefork_server.serve_forever()
+        finally:
+            for server in prefork_servers:
+                server.server_close()
+        return
+
+    import threading
+
+    from .background_refresher import BackgroundRefresher
+
+    # Keep cache fresh in background
+    if refresh_ahead > 0:
+        refresher = BackgroundRefresher(
+            requestors=requestors,
+            refresh_ahead=refresh_ahead,
+            executor=executor)
+        refresher.start()
+
+    # Start servers, all but the last one in background threads
+    servers = [
+        create_http_server(
             default_format=output_format,
-            docker_hub_requestor=docker_hub_requestor)
-    server.serve_forever()
+            docker_hub_requestor=docker_hub_requestor,
+            mode=server_mode,
+            workers=workers,
+            max_watchers=max_watchers,
+            debug_metrics=debug_metrics,
+            keep_alive_timeout=keep_alive_timeout,
+            max_keep_alive_requests=max_keep_alive_requests,
+            self_metrics=self_metrics,
+            compression_min_size=compression_min_size if compression else None,
+            **listener)
+        for listener in listeners]
+    for server in servers[:-1]:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        servers[-1].serve_forever()
+    finally:
+        for server in servers:
+            server.server_close()
+
+@app.command(help='''
+Periodically push rate limit to Pushgateway, StatsD or remote-write endpoint''')
+# pylint: disable=too-many-arguments,too-many-locals
+def push(
+        user: Annotated[Optional[str], typer_user_option]=None,
+        password: Annotated[Optional[str], typer_pass_option]=None,
+        credentials_file: Annotated[Optional[str], typer.Option(
+            '--credentials-file',
+            metavar='PATH',
+            help='''
+            YAML file listing multiple Docker Hub accounts to monitor
+            instead of a single one given by --user/--pass.''',
+            show_default=False)]=None,
+        interval: Annotated[float, typer.Option(
+            '--interval', '-i',
+            metavar='SECONDS',
+            min=1,
+            help='''
+            Seconds between refreshes of the rate limit. It is only pushed
+            if it changed.''')]=30,
+        pushgateway: Annotated[Optional[str], typer.Option(
+            '--pushgateway',
+            metavar='URL',
+            help='''
+            Base URL of Prometheus Pushgateway to push to''',
+            show_default=False)]=None,
+        pushgateway_job: Annotated[str, typer.Option(
+            '--pushgateway-job',
+            metavar='JOB',
+            help='''
+            Job name to push metrics to the Pushgateway under''')]='docker_rate_limit_check',
+        statsd: Annotated[Optional[str], typer.Option(
+            '--statsd',
+            metavar='HOST[:PORT]',
+            help='''
+            StatsD server to send gauges to over UDP. Labels are sent as
+            DogStatsD tags.''',
+            show_default=False)]=None,
+        statsd_prefix: Annotated[str, typer.Option(
+            '--statsd-prefix',
+            metavar='PREFIX',
+            help='''
+            Prefix of StatsD metric names''')]='',
+        remote_write: Annotated[Optional[str], typer.Option(
+            '--remote-write',
+            metavar='URL',
+            help='''
+            URL of Prometheus remote-write endpoint to push to''',
+            show_default=False)]=None,
+        remote_write_batch_size: Annotated[int, typer.Option(
+            '--remote-write-batch-size',
+            metavar='SAMPLES',
+            min=1,
+            help='''
+            Maximum number of samples per remote-write request. Samples
+            that could not be sent are sent with the next ones.''')]=500,
+        connect_timeout: Annotated[float, typer_connect_timeout_option]=10,
+        read_timeout: Annotated[float, typer_read_timeout_option]=10,
+        token_endpoint: Annotated[str, typer_token_endpoint_option]=TOKEN_RECEIVE_ENDPOINT,
+        rate_limit_endpoint: Annotated[str, typer_rate_limit_endpoint_option]=RATE_LIMIT_ENDPOINT,
+        failure_threshold: Annotated[int, typer.Option(
+            '--failure-threshold',
+            metavar='FAILURES',
+            min=0,
+            help='''
+            Stop querying Docker Hub for a while after this many consecutive
+            failed refreshes. Set to 0 to keep querying.''')]=3,
+        max_backoff: Annotated[float, typer.Option(
+            '--max-backoff',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Longest pause in querying Docker Hub after failed
+            refreshes.''')]=300
+    ) -> None:
+    """
+    Refresh rate limit periodically and push it wherever it changed
+
+    :param user: User name to use for authentication to Docker Hub
+    :param password: User password to use for authentication to Docker Hub
+    :param credentials_file: File listing multiple accounts to monitor
+    :param interval: Seconds between refreshes
+    :param pushgateway: Base URL of Prometheus Pushgateway
+    :param pushgateway_job: Job name to push metrics under
+    :param statsd: Host and port of StatsD server
+    :param statsd_prefix: Prefix of StatsD metric names
+    :param remote_write: URL of Prometheus remote-write endpoint
+    :param remote_write_batch_size: Samples per remote-write request
+    :param connect_timeout: Seconds to wait for connection to Docker Hub
+    :param read_timeout: Seconds to wait for response by Docker Hub
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of manifest reporting the rate limit
+    :param failure_threshold: Failed refreshes after which to pause querying
+    :param max_backoff: Longest pause in querying Docker Hub after failures
+    :raises BadParameter: If no destination is given, the StatsD server is
+        malformed or both credentials file and user are given
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from .account_pool import DockerHubAccountPool
+    from .account_pool import load_credentials_file
+    from .docker_hub_requestor import DockerHubRequestor
+    from .docker_hub_requestor import create_session
+    from .push import Pusher
+    from .push import PushgatewaySink
+    from .push import PushSink
+    from .push import RemoteWriteSink
+    from .push import StatsDSink
+
+    # Connections to Pushgateway and remote-write endpoint are kept open
+    push_session = create_session(pool_size=1)
+    timeout = (connect_timeout, read_timeout)
+
+    sinks: List[PushSink] = []
+    if pushgateway is not None:
+        sinks.append(PushgatewaySink(pushgateway, push_session, pushgateway_job, timeout))
+    if statsd is not None:
+        host, _, port = statsd.rpartition(':') if ':' in statsd else (statsd, '', '8125')
+        if not port.isdigit():
+            raise typer.BadParameter(f'Invalid StatsD server "{statsd}"')
+        sinks.append(StatsDSink(host.strip('[]'), int(port), statsd_prefix))
+    if remote_write is not None:
+        sinks.append(RemoteWriteSink(
+            remote_write,
+            push_session,
+            batch_size=remote_write_batch_size,
+            timeout=timeout))
+    if len(sinks) == 0:
+        raise typer.BadParameter(
+            'At least one of --pushgateway, --statsd or --remote-write is required')
+
+    docker_hub_requestor: Union[DockerHubRequestor, DockerHubAccountPool]
+    if credentials_file is not None:
+        if user is not None or password is not None:
+            raise typer.BadParameter(
+                '--credentials-file can not be combined with --user/--pass')
+        try:
+            accounts = load_credentials_file(credentials_file)
+        except (OSError, ValueError) as err:
+            raise typer.BadParameter(str(err)) from err
+        docker_hub_requestor = DockerHubAccountPool(
+            accounts=accounts,
+            cache_ttl=0,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            token_endpoint=token_endpoint,
+            rate_limit_endpoint=rate_limit_endpoint,
+            failure_threshold=failure_threshold,
+            max_backoff=max_backoff)
+    else:
+        docker_hub_requestor = DockerHubRequestor(
+            user=user,
+            password=password,
+            cache_ttl=0,
+            session=create_session(),
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            token_endpoint=token_endpoint,
+            rate_limit_endpoint=rate_limit_endpoint,
+            failure_threshold=failure_threshold,
+            max_backoff=max_backoff)
+
+    # Every refresh queries Docker Hub, unless it keeps failing
+    Pusher(docker_hub_requestor, sinks, interval).run()
+
+@app.command(help='''
+Load-test a running exporter and report throughput and latency as JSON''')
+# pylint: disable=too-many-arguments
+def bench(
+        url: Annotated[str, typer.Option(
+            '--url',
+            metavar='URL',
+            help='''
+            Base URL of exporter running in HTTP server mode''')]='http://127.0.0.1:8080',
+        unix_socket: Annotated[Optional[str], typer.Option(
+            '--socket',
+            metavar='PATH',
+            help='''
+            Connect to exporter listening on this Unix domain socket
+            instead of host and port of --url.''',
+            show_default=False)]=None,
+        concurrency: Annotated[int, typer.Option(
+            '--concurrency', '-c',
+            metavar='CLIENTS',
+            min=1,
+            help='''
+            Number of clients sending requests at the same time''')]=8,
+        duration: Annotated[float, typer.Option(
+            '--duration', '-d',
+            metavar='SECONDS',
+            min=0.1,
+            help='''
+            Number of seconds to send requests for''')]=10,
+        keep_alive: Annotated[bool, typer.Option(
+            '--keep-alive/--no-keep-alive',
+            help='''
+            Whether clients reuse their connection or open a new one for
+            every request.''')]=True,
+        paths: Annotated[Optional[List[str]], typer.Option(
+            '--path',
+            metavar='PATH',
+            help='''
+            Path to request, e.g. "/metrics" or "/?format=yaml". Repeat to
+            request multiple paths in turn. Defaults to "/", "/metrics"
+            and "/" in every output format.''',
+            show_default=False)]=None,
+        accept_encoding: Annotated[Optional[str], typer.Option(
+            '--accept-encoding',
+            metavar='ENCODINGS',
+            help='''
+            Value of Accept-Encoding header to send, e.g. "gzip"''',
+            show_default=False)]=None,
+        timeout: Annotated[float, typer.Option(
+            '--timeout',
+            metavar='SECONDS',
+            min=0,
+            help='''
+            Seconds to wait for connection and response''')]=10
+    ) -> None:
+    """
+    Send requests to running exporter and print number of requests,
+    requests per second, latency percentiles, errors and bytes received
+    as JSON
+
+    :param url: Base URL of exporter
+    :param unix_socket: Unix domain socket of exporter to connect to instead
+    :param concurrency: Number of concurrent clients
+    :param duration: Seconds to send requests for
+    :param keep_alive: Whether clients reuse their connection
+    :param paths: Paths to request in turn
+    :param accept_encoding: Value of Accept-Encoding header to send
+    :param timeout: Seconds to wait for connection and response
+    :raises BadParameter: If URL is not a http or https URL
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import json
+
+    from .load_test import LoadTest
+    from .load_test import default_request_mix
+
+    try:
+        load_test = LoadTest(
+            url=url,
+            paths=paths if paths else default_request_mix(),
+            concurrency=concurrency,
+            duration=duration,
+            keep_alive=keep_alive,
+            timeout=timeout,
+            unix_socket=unix_socket,
+            headers={'Accept-Encoding': accept_encoding} if accept_encoding is not None else None)
+    except ValueError as err:
+        raise typer.BadParameter(str(err)) from err
+
+    print(json.dumps(load_test.run(), indent=4))
 
 def main() -> None:
     """Main application entry point"""
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+import sys
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Union
+
+from requests.exceptions import RequestException
+
+from .docker_hub_requestor import DockerHubRequestor
+from .docker_hub_requestor import DockerHubRequestorBase
+from .docker_hub_requestor import create_session
+from .docker_hub_requestor import oldest_cache_age
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .history import RateLimitHistory
+from .instrumentation import EXPORTER_METRICS
+from .single_flight import SingleFlight
+from .token_cache import TokenCache
+
+
+# Name of account without credentials
+ANONYMOUS_ACCOUNT = 'anonymous'
+
+# Debug metrics counted by every account on its own, the remaining ones
+# describe the token cache and connections shared by all accounts
+PER_ACCOUNT_DEBUG_METRICS = (
+    'circuit_breaker_failures',
+    'circuit_breaker_rejected',
+    'coalesced_refreshes',
+)
+
+
+@dataclass
+class DockerHubAccount:
+    """Credentials of a Docker Hub account to monitor"""
+
+    name: str
+    user: Optional[str]=None
+    password: Optional[str]=None
+
+
+def load_credentials_file(path: str) -> List[DockerHubAccount]:
+    """
+    Load accounts from YAML (or JSON) file of the following format:
+
+    .. code-block:: yaml
+
+        accounts:
+          - name: team-a
+            user: alice
+            password: secret
+          - name: anonymous
+
+    If name is omitted the user name (or "anonymous") is used.
+
+    :param path: Path of credentials file
+    :raises ValueError: If file is malformed
+    :return: Accounts listed in file
+    """
+
+    import yaml  # pylint: disable=import-outside-toplevel
+
+    with open(path, encoding='utf-8') as file:
+        content = yaml.safe_load(file)
+
+    if not isinstance(content, dict) or not isinstance(content.get('accounts'), list):
+        raise ValueError(f'Credentials file "{path}" does not contain a list of "accounts"')
+
+    accounts = []
+    names = set()
+    for entry in content['accounts']:
+        if not isinstance(entry, dict):
+            raise ValueError(f'Credentials file "{path}" contains malformed account {entry!r}')
+
+        user = entry.get('user')
+        password = entry.get('password')
+        name = entry.get('name', user if user is not None else ANONYMOUS_ACCOUNT)
+        for key, value in (('name', name), ('user', user), ('password', password)):
+            if value is not None and not isinstance(value, str):
+                raise ValueError(
+                    f'Credentials file "{path}": "{key}" of account {name!r} is not a string')
+        if (user is None) != (password is None):
+            raise ValueError(
+                f'Credentials file "{path}": account "{name}" needs both user and password')
+        if name in names:
+            raise ValueError(f'Credentials file "{path}": account "{name}" is listed twice')
+
+        names.add(name)
+        accounts.append(DockerHubAccount(name=name, user=user, password=password))
+
+    if len(accounts) == 0:
+        raise ValueError(f'Credentials file "{path}" does not list any accounts')
+
+    return accounts
+
+
+def account_refresh_failed(name: str, err: Exception) -> None:
+    """
+    Report that the rate limit of an account could not be refreshed
+
+    :param name: Name of account
+    :param err: Error that occurred while refreshing
+    """
+
+    print(f'Error: Could not get rate limit of account "{name}": {err}', file=sys.stderr)
+    EXPORTER_METRICS.account_refresh_errors.inc(name)
+
+
+def check_any_account_refreshed(
+        rate_limits: Dict[str, DockerRateLimit],
+        errors: List[Exception]) -> None:
+    """
+    Check that the rate limit of at least one account could be refreshed,
+    an empty group of rate limits would hide that Docker Hub is failing.
+
+    :param rate_limits: Rate limits of accounts that could be refreshed
+    :param errors: Errors of accounts that could not be refreshed
+    :raises RequestException: If no account could be refreshed
+    """
+
+    if len(rate_limits) == 0 and len(errors) > 0:
+        raise RequestException(
+            f'Could not get rate limit of any of {len(errors)} accounts: {errors[0]}')
+
+
+def reuse_group(
+        group: Optional[DockerRateLimitGroup],
+        rate_limits: Dict[str, DockerRateLimit]) -> DockerRateLimitGroup:
+    """
+    Return previously handed out group as long as no account has been
+    refreshed, so responses rendered from it can be reused
+
+    :param group: Group handed out previously, None if there is none
+    :param rate_limits: Current rate limits of accounts
+    :return: Group of current rate limits
+    """
+
+    if group is None or not group.consists_of(rate_limits):
+        group = DockerRateLimitGroup(rate_limits=rate_limits)
+    return group
+
+
+def pool_debug_metrics(requestors: Iterable[DockerHubRequestorBase]) -> Dict[str, int]:
+    """
+    Return internal counters of a pool of accounts, summing up the
+    counters of every account and reporting shared ones once
+
+    :param requestors: Requestors of all accounts of the pool
+    :return: Dictionary mapping metric name to value
+    """
+
+    metrics: Dict[str, int] = {}
+    accounts = 0
+    for requestor in requestors:
+        requestor_metrics = requestor.debug_metrics()
+        if accounts == 0:
+            metrics.update(requestor_metrics)
+        else:
+            for name in PER_ACCOUNT_DEBUG_METRICS:
+                metrics[name] += requestor_metrics[name]
+        accounts += 1
+    metrics['accounts'] = accounts
+    return metrics
+
+
+class DockerHubAccountPool:
+    """
+    Queries Docker Hub for the current rate limit of many accounts.
+    Every account has its own cache and in-flight refresh, while
+    connections and tokens are shared between all accounts.
+
+    :param accounts: Accounts to query rate limit for
+    :param cache_ttl: Number of seconds information should be cached
+        before querying Docker Hub for fresh information.
+    :param max_concurrency: Maximum number of accounts refreshed at the
+        same time
+    :param **kwargs: Additional arguments for every
+        :class:`DockerHubRequestor`
+    """
+
+    def __init__(
+            self,
+            accounts: List[DockerHubAccount],
+            cache_ttl: int=0,
+            max_concurrency: int=8,
+            **kwargs: Any) -> None:
+
+        if 'session' not in kwargs:
+            kwargs['session'] = create_session(max_concurrency)
+        token_cache = TokenCache()
+
+        # Runs refreshes of stale accounts including background refreshes,
+        # so no more than max_concurrency accounts query Docker Hub at once
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='account-refresh')
+
+        self.requestors: Dict[str, DockerHubRequestor] = {
+            account.name: DockerHubRequestor(
+                user=account.user,
+                password=account.password,
+                cache_ttl=cache_ttl,
+                single_flight=SingleFlight(),
+                token_cache=token_cache,
+                executor=self.executor,
+                **kwargs)
+            for account in accounts
+        }
+
+        self._group: Optional[DockerRateLimitGroup] = None
+
+        self.cache_ttl = cache_ttl
+        self.stale_while_revalidate = kwargs.get('stale_while_revalidate', 0)
+        self.stale_if_error = kwargs.get('stale_if_error', 0)
+
+    def get_rate_limit(self, allow_stale: bool=True) -> DockerRateLimitGroup:
+        """
+        Returns information about Docker Hub rate limiting of all accounts.
+        Accounts whose cache is stale are refreshed concurrently.
+        Accounts that could not be refreshed are left out, if no account
+        could be refreshed RequestException is raised.
+
+        :param allow_stale: Whether cached information of an account may be
+            returned if refreshing it failed
+        :return: Information about rate limit of all accounts
+        """
+
+        # Only hand over accounts that need to be refreshed to the executor
+        results: Dict[str, Union[DockerRateLimit, 'Future[DockerRateLimit]']] = {}  # noqa: UP037
+        for name, requestor in self.requestors.items():
+            if requestor.cache_age <= requestor.cache_ttl:
+                results[name] = requestor.get_rate_limit(allow_stale)
+            else:
+                results[name] = self.executor.submit(requestor.get_rate_limit, allow_stale)
+
+        rate_limits = {}
+        errors: List[Exception] = []
+        for name, result in results.items():
+            try:
+                if isinstance(result, Future):
+                    result = result.result()
+                rate_limits[name] = result
+            except (RequestException, KeyError, ValueError) as err:
+                account_refresh_failed(name, err)
+                errors.append(err)
+        check_any_account_refreshed(rate_limits, errors)
+
+        group = reuse_group(self._group, rate_limits)
+        self._group = group
+        return group
+
+    @property
+    def cache_age(self) -> float:
+        """
+        Number of seconds since information of the least recently
+        refreshed account was refreshed
+
+        :return: Age of oldest cached information in seconds
+        """
+
+        return oldest_cache_age(self.requestors.values())
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters useful for debugging the behavior of
+        caches and connections of all accounts.
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        return pool_debug_metrics(self.requestors.values())
+
+    @property
+    def history(self) -> Dict[str, RateLimitHistory]:
+        """
+        History of refreshed rate limits of every account
+
+        :return: Dictionary mapping account name to its history
+        """
+
+        return {name: requestor.history for name, requestor in self.requestors.items()}
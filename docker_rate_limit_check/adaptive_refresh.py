@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+from typing import Optional
+
+from .docker_rate_limit import DockerRateLimit
+
+
+# Number of refreshes that should happen before the rate limit is
+# projected to be exhausted at the current consumption rate
+REFRESHES_BEFORE_EXHAUSTION = 10
+
+
+class AdaptiveRefreshPolicy:  # pylint: disable=too-few-public-methods
+    """
+    Chooses how long a rate limit is cached based on how much of it is
+    left. A comfortable budget is refreshed rarely, while a budget that is
+    running low (or is consumed quickly) is refreshed often, so the time
+    it is exhausted is noticed quickly.
+
+    :param min_interval: Minimum number of seconds between refreshes
+    :param max_interval: Maximum number of seconds between refreshes
+    :param refreshes_before_exhaustion: Number of refreshes that should
+        happen before the rate limit is projected to be exhausted
+    :raises ValueError: If interval bounds are invalid
+    """
+
+    def __init__(
+            self,
+            min_interval: int,
+            max_interval: int,
+            refreshes_before_exhaustion: int=REFRESHES_BEFORE_EXHAUSTION) -> None:
+
+        if min_interval < 0 or max_interval < min_interval:
+            raise ValueError(
+                f'Invalid refresh interval bounds {min_interval} to {max_interval}')
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.refreshes_before_exhaustion = max(1, refreshes_before_exhaustion)
+
+    def next_interval(
+            self,
+            rate_limit: DockerRateLimit,
+            consumption_rate: Optional[float]) -> int:
+        """
+        Choose number of seconds until rate limit has to be refreshed
+
+        :param rate_limit: Rate limit that has just been refreshed
+        :param consumption_rate: Pulls consumed per second recently, None
+            if not known yet
+        :return: Number of seconds to cache rate limit for
+        """
+
+        remaining = rate_limit.rate_limit_remaining
+        maximum = rate_limit.rate_limit_max
+
+        if maximum <= 0 or remaining <= 0:
+            # Pulls are given back one by one over the window, check
+            # about as often as one is given back
+            if rate_limit.rate_limit_window is not None and maximum > 0:
+                interval = rate_limit.rate_limit_window / maximum
+            else:
+                interval = self.min_interval
+        else:
+            # Scale interval with remaining budget ...
+            budget = min(1.0, remaining / maximum)
+            interval = self.min_interval + (self.max_interval - self.min_interval) * budget
+
+            # ... but refresh multiple times before it is used up
+            if consumption_rate is not None and consumption_rate > 0:
+                interval = min(
+                    interval,
+                    remaining / consumption_rate / self.refreshes_before_exhaustion)
+
+            # Pulls used now are given back after the window at the latest
+            if rate_limit.rate_limit_window is not None:
+                interval = min(interval, rate_limit.rate_limit_window)
+
+        return int(min(self.max_interval, max(self.min_interval, interval)))
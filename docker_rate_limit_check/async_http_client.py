@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+import asyncio
+import base64
+import json
+import ssl
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+from urllib.request import getproxies
+from urllib.request import proxy_bypass
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import RequestException
+from requests.exceptions import Timeout
+
+
+# Connection is identified by scheme, host and port
+ConnectionKey = Tuple[str, str, int]
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+# Status codes of responses that never have a body
+STATUS_WITHOUT_BODY = {204, 304}
+
+# Maximum number of header lines accepted in a message
+MAX_HEADERS = 100
+
+
+async def read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    """
+    Read header lines of HTTP message up to and including the empty line
+    terminating them.
+
+    :param reader: Stream to read headers from
+    :raises ValueError: If there are too many header lines
+    :return: Headers with lower case names
+    """
+
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADERS):
+        line = (await reader.readline()).decode('latin-1').rstrip('\r\n')
+        if line == '':
+            return headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    raise ValueError('Too many header lines')
+
+
+def proxy_for_url(url: str) -> Optional[str]:
+    """
+    Return proxy that requests to URL have to be sent through according to
+    the HTTP_PROXY, HTTPS_PROXY and NO_PROXY environment variables.
+    :class:`AsyncHTTPClient` does not support proxies.
+
+    :param url: URL requests are sent to
+    :return: URL of proxy or None if requests are sent directly
+    """
+
+    parts = urlsplit(url)
+    proxy = getproxies().get(parts.scheme)
+    if proxy is None or parts.hostname is None or proxy_bypass(parts.hostname):
+        return None
+    return proxy
+
+
+@dataclass
+class AsyncHTTPResponse:
+    """Response to a request sent by :class:`AsyncHTTPClient`"""
+
+    status_code: int
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self) -> Dict[str, Any]:
+        """
+        Decode body of response as JSON object
+
+        :raises ValueError: If body is not a JSON object
+        :return: Decoded body
+        """
+
+        data: Dict[str, Any] = json.loads(self.body)
+        if not isinstance(data, dict):
+            raise ValueError('Error when parsing response: Response is not a JSON object')
+        return data
+
+
+class AsyncHTTPClient:
+    """
+    Minimal asyncio HTTP/1.1 client that keeps connections alive and
+    reuses them for subsequent requests to the same host.
+    Requests are always sent directly, proxies are not supported (see
+    :func:`proxy_for_url`), and redirects are not followed.
+    Errors are raised as :class:`requests.exceptions.RequestException` so
+    callers can handle them the same way as errors of the blocking client.
+
+    :param pool_size: Maximum number of idle connections kept open per host
+    :param connect_timeout: Number of seconds to wait for a connection to
+        be established
+    :param read_timeout: Number of seconds to wait for the server to respond
+    """
+
+    def __init__(
+            self,
+            pool_size: int=10,
+            connect_timeout: float=10,
+            read_timeout: float=10) -> None:
+
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self._idle: Dict[ConnectionKey, List[Connection]] = {}
+        self._ssl_context = ssl.create_default_context()
+
+        self.requests_sent = 0
+        self.connections_opened = 0
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Return statistics about connections opened by this client.
+
+        :return: Dictionary with number of requests sent, number of
+            connections opened and number of requests that reused an
+            already open connection
+        """
+
+        return {
+            'upstream_requests': self.requests_sent,
+            'upstream_connections': self.connections_opened,
+            'upstream_connections_reused': max(0, self.requests_sent - self.connections_opened),
+        }
+
+    async def close(self) -> None:
+        """
+        Close all idle connections
+        """
+
+        idle = self._idle
+        self._idle = {}
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
+
+    async def _connect(self, key: ConnectionKey) -> Connection:
+        scheme, host, port = key
+        try:
+            connection = await asyncio.wait_for(
+                asyncio.open_connection(
+                    host,
+                    port,
+                    ssl=self._ssl_context if scheme == 'https' else None),
+                timeout=self.connect_timeout)
+        except asyncio.TimeoutError as err:
+            raise Timeout(f'Connecting to {host}:{port} timed out') from err
+        except OSError as err:
+            raise RequestsConnectionError(f'Could not connect to {host}:{port}: {err}') from err
+
+        self.connections_opened += 1
+        return connection
+
+    def _release(self, key: ConnectionKey, connection: Connection) -> None:
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            headers: Optional[Dict[str, str]]=None,
+            auth: Optional[Tuple[str, str]]=None) -> AsyncHTTPResponse:
+        """
+        Send request and wait for the response.
+
+        :param method: HTTP method
+        :param url: URL to send request to
+        :param headers: Additional request headers
+        :param auth: User and password for basic authentication
+        :raises RequestException: If the request could not be sent or the
+            response could not be read
+        :return: Response of server
+        """
+
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or parts.hostname is None:
+            raise RequestException(f'Unsupported URL "{url}"')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+
+        request = self._build_request(method, parts.netloc, parts.path, parts.query, headers, auth)
+
+        # Idle connection might have been closed by the server in the
+        # meantime, in that case retry once on a new connection
+        idle = self._idle.get(key)
+        if idle:
+            connection = idle.pop()
+            try:
+                return await self._send(key, connection, method, request)
+            except (RequestsConnectionError, asyncio.IncompleteReadError):
+                pass
+
+        connection = await self._connect(key)
+        try:
+            return await self._send(key, connection, method, request)
+        except asyncio.IncompleteReadError as err:
+            raise RequestsConnectionError(f'Connection to {parts.netloc} closed') from err
+
+    @staticmethod
+    def _build_request(  # pylint: disable=too-many-arguments
+            method: str,
+            netloc: str,
+            path: str,
+            query: str,
+            headers: Optional[Dict[str, str]],
+            auth: Optional[Tuple[str, str]]) -> bytes:
+        target = path or '/'
+        if query:
+            target += f'?{query}'
+
+        request_headers = {
+            'Host': netloc,
+            'Connection': 'keep-alive',
+            'Accept-Encoding': 'identity',
+        }
+        if auth is not None:
+            credentials = base64.b64encode(f'{auth[0]}:{auth[1]}'.encode()).decode()
+            request_headers['Authorization'] = f'Basic {credentials}'
+        request_headers.update(headers or {})
+
+        request = f'{method} {target} HTTP/1.1\r\n'
+        request += ''.join(f'{name}: {value}\r\n' for name, value in request_headers.items())
+        return (request + '\r\n').encode('latin-1')
+
+    async def _send(
+            self,
+            key: ConnectionKey,
+            connection: Connection,
+            method: str,
+            request: bytes) -> AsyncHTTPResponse:
+        reader, writer = connection
+        try:
+            writer.write(request)
+            await writer.drain()
+            self.requests_sent += 1
+            response, keep_alive = await asyncio.wait_for(
+                self._read_response(reader, method),
+                timeout=self.read_timeout)
+        except asyncio.TimeoutError as err:
+            writer.close()
+            raise Timeout(f'Reading response from {key[1]} timed out') from err
+        except (OSError, ValueError) as err:
+            writer.close()
+            raise RequestsConnectionError(f'Error communicating with {key[1]}: {err}') from err
+        except asyncio.IncompleteReadError:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._release(key, connection)
+        else:
+            writer.close()
+
+        return response
+
+    @staticmethod
+    async def _read_response(
+            reader: asyncio.StreamReader,
+            method: str) -> Tuple[AsyncHTTPResponse, bool]:
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(status_line, None)
+        version, status, _ = (status_line.decode('latin-1').rstrip('\r\n') + ' ').split(' ', 2)
+        status_code = int(status)
+
+        headers = await read_headers(reader)
+
+        connection_header = headers.get('connection', '').lower()
+        keep_alive = (
+            connection_header != 'close'
+            and (version == 'HTTP/1.1' or connection_header == 'keep-alive'))
+
+        # Read body
+        body = b''
+        if method == 'HEAD' or status_code in STATUS_WITHOUT_BODY or status_code < 200:
+            pass
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Skip trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+
+        return AsyncHTTPResponse(status_code=status_code, headers=headers, body=body), keep_alive
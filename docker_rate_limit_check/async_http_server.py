@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import traceback
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from requests.exceptions import RequestException
+
+from .async_http_client import read_headers
+from .async_requestor import AsyncDockerHubAccountPool
+from .async_requestor import AsyncDockerHubRequestor
+from .async_requestor import refresh_in_background
+from .history import history_to_output_format
+from .http_server import HISTORY_PATH
+from .http_server import WATCH_HEARTBEAT_INTERVAL
+from .http_server import WATCH_PATH
+from .http_server import HTTPRequestError
+from .http_server import parse_rate_limit_request
+from .http_server import parse_watch_request
+from .http_server import rate_limit_response
+from .http_server import remove_unix_socket
+from .http_server import upstream_error_response
+from .instrumentation import EXPORTER_METRICS
+from .output_format import RateLimitOutputFormat
+from .response_cache import DEFAULT_COMPRESSION_MIN_SIZE
+from .response_cache import ResponseCache
+from .response_cache import compress_response
+from .response_cache import conditional_response
+from .response_cache import freshness_headers
+from .response_cache import negotiate_encoding
+from .response_cache import render_payload
+from .watch import AsyncRateLimitWatch
+from .watch import format_event
+
+
+# Requestor for rate limit of one or many accounts
+AsyncRateLimitRequestor = Union[AsyncDockerHubRequestor, AsyncDockerHubAccountPool]
+
+# Status code, headers and body of a response
+Response = Tuple[int, Dict[str, str], bytes]
+
+# Method, target, HTTP version and headers of a request
+Request = Tuple[str, str, str, Dict[str, str]]
+
+# Size in bytes of the largest request body that is read and discarded,
+# requests with larger bodies are refused
+MAX_REQUEST_BODY_SIZE = 64 * 1024
+
+
+class AsyncDockerRateLimitHTTPServer:  # pylint: disable=too-many-instance-attributes
+    """
+    HTTP server answering GET request with the current Docker Hub
+    rate limit using asyncio. Answers requests like
+    :class:`DockerRateLimitHTTPServer` but handles all connections in a
+    single event loop.
+
+    :param port: Port to listen on
+    :param default_format: Default output format if not specified using
+        query parameter ?format=XYZ in GET request.
+    :param docker_hub_requestor: Requestor for querying Docker Hub.
+    :param host: Host string to bind on (default=0.0.0.0)
+    :param debug_metrics: Whether to expose internal counters of the
+        requestor on the /debug endpoint
+    :param refresh_ahead: Number of seconds before cache expiry at which
+        to refresh the cache in the background (0 to disable)
+    :param keep_alive_timeout: Number of seconds an idle connection is
+        kept open waiting for the next request
+    :param max_keep_alive_requests: Maximum number of requests answered
+        on one connection before it is closed
+    :param self_metrics: Whether to append metrics describing the
+        exporter itself to responses in prometheus format
+    :param unix_socket: Path of Unix domain socket to listen on instead of
+        host and port
+    :param unix_socket_mode: Permissions of Unix domain socket
+    :param compression_min_size: Size in bytes of smallest response body
+        to compress if the client accepts gzip or deflate, None to never
+        compress responses
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            port: int,
+            default_format: RateLimitOutputFormat,
+            docker_hub_requestor: AsyncRateLimitRequestor,
+            host: str='0.0.0.0',
+            debug_metrics: bool=False,
+            refresh_ahead: float=0,
+            keep_alive_timeout: float=15,
+            max_keep_alive_requests: int=100,
+            self_metrics: bool=True,
+            unix_socket: Optional[str]=None,
+            unix_socket_mode: int=0o660,
+            compression_min_size: Optional[int]=DEFAULT_COMPRESSION_MIN_SIZE) -> None:
+
+        self.port = port
+        self.host = host
+        self.default_format = default_format
+        self.docker_hub_requestor = docker_hub_requestor
+        self.debug_metrics = debug_metrics
+        self.refresh_ahead = refresh_ahead
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.self_metrics = self_metrics
+        self.unix_socket = unix_socket
+        self.unix_socket_mode = unix_socket_mode
+        self.response_cache = ResponseCache(compression_min_size)
+        self.watch = AsyncRateLimitWatch(docker_hub_requestor)
+
+        self.server_version = f'{__name__} Python/{sys.version_info.major}.{sys.version_info.minor}'
+
+        # Set once the server is listening
+        self.server_address: Optional[Tuple[str, int]] = None
+        self.ready = threading.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def serve_forever(self) -> None:
+        """
+        Listen on configured host and port and answer requests until
+        :meth:`shutdown` is called
+        """
+
+        self._loop = asyncio.get_running_loop()
+        if self.unix_socket is not None:
+            remove_unix_socket(self.unix_socket)
+            self._server = await asyncio.start_unix_server(self.handle_connection, self.unix_socket)
+            os.chmod(self.unix_socket, self.unix_socket_mode)
+        else:
+            self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+            self.server_address = self._server.sockets[0].getsockname()[:2]
+
+        refresher = None
+        if self.refresh_ahead > 0:
+            semaphore = None
+            if isinstance(self.docker_hub_requestor, AsyncDockerHubAccountPool):
+                requestors = list(self.docker_hub_requestor.requestors.values())
+                semaphore = self.docker_hub_requestor.semaphore
+            else:
+                requestors = [self.docker_hub_requestor]
+            refresher = asyncio.get_running_loop().create_task(
+                refresh_in_background(requestors, self.refresh_ahead, semaphore=semaphore))
+
+        self.ready.set()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if refresher is not None:
+                refresher.cancel()
+            # End event streams, so connections can be closed
+            await self.watch.close()
+            self._server.close()
+            await self._server.wait_closed()
+            if self.unix_socket is not None:
+                remove_unix_socket(self.unix_socket)
+
+    def shutdown(self) -> None:
+        """
+        Stop server. Can be called from any thread.
+        """
+
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    async def handle_connection(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter) -> None:
+        """
+        Answer requests received on connection until the client closes it
+        or the connection is idle for too long.
+
+        :param reader: Stream to read requests from
+        :param writer: Stream to write responses to
+        """
+
+        try:
+            keep_alive = True
+            requests_handled = 0
+            while keep_alive:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as err:
+                    # Answer malformed request and close connection like
+                    # http.server does
+                    await self.send_response(
+                        writer, self.error_response(400, f'Bad request: {err}'), False)
+                    break
+                except HTTPRequestError as err:
+                    # Rest of request has not been read
+                    await self.send_response(
+                        writer, self.error_response(err.code, err.message), False)
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                requests_handled += 1
+
+                connection_header = headers.get('connection', '').lower()
+                keep_alive = (
+                    connection_header != 'close'
+                    and (version == 'HTTP/1.1' or connection_header == 'keep-alive')
+                    and requests_handled < self.max_keep_alive_requests)
+
+                # Waiting for changes is not measured as handling a request
+                urltuple = urlparse(target)
+                if method == 'GET' and urltuple.path == WATCH_PATH:
+                    response = await self.respond_watch(
+                        parse_qs(urltuple.query), headers, writer)
+                    if response is None:
+                        # Event stream ends by closing the connection
+                        break
+                    await self.send_response(writer, response, keep_alive)
+                    continue
+
+                with EXPORTER_METRICS.http_request():
+                    response = await self.respond(method, target, headers)
+                    await self.send_response(writer, response, keep_alive)
+        except (RequestException, KeyError, ValueError):
+            traceback.print_exc(file=sys.stderr)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        """
+        Read next request from connection. The whole request has to arrive
+        within the keep-alive timeout, so clients sending it slowly do not
+        hold on to the connection.
+
+        :param reader: Stream to read request from
+        :return: Method, target, HTTP version and headers of request or
+            None if connection was closed or has been idle for too long
+        """
+
+        task = asyncio.ensure_future(self._read_request(reader))
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.keep_alive_timeout)
+        finally:
+            # No-op if request has been read in time
+            task.cancel()
+        if not done:
+            return None
+        return task.result()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+        """
+        Read request line, headers and body of next request from connection
+
+        :param reader: Stream to read request from
+        :raises ValueError: If request is malformed
+        :raises HTTPRequestError: If request body is too large
+        :return: Method, target, HTTP version and headers of request or
+            None if connection was closed
+        """
+
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+
+        words = request_line.decode('latin-1').split()
+        if len(words) != 3 or not words[2].startswith('HTTP/'):
+            raise ValueError(f'Malformed request line {request_line!r}')
+        method, target, version = words
+
+        headers = await read_headers(reader)
+
+        # Discard request body
+        content_length = int(headers.get('content-length', '0'))
+        if content_length < 0:
+            raise ValueError(f'Invalid Content-Length {content_length}')
+        if content_length > MAX_REQUEST_BODY_SIZE:
+            raise HTTPRequestError(
+                413, f'Request body of {content_length} bytes is too large')
+        if content_length > 0:
+            await reader.readexactly(content_length)
+
+        return method, target, version, headers
+
+    async def send_response(
+            self,
+            writer: asyncio.StreamWriter,
+            response: Response,
+            keep_alive: bool) -> None:
+        """
+        Send response to the client
+
+        :param writer: Stream to write response to
+        :param response: Response to send
+        :param keep_alive: Whether the connection is kept open afterwards
+        """
+
+        status, headers, body = response
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        writer.write(self.serialize_response(status, headers, body))
+        await writer.drain()
+
+    def serialize_response(self, status: int, headers: Dict[str, str], body: bytes) -> bytes:
+        """
+        Serialize response for sending it to the client
+
+        :param status: HTTP status code
+        :param headers: Response headers
+        :param body: Response body
+        :return: Serialized response
+        """
+
+        # Not modified response never has a body
+        if status != 304:
+            headers = {**headers, 'Content-Length': str(len(body))}
+        return self.serialize_head(status, headers) + body
+
+    def serialize_head(self, status: int, headers: Dict[str, str]) -> bytes:
+        """
+        Serialize status line and headers of response for sending them to
+        the client
+
+        :param status: HTTP status code
+        :param headers: Response headers
+        :return: Serialized status line and headers including terminating
+            empty line
+        """
+
+        lines = [f'HTTP/1.1 {status} {HTTPStatus(status).phrase}']
+        headers = {
+            'Server': self.server_version,
+            'Date': formatdate(usegmt=True),
+            **headers,
+        }
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def respond(self, method: str, target: str, headers: Dict[str, str]) -> Response:
+        """
+        Create response to request
+
+        :param method: HTTP method of request
+        :param target: Requested path including query string
+        :param headers: Request headers with lowercase names
+        :return: Response to send
+        """
+
+        if method != 'GET':
+            return self.error_response(501, f'Unsupported method ("{method}")')
+
+        # Parse request
+        urltuple = urlparse(target)
+        path = urltuple.path
+        arguments: Dict[str, List[str]] = parse_qs(urltuple.query)
+
+        if path == '/debug' and self.debug_metrics:
+            metrics = self.docker_hub_requestor.debug_metrics()
+            metrics['response_cache_hits'] = self.response_cache.hits
+            metrics['response_cache_misses'] = self.response_cache.misses
+            payload = json.dumps(metrics, indent=4) + '\n'
+            return 200, {'Content-Type': 'application/json'}, payload.encode('utf-8')
+
+        try:
+            output_format = parse_rate_limit_request(path, arguments)
+        except HTTPRequestError as err:
+            return self.error_response(err.code, err.message)
+
+        # If not specified use default format
+        if output_format is None:
+            output_format = self.default_format
+
+        if path == HISTORY_PATH:
+            response = compress_response(
+                render_payload(
+                    history_to_output_format(self.docker_hub_requestor.history, output_format),
+                    output_format),
+                negotiate_encoding(headers.get('accept-encoding')),
+                self.response_cache.compression_min_size)
+            return conditional_response(
+                response,
+                {'Cache-Control': 'no-cache'},
+                headers.get('if-none-match'))
+
+        # Get rate limit
+        try:
+            rate_limit = await self.docker_hub_requestor.get_rate_limit()
+        except (RequestException, KeyError, ValueError) as err:
+            return self.error_response(*upstream_error_response(err))
+        response = rate_limit_response(
+            self.response_cache,
+            rate_limit,
+            output_format,
+            headers.get('accept-encoding'),
+            self.self_metrics)
+        return conditional_response(
+            response,
+            freshness_headers(self.docker_hub_requestor),
+            headers.get('if-none-match'))
+
+    async def respond_watch(
+            self,
+            arguments: Dict[str, List[str]],
+            headers: Dict[str, str],
+            writer: asyncio.StreamWriter) -> Optional[Response]:
+        """
+        Create response to request for changes of the rate limit once it
+        differs from the version the client has seen last, or stream every
+        change of the rate limit if no time to wait is given.
+
+        :param arguments: Parsed query string of request
+        :param headers: Request headers with lowercase names
+        :param writer: Stream to write changes to
+        :return: Response to send, None if changes have been streamed
+        """
+
+        try:
+            output_format, wait, last_version = parse_watch_request(arguments)
+        except HTTPRequestError as err:
+            return self.error_response(err.code, err.message)
+
+        # If not specified use default format
+        if output_format is None:
+            output_format = self.default_format
+
+        if wait is None:
+            await self.send_event_stream(writer, output_format, headers.get('last-event-id'))
+            return None
+
+        version, rate_limit = await self.watch.wait(last_version, wait)
+        if version is None or rate_limit is None:
+            return self.error_response(
+                503,
+                'Error: Rate limit is not known yet',
+                {'Retry-After': '1'})
+
+        response_headers = {'Cache-Control': 'no-cache', 'X-Rate-Limit-Version': version}
+
+        # Rate limit did not change in time
+        if version == last_version:
+            return 304, response_headers, b''
+
+        response = self.response_cache.get(rate_limit, output_format)
+        return 200, {**response.headers, **response_headers}, response.body
+
+    async def send_event_stream(
+            self,
+            writer: asyncio.StreamWriter,
+            output_format: RateLimitOutputFormat,
+            version: Optional[str]) -> None:
+        """
+        Send every change of the rate limit as Server-Sent Event until the
+        client closes the connection or the server stops. A client
+        reconnecting with a Last-Event-ID header is only sent changes it
+        has not seen yet.
+
+        :param writer: Stream to write changes to
+        :param output_format: Format in which to send rate limit
+        :param version: Version of rate limit the client has seen last
+        """
+
+        writer.write(self.serialize_head(200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Connection': 'close',
+        }))
+        await writer.drain()
+
+        while True:
+            new_version, rate_limit = await self.watch.wait(version, WATCH_HEARTBEAT_INTERVAL)
+            if self.watch.closed:
+                return
+
+            if new_version is not None and new_version != version and rate_limit is not None:
+                version = new_version
+                payload = self.response_cache.get(rate_limit, output_format).body
+                writer.write(format_event(version, payload))
+            else:
+                writer.write(b': keep-alive\n\n')
+            await writer.drain()
+
+    @staticmethod
+    def error_response(
+            code: int,
+            message: str,
+            headers: Optional[Dict[str, str]]=None) -> Response:
+        """
+        Create response with error message
+
+        :param code: HTTP error code
+        :param message: Plaintext message to include in body of response
+        :param headers: Additional headers to send
+        :return: Response to send
+        """
+
+        # End message with newline character
+        if len(message) > 0 and message[-1] != '\n':
+            message += '\n'
+
+        response_headers = {'Content-Type': 'text/plain; charset=utf-8', **(headers or {})}
+        return code, response_headers, message.encode('utf-8')
@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+
+from requests.exceptions import RequestException
+
+from .account_pool import DockerHubAccount
+from .account_pool import account_refresh_failed
+from .account_pool import check_any_account_refreshed
+from .account_pool import pool_debug_metrics
+from .account_pool import reuse_group
+from .adaptive_refresh import AdaptiveRefreshPolicy
+from .async_http_client import AsyncHTTPClient
+from .async_http_client import AsyncHTTPResponse
+from .docker_hub_requestor import CacheState
+from .docker_hub_requestor import DockerHubRequestorBase
+from .docker_hub_requestor import background_refresh_failed
+from .docker_hub_requestor import check_token_response
+from .docker_hub_requestor import oldest_cache_age
+from .docker_hub_requestor import parse_rate_limit_response
+from .docker_hub_requestor import parse_token_response
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .endpoints import RATE_LIMIT_ENDPOINT
+from .endpoints import TOKEN_RECEIVE_ENDPOINT
+from .history import DEFAULT_HISTORY_SIZE
+from .history import RateLimitHistory
+from .instrumentation import EXPORTER_METRICS
+from .token_cache import TokenCache
+
+
+class AsyncDockerHubRequestor(DockerHubRequestorBase):
+    """
+    Requestor that queries Docker Hub for the current rate limit using
+    asyncio. Behaves like :class:`DockerHubRequestor` but all methods that
+    contact Docker Hub are coroutines. Instances must only be used from a
+    single event loop.
+
+    :param user: User to request token for.
+        None for anonymous token.
+    :param password: Password for user to request token for.
+        None for anonymous token.
+    :param cache_ttl: Number of seconds information should be cached
+        before querying Docker Hub for fresh information.
+    :param stale_while_revalidate: Number of seconds after cache expiry
+        during which stale information is returned immediately while it is
+        being refreshed in the background.
+    :param stale_if_error: Number of seconds after cache expiry during
+        which stale information is returned if refreshing it failed.
+    :param token_cache: Cache for tokens used to authorize to Docker Hub.
+        Can be shared between requestors. A new one is created if not given.
+    :param client: HTTP client used for requests to Docker Hub. Can be
+        shared between requestors. A new one is created if not given.
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of Docker Hub manifest whose HEAD
+        response reports the rate limit
+    :param history_size: Number of refreshed rate limits kept in history
+    :param adaptive_refresh: Policy choosing the cache TTL after every
+        refresh. The cache TTL stays fixed if not given.
+    :param failure_threshold: Number of consecutive failed refreshes after
+        which Docker Hub is not queried for a while. 0 to keep querying.
+    :param max_backoff: Maximum number of seconds Docker Hub is not queried
+        after failed refreshes
+    :param semaphore: Semaphore acquired by background refreshes. Can be
+        shared between requestors to limit the number of concurrent
+        refreshes. Background refreshes are not limited if not given.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+            user: Optional[str]=None,
+            password: Optional[str]=None,
+            cache_ttl: int=0,
+            stale_while_revalidate: int=0,
+            stale_if_error: int=0,
+            token_cache: Optional[TokenCache]=None,
+            client: Optional[AsyncHTTPClient]=None,
+            token_endpoint: str=TOKEN_RECEIVE_ENDPOINT,
+            rate_limit_endpoint: str=RATE_LIMIT_ENDPOINT,
+            history_size: int=DEFAULT_HISTORY_SIZE,
+            adaptive_refresh: Optional[AdaptiveRefreshPolicy]=None,
+            failure_threshold: int=3,
+            max_backoff: float=300,
+            semaphore: Optional[asyncio.Semaphore]=None):
+
+        super().__init__(
+            user, password, cache_ttl, stale_while_revalidate, stale_if_error,
+            token_cache, token_endpoint, rate_limit_endpoint, history_size, adaptive_refresh,
+            failure_threshold, max_backoff)
+
+        self.semaphore = semaphore
+
+        if client is None:
+            client = AsyncHTTPClient()
+        self.client = client
+
+        # Refresh that is currently in flight
+        self._in_flight: Optional['asyncio.Future[DockerRateLimit]'] = None  # noqa: UP037
+        self.coalesced_refreshes = 0
+
+        # Keep references to background tasks so they are not garbage collected
+        self._background_tasks: Set['asyncio.Task[Any]'] = set()  # noqa: UP037
+        # Whether a background refresh is waiting for the semaphore or running
+        self._revalidating = False
+
+    async def get_rate_limit(self) -> DockerRateLimit:
+        """
+        Returns information about Docker Hub rate limiting.
+        See :meth:`DockerHubRequestor.get_rate_limit`.
+
+        If refreshing failed and there is no usable cached information the
+        error (KeyError, ValueError or RequestException) is raised.
+
+        :return: Information about rate limit
+        """
+
+        rate_limit = self.cached_rate_limit()
+        if rate_limit is not None:
+            return rate_limit
+
+        try:
+            return await self.revalidate()
+        except (RequestException, KeyError, ValueError) as err:
+            return self.stale_after_error(err)
+
+    async def revalidate(self) -> DockerRateLimit:
+        """
+        Refresh cached information regardless of the age of the cache.
+        Only one refresh is in flight, concurrent callers wait for its result.
+
+        :raises BaseException: Any error raised while refreshing
+        :return: Information about rate limit
+        """
+
+        if self._in_flight is not None:
+            self.coalesced_refreshes += 1
+            shared: DockerRateLimit = await asyncio.shield(self._in_flight)
+            return shared
+
+        loop = asyncio.get_running_loop()
+        in_flight: 'asyncio.Future[DockerRateLimit]' = loop.create_future()  # noqa: UP037
+        self._in_flight = in_flight
+        try:
+            rate_limit = await self.refresh()
+            in_flight.set_result(rate_limit)
+        except BaseException as err:
+            in_flight.set_exception(err)
+            # Retrieve exception so it is not reported as never retrieved
+            in_flight.exception()
+            raise
+        finally:
+            self._in_flight = None
+        return rate_limit
+
+    def revalidate_in_background(self) -> None:
+        """
+        Refresh cached information in a background task holding the
+        semaphore unless a refresh is already in flight or waiting for it.
+        """
+
+        if self._in_flight is not None or self._revalidating:
+            return
+        self._revalidating = True
+        semaphore = self.semaphore
+
+        async def run() -> None:
+            try:
+                if semaphore is None:
+                    await self.revalidate()
+                else:
+                    async with semaphore:
+                        await self.revalidate()
+            except (RequestException, KeyError, ValueError) as err:
+                background_refresh_failed(err)
+            finally:
+                self._revalidating = False
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def refresh(self) -> DockerRateLimit:
+        """
+        Request current rate limit from Docker Hub and store it in cache
+        regardless of the age of the cache.
+        See :meth:`DockerHubRequestor.refresh`.
+
+        :raises Exception: Any error raised while requesting rate limit
+        :return: Information about rate limit
+        """
+
+        # Fail immediately instead of waiting for Docker Hub while it is
+        # failing or has asked to back off
+        self.circuit_breaker.before_request()
+
+        try:
+            rate_limit = await self.get_rate_limit_from_docker_hub()
+            self.store_in_cache(rate_limit)
+            return rate_limit
+        except Exception:
+            self.record_refresh_error()
+            raise
+
+    async def request_token(self) -> str:
+        """
+        Return token to authorize to Docker Hub with.
+        See :meth:`DockerHubRequestor.request_token`.
+
+        Raises RequestException if Docker Hub does not respond with status
+        code HTTP-200.
+
+        :return: Token for given user or anonymous token to authorize to Docker
+            Hub with
+        """
+
+        token = self.token_cache.get(self.token_cache_key)
+        if token is not None:
+            return token
+
+        auth = None
+        if self.user is not None and self.password is not None:
+            auth = (self.user, self.password)
+        with EXPORTER_METRICS.upstream_request('token'):
+            req = await self.client.request('GET', self.token_endpoint, auth=auth)
+        self.circuit_breaker.note_response(req.status_code, req.headers)
+        check_token_response(req.status_code)
+
+        token, expires_in = parse_token_response(req.json())
+        self.token_cache.put(self.token_cache_key, token, expires_in)
+        return token
+
+    async def get_rate_limit_from_docker_hub(self) -> DockerRateLimit:
+        """
+        Returns information about Docker Hub rate limiting by actively
+        querying Docker Hub for that information.
+        See :meth:`DockerHubRequestor.get_rate_limit_from_docker_hub`.
+
+        :return: Information about rate limit returned by Docker Hub
+        """
+
+        req = await self.request_rate_limit(await self.request_token())
+
+        # Cached token might have been revoked, retry once with a new one
+        if req.status_code == 401:
+            self.token_cache.invalidate(self.token_cache_key)
+            req = await self.request_rate_limit(await self.request_token())
+
+        return parse_rate_limit_response(req.status_code, req.headers)
+
+    async def request_rate_limit(self, token: str) -> AsyncHTTPResponse:
+        """
+        Send HEAD request to rate limit endpoint of Docker Hub
+
+        :param token: Token to authorize with
+        :return: Response of Docker Hub
+        """
+
+        headers = {'Authorization': f'Bearer {token}'}
+        with EXPORTER_METRICS.upstream_request('rate_limit'):
+            req: AsyncHTTPResponse = await self.client.request(
+                'HEAD',
+                self.rate_limit_endpoint,
+                headers=headers)
+        EXPORTER_METRICS.upstream_response('rate_limit', req.status_code)
+        self.circuit_breaker.note_response(req.status_code, req.headers)
+        return req
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters useful for debugging the behavior of
+        caches and connections of this requestor.
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        metrics = super().debug_metrics()
+        metrics['coalesced_refreshes'] = self.coalesced_refreshes
+        metrics.update(self.client.connection_stats())
+        return metrics
+
+
+class AsyncDockerHubAccountPool:
+    """
+    Queries Docker Hub for the current rate limit of many accounts using
+    asyncio. See :class:`DockerHubAccountPool`.
+
+    :param accounts: Accounts to query rate limit for
+    :param cache_ttl: Number of seconds information should be cached
+        before querying Docker Hub for fresh information.
+    :param max_concurrency: Maximum number of accounts refreshed at the
+        same time
+    :param **kwargs: Additional arguments for every
+        :class:`AsyncDockerHubRequestor`
+    """
+
+    def __init__(
+            self,
+            accounts: List[DockerHubAccount],
+            cache_ttl: int=0,
+            max_concurrency: int=8,
+            **kwargs: Any) -> None:
+
+        if 'client' not in kwargs:
+            kwargs['client'] = AsyncHTTPClient(pool_size=max_concurrency)
+        token_cache = TokenCache()
+
+        self.requestors: Dict[str, AsyncDockerHubRequestor] = {
+            account.name: AsyncDockerHubRequestor(
+                user=account.user,
+                password=account.password,
+                cache_ttl=cache_ttl,
+                token_cache=token_cache,
+                **kwargs)
+            for account in accounts
+        }
+
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._group: Optional[DockerRateLimitGroup] = None
+
+        self.cache_ttl = cache_ttl
+        self.stale_while_revalidate = kwargs.get('stale_while_revalidate', 0)
+        self.stale_if_error = kwargs.get('stale_if_error', 0)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """
+        Semaphore limiting the number of accounts refreshed at the same
+        time, acquired by requests and by refreshes in the background
+
+        :return: Semaphore of this pool
+        """
+
+        # Semaphore has to be created inside of the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            for requestor in self.requestors.values():
+                requestor.semaphore = self._semaphore
+        semaphore: asyncio.Semaphore = self._semaphore
+        return semaphore
+
+    async def _get_rate_limit(self, requestor: AsyncDockerHubRequestor) -> DockerRateLimit:
+        semaphore = self.semaphore
+
+        # Cached information does not wait for refreshes of other accounts,
+        # stale information is refreshed in the background holding the
+        # semaphore
+        _, state = requestor.lookup_cache()
+        if state != CacheState.EXPIRED:
+            return await requestor.get_rate_limit()
+
+        async with semaphore:
+            return await requestor.get_rate_limit()
+
+    async def get_rate_limit(self) -> DockerRateLimitGroup:
+        """
+        Returns information about Docker Hub rate limiting of all accounts.
+        Accounts whose cache is stale are refreshed concurrently.
+        Accounts that could not be refreshed are left out.
+
+        :raises RequestException: If no account could be refreshed
+        :raises BaseException: Unexpected errors raised while refreshing
+        :return: Information about rate limit of all accounts
+        """
+
+        names = list(self.requestors)
+        results = await asyncio.gather(
+            *(self._get_rate_limit(self.requestors[name]) for name in names),
+            return_exceptions=True)
+
+        rate_limits = {}
+        errors: List[Exception] = []
+        for name, result in zip(names, results):
+            if isinstance(result, DockerRateLimit):
+                rate_limits[name] = result
+            elif isinstance(result, (RequestException, KeyError, ValueError)):
+                account_refresh_failed(name, result)
+                errors.append(result)
+            else:
+                raise result
+        check_any_account_refreshed(rate_limits, errors)
+
+        group = reuse_group(self._group, rate_limits)
+        self._group = group
+        return group
+
+    @property
+    def history(self) -> Dict[str, RateLimitHistory]:
+        """
+        History of refreshed rate limits of every account
+
+        :return: Dictionary mapping account name to its history
+        """
+
+        return {name: requestor.history for name, requestor in self.requestors.items()}
+
+    @property
+    def cache_age(self) -> float:
+        """
+        Number of seconds since information of the least recently
+        refreshed account was refreshed
+
+        :return: Age of oldest cached information in seconds
+        """
+
+        return oldest_cache_age(self.requestors.values())
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters useful for debugging the behavior of
+        caches and connections of all accounts.
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        return pool_debug_metrics(self.requestors.values())
+
+
+async def refresh_in_background(
+        requestors: List[AsyncDockerHubRequestor],
+        refresh_ahead: float,
+        retry_interval: float=5.0,
+        min_interval: float=1.0,
+        semaphore: Optional[asyncio.Semaphore]=None) -> None:
+    """
+    Refresh the cache of requestors shortly before it expires until
+    cancelled. See :class:`BackgroundRefresher`.
+
+    :param requestors: Requestors whose cache to keep fresh
+    :param refresh_ahead: Number of seconds before cache expiry at which
+        to refresh the cache
+    :param retry_interval: Number of seconds to wait before retrying
+        after a refresh failed
+    :param min_interval: Minimum number of seconds between two refreshes
+        of the same requestor
+    :param semaphore: Semaphore to acquire for every refresh, e.g.
+        :attr:`AsyncDockerHubAccountPool.semaphore`. All due requestors are
+        refreshed at the same time if not given.
+    """
+
+    not_before = [0.0] * len(requestors)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, len(requestors)))
+
+    async def refresh(index: int) -> None:
+        try:
+            async with semaphore:
+                await requestors[index].revalidate()
+            not_before[index] = time.monotonic() + min_interval
+        except (RequestException, KeyError, ValueError) as err:
+            background_refresh_failed(err)
+            not_before[index] = time.monotonic() + max(
+                retry_interval,
+                requestors[index].circuit_breaker.seconds_until_retry)
+
+    while True:
+        now = time.monotonic()
+        due = []
+        next_wakeup = now + retry_interval
+        for index, requestor in enumerate(requestors):
+            delay = max(0.0, requestor.cache_ttl - refresh_ahead - requestor.cache_age)
+            due_time = max(now + delay, not_before[index])
+            if due_time > now:
+                next_wakeup = min(next_wakeup, due_time)
+            else:
+                due.append(index)
+
+        await asyncio.gather(*(refresh(index) for index in due))
+        for index in due:
+            next_wakeup = min(next_wakeup, not_before[index])
+
+        await asyncio.sleep(max(0.0, next_wakeup - time.monotonic()))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from concurrent.futures import Executor
+
+from typing import Dict
+from typing import Optional
+from typing import Sequence
+
+from requests.exceptions import RequestException
+
+from .docker_hub_requestor import DockerHubRequestor
+from .docker_hub_requestor import background_refresh_failed
+
+
+class BackgroundRefresher:
+    """
+    Refreshes the cache of requestors in a background thread shortly
+    before it expires, so requests can always be answered from cache.
+
+    :param requestors: Requestors whose cache to keep fresh
+    :param refresh_ahead: Number of seconds before cache expiry at which
+        to refresh the cache
+    :param retry_interval: Number of seconds to wait before retrying
+        after a refresh failed
+    :param min_interval: Minimum number of seconds between two refreshes
+        of the same requestor
+    :param executor: Executor used to refresh multiple requestors
+        concurrently. Requestors are refreshed one after another if not given.
+    :raises ValueError: If refresh_ahead is not shorter than the cache TTL
+        of every requestor, the cache would be refreshed continuously
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            requestors: Sequence[DockerHubRequestor],
+            refresh_ahead: float,
+            retry_interval: float=5.0,
+            min_interval: float=1.0,
+            executor: Optional[Executor]=None) -> None:
+
+        for requestor in requestors:
+            shortest_ttl = requestor.cache_ttl
+            if requestor.adaptive_refresh is not None:
+                shortest_ttl = min(shortest_ttl, requestor.adaptive_refresh.min_interval)
+            if refresh_ahead >= shortest_ttl:
+                raise ValueError(
+                    f'Refresh ahead of {refresh_ahead} seconds has to be shorter '
+                    f'than cache TTL of {shortest_ttl} seconds')
+
+        self.requestors = list(requestors)
+        self.refresh_ahead = refresh_ahead
+        self.retry_interval = retry_interval
+        self.min_interval = min_interval
+        self.executor = executor
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self.run,
+            name='background-refresher',
+            daemon=True)
+
+    def start(self) -> None:
+        """
+        Start refreshing in background thread
+        """
+
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop refreshing and wait for background thread to exit
+        """
+
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def next_refresh_delay(self, requestor: DockerHubRequestor) -> float:
+        """
+        Calculate number of seconds until cache of requestor has to be
+        refreshed.
+
+        :param requestor: Requestor to calculate delay for
+        :return: Seconds until next refresh (0 if refresh is due)
+        """
+
+        delay: float = max(0.0, requestor.cache_ttl - self.refresh_ahead - requestor.cache_age)
+        return delay
+
+    def refresh(self, requestor: DockerHubRequestor) -> float:
+        """
+        Refresh cache of requestor
+
+        :param requestor: Requestor to refresh
+        :return: Earliest time (see :func:`time.monotonic`) at which the
+            requestor may be refreshed again
+        """
+
+        try:
+            requestor.revalidate()
+            return time.monotonic() + self.min_interval
+        except (RequestException, KeyError, ValueError) as err:
+            background_refresh_failed(err)
+            # Docker Hub is not queried before the circuit breaker allows it
+            return time.monotonic() + max(
+                self.retry_interval,
+                requestor.circuit_breaker.seconds_until_retry)
+
+    def run(self) -> None:
+        """
+        Refresh caches until stopped
+        """
+
+        # Earliest time at which each requestor may be refreshed again
+        not_before: Dict[int, float] = {}
+
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            next_wakeup = now + self.retry_interval
+
+            # Find requestors whose cache is due to be refreshed
+            due = []
+            for index, requestor in enumerate(self.requestors):
+                due_time = max(
+                    now + self.next_refresh_delay(requestor),
+                    not_before.get(index, now))
+                if due_time > now:
+                    next_wakeup = min(next_wakeup, due_time)
+                else:
+                    due.append(index)
+
+            # Refresh caches
+            if self.executor is None:
+                refreshed = [self.refresh(self.requestors[index]) for index in due]
+            else:
+                refreshed = list(self.executor.map(
+                    self.refresh,
+                    [self.requestors[index] for index in due]))
+            for index, refreshed_not_before in zip(due, refreshed):
+                not_before[index] = refreshed_not_before
+                next_wakeup = min(next_wakeup, refreshed_not_before)
+
+            self._stop_event.wait(max(0.0, next_wakeup - time.monotonic()))
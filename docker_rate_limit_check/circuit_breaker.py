@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import datetime
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from typing import Mapping
+from typing import Optional
+
+from requests.exceptions import RequestException
+
+from .instrumentation import EXPORTER_METRICS
+
+
+# Status codes of responses whose Retry-After header is honored
+BACKOFF_STATUS_CODES = (429, 503)
+
+
+class CircuitOpenError(RequestException):
+    """
+    Docker Hub is not queried because the circuit breaker is open
+
+    :param seconds_until_retry: Number of seconds until Docker Hub is
+        queried again
+    """
+
+    def __init__(self, seconds_until_retry: float) -> None:
+        super().__init__(
+            'Not querying Docker Hub after repeated failures, '
+            f'retrying in {seconds_until_retry:.1f} seconds')
+        self.seconds_until_retry = seconds_until_retry
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """
+    Extract number of seconds to wait before sending the next request
+    from Retry-After header of response
+
+    :param headers: Headers of response. Lookup of header names has to be
+        case-insensitive or header names have to be lower case.
+    :return: Number of seconds to wait or None if header is missing or
+        malformed
+    """
+
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    # Header can also contain a HTTP-date
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+class CircuitBreaker:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe circuit breaker with exponential backoff and jitter.
+
+    After a number of consecutive failures the circuit opens and no
+    requests are sent until the backoff delay has passed. Then a single
+    trial request is let through: if it succeeds the circuit closes,
+    otherwise it opens again with twice the delay (up to a maximum).
+    A delay requested by the server (e.g. Retry-After) is always honored.
+
+    :param failure_threshold: Number of consecutive failures after which
+        the circuit opens. 0 to never open the circuit because of failures.
+    :param base_delay: Number of seconds the circuit stays open after it
+        opened for the first time
+    :param max_delay: Maximum number of seconds the circuit stays open
+        (unless the server asks for a longer delay)
+    """
+
+    def __init__(
+            self,
+            failure_threshold: int=3,
+            base_delay: float=1.0,
+            max_delay: float=300.0) -> None:
+
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._is_open = False
+        self._trial_in_flight = False
+
+        # Whether Docker Hub asked to back off while sending the current
+        # request (see note_response)
+        self._throttled = False
+        self._retry_after: Optional[float] = None
+
+        self.rejected = 0
+
+    @property
+    def failures(self) -> int:
+        """
+        Number of consecutive failures
+
+        :return: Number of failures since the last success
+        """
+
+        with self._lock:
+            return self._failures
+
+    @property
+    def is_open(self) -> bool:
+        """
+        Whether requests are currently rejected
+
+        :return: True if circuit is open
+        """
+
+        return self.seconds_until_retry > 0
+
+    @property
+    def seconds_until_retry(self) -> float:
+        """
+        Number of seconds until the next request is let through
+
+        :return: Seconds until retry (0 if requests are let through)
+        """
+
+        with self._lock:
+            remaining: float = self._open_until - time.monotonic()
+        return max(0.0, remaining)
+
+    def before_request(self) -> None:
+        """
+        Check whether a request may be sent. Only a single trial request is
+        let through after the circuit has been open.
+
+        :raises CircuitOpenError: If circuit is open
+        """
+
+        with self._lock:
+            remaining = self._open_until - time.monotonic()
+            if remaining <= 0 and self._is_open and self._trial_in_flight:
+                # Another caller is already sending the trial request
+                remaining = self.base_delay
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(remaining)
+            if self._is_open:
+                self._trial_in_flight = True
+            self._throttled = False
+            self._retry_after = None
+
+    def note_response(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """
+        Remember whether Docker Hub asked to back off in a response to the
+        request currently being sent. Taken into account by the following
+        :meth:`record_success` or :meth:`record_failure`.
+
+        :param status_code: HTTP status code of response
+        :param headers: Headers of response. Lookup of header names has to
+            be case-insensitive or header names have to be lower case.
+        """
+
+        retry_after = parse_retry_after(headers) if status_code in BACKOFF_STATUS_CODES else None
+        with self._lock:
+            if status_code == 429:
+                self._throttled = True
+            if retry_after is not None:
+                self._retry_after = max(retry_after, self._retry_after or 0.0)
+
+    def record_success(self) -> None:
+        """
+        Close circuit after a successful request. If Docker Hub answered
+        that the rate limit is exhausted (HTTP-429) the circuit is opened
+        instead, as there is no point in asking again right away.
+        """
+
+        with self._lock:
+            if self._throttled:
+                self._open(trip=True)
+                return
+
+            self._failures = 0
+            self._open_until = 0.0
+            self._trial_in_flight = False
+            self._retry_after = None
+            self._set_open(False)
+
+    def record_failure(self) -> None:
+        """
+        Count failed request and open circuit if there have been too many
+        consecutive failures or Docker Hub asked to back off
+        """
+
+        with self._lock:
+            self._open(trip=False)
+
+    def _open(self, trip: bool) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        self._throttled = False
+        retry_after, self._retry_after = self._retry_after, None
+
+        threshold_reached = 0 < self.failure_threshold <= self._failures
+        if not (trip or threshold_reached or retry_after is not None):
+            return
+
+        # Double delay with every failure after the circuit opened, using
+        # only half of it plus a random part (jitter), so clients failing at
+        # the same time do not retry at the same time
+        exponent = max(0, self._failures - max(1, self.failure_threshold))
+        delay = min(self.max_delay, self.base_delay * 2 ** min(exponent, 32))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        self._open_until = time.monotonic() + delay
+        self._set_open(True)
+
+    def _set_open(self, is_open: bool) -> None:
+        if is_open != self._is_open:
+            EXPORTER_METRICS.upstream_circuits_open.inc(amount=1 if is_open else -1)
+        self._is_open = is_open
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import contextlib
+import dataclasses
+import json
+import os
+import sys
+import tempfile
+import time
+
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+from .docker_rate_limit import DockerRateLimit
+
+
+def default_cache_path() -> str:
+    """
+    Return default location of the cache file in the user cache directory
+
+    :return: Path of cache file
+    """
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'docker-rate-limit-check', 'query.json')
+
+
+def disk_cache_key(user: Optional[str], rate_limit_endpoint: str) -> str:
+    """
+    Return key identifying cached rate limit of user at endpoint
+
+    :param user: User to request rate limit for. None for anonymous user.
+    :param rate_limit_endpoint: URL of manifest reporting the rate limit
+    :return: Key for disk cache
+    """
+
+    return f'{user or ""}@{rate_limit_endpoint}'
+
+
+def rate_limit_from_dict(data: Dict[str, Any]) -> DockerRateLimit:
+    """
+    Create rate limit from dictionary written to cache file
+
+    :param data: Fields of rate limit
+    :return: Rate limit
+    """
+
+    field_names = {field.name for field in dataclasses.fields(DockerRateLimit)}
+    return DockerRateLimit(**{key: value for key, value in data.items() if key in field_names})
+
+
+class DiskCache:
+    """
+    Cache for rate limits stored in a file, so it can be shared between
+    processes, e.g. many invocations of the query command.
+
+    The file is replaced atomically on every write, so readers never see a
+    partially written file. Refreshes are serialized using a lock file,
+    so concurrent invocations wait for the one refreshing the cache and
+    use its result instead of querying Docker Hub themselves.
+
+    Errors reading or writing the cache are printed and otherwise ignored,
+    the rate limit is then requested from Docker Hub as if there was no
+    cache.
+
+    :param path: Path of cache file
+    :param ttl: Number of seconds cached information is used before
+        querying Docker Hub for fresh information
+    """
+
+    def __init__(self, path: str, ttl: float) -> None:
+        self.path = path
+        self.ttl = ttl
+
+    @property
+    def lock_path(self) -> str:
+        """
+        Path of lock file serializing refreshes of the cache
+
+        :return: Path of lock file
+        """
+
+        return self.path + '.lock'
+
+    def get_or_refresh(
+            self,
+            key: str,
+            refresh: Callable[[], DockerRateLimit]) -> DockerRateLimit:
+        """
+        Return cached rate limit if it is fresh, otherwise refresh it and
+        store it in cache.
+
+        :param key: Key identifying credential and endpoint of rate limit
+        :param refresh: Function requesting current rate limit
+        :return: Information about rate limit
+        """
+
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        with self._locked():
+            # Another process might have refreshed the cache while waiting
+            # for the lock
+            cached = self.lookup(key)
+            if cached is not None:
+                return cached
+
+            rate_limit = refresh()
+            self.store(key, rate_limit)
+            return rate_limit
+
+    def lookup(self, key: str) -> Optional[DockerRateLimit]:
+        """
+        Return cached rate limit if it is fresh.
+
+        :param key: Key identifying credential and endpoint of rate limit
+        :return: Cached rate limit or None if there is no fresh one
+        """
+
+        entry = self._read().get(key)
+        if not isinstance(entry, dict):
+            return None
+
+        try:
+            age = time.time() - float(entry['refreshed_at'])
+            if not 0 <= age <= self.ttl:
+                return None
+            return rate_limit_from_dict(entry['rate_limit'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def store(self, key: str, rate_limit: DockerRateLimit) -> None:
+        """
+        Store rate limit in cache file, keeping entries of other keys.
+
+        :param key: Key identifying credential and endpoint of rate limit
+        :param rate_limit: Rate limit to store
+        """
+
+        entries = self._read()
+        entries[key] = {
+            'refreshed_at': time.time(),
+            'rate_limit': dataclasses.asdict(rate_limit),
+        }
+
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            # Write to temporary file in same directory and rename it,
+            # so the cache file is replaced atomically
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.query-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as temp_file:
+                    json.dump(entries, temp_file)
+                os.replace(temp_path, self.path)
+            finally:
+                # Temporary file is gone unless writing or renaming failed
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(temp_path)
+        except OSError as err:
+            print(f'Warning: Could not write cache file {self.path}: {err}', file=sys.stderr)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                entries = json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as err:
+            print(f'Warning: Could not read cache file {self.path}: {err}', file=sys.stderr)
+            return {}
+
+        if not isinstance(entries, dict):
+            return {}
+        valid_entries: Dict[str, Any] = entries
+        return valid_entries
+
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        try:
+            import fcntl  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            # File locking is not available on this platform,
+            # concurrent invocations will not be coalesced.
+            yield
+            return
+
+        with contextlib.ExitStack() as stack:
+            try:
+                os.makedirs(os.path.dirname(self.lock_path) or '.', mode=0o700, exist_ok=True)
+                lock_file = stack.enter_context(open(self.lock_path, 'a', encoding='utf-8'))
+            except OSError as err:
+                print(f'Warning: Could not open lock file {self.lock_path}: {err}', file=sys.stderr)
+            else:
+                # Lock is released when lock file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
@@ -1,24 +1,205 @@
 #!/usr/bin/env python3
 
 import datetime
+import hashlib
 import re
 import sys
-
+import threading
+import time
+from concurrent.futures import Executor
+from enum import Enum
+
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Mapping
 from typing import Optional
+from typing import Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+from .adaptive_refresh import AdaptiveRefreshPolicy
+from .circuit_breaker import CircuitBreaker
+from .circuit_breaker import CircuitOpenError
 from .docker_rate_limit import DockerRateLimit
+from .endpoints import RATE_LIMIT_ENDPOINT
+from .endpoints import TOKEN_RECEIVE_ENDPOINT
+from .history import DEFAULT_HISTORY_SIZE
+from .history import RateLimitHistory
+from .instrumentation import EXPORTER_METRICS
+from .single_flight import SingleFlight
+from .token_cache import TokenCache
 
 
-TOKEN_RECEIVE_ENDPOINT = 'https://auth.docker.io/token?service=registry.docker.io&scope=repository:ratelimitpreview/test:pull'
-RATE_LIMIT_ENDPOINT = 'https://registry-1.docker.io/v2/ratelimitpreview/test/manifests/latest'
+# Refresh time of a cache that has never been filled
+CACHE_NEVER_REFRESHED = datetime.datetime.fromisoformat('1970-01-01T00:00:00')
 
 
-class DockerHubRequestor:
+def create_session(pool_size: int=10) -> requests.Session:
     """
-    Requestor that queries Docker Hub for the current rate limit.
+    Create session that keeps connections to Docker Hub alive and
+    reuses them for subsequent requests.
+
+    :param pool_size: Maximum number of connections kept open per host
+    :return: Session for requests to Docker Hub
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def check_token_response(status_code: int) -> None:
+    """
+    Check status code of response of Docker Hub token endpoint
+
+    :param status_code: HTTP status code of response
+    :raises RequestException: If Docker Hub did not respond with status code
+        HTTP-200.
+    """
+
+    EXPORTER_METRICS.upstream_response('token', status_code)
+    if status_code != 200:
+        raise RequestException(
+            'Error when requesting token. '
+            f'Response code was {status_code} instead of 200.')
+
+
+def parse_token_response(response_json: Any) -> Tuple[str, Optional[float]]:
+    """
+    Extract token from JSON response of Docker Hub token endpoint
+
+    :param response_json: Decoded JSON response of token endpoint
+    :raises KeyError: If JSON returned by Docker Hub is malformed and
+        does not contain expected keys.
+    :return: Token and number of seconds the token is valid for (None if
+        not specified by Docker Hub)
+    """
+
+    # Check for malformed json
+    if not isinstance(response_json, dict) or 'token' not in response_json:
+        raise KeyError(
+            'Error when parsing response: '
+            'Could not find "token" key in response.')
+    if not isinstance(response_json['token'], str):
+        raise KeyError(
+            'Error when parsing response: '
+            '"token" key is not of type string.')
+
+    # Lifetime of token is optional
+    expires_in = response_json.get('expires_in')
+    if not isinstance(expires_in, (int, float)):
+        expires_in = None
+
+    return str(response_json['token']), expires_in
+
+
+def parse_rate_limit_header(value: str) -> Tuple[int, Optional[int]]:
+    """
+    Parse value of RateLimit-Limit or RateLimit-Remaining header of the
+    form "100;w=21600"
+
+    :param value: Value of header
+    :raises ValueError: If value is malformed
+    :return: Number of pulls and length of window in seconds (None if
+        window is not specified)
+    """
+
+    match = re.match(r'^\s*(\d+)\s*(?:;\s*w=(\d+))?', value)
+    if match is None:
+        raise ValueError(f'Error when parsing response: Malformed rate limit "{value}"')
+
+    window = match.group(2)
+    return int(match.group(1)), int(window) if window is not None else None
+
+
+def parse_rate_limit_response(status_code: int, headers: Mapping[str, str]) -> DockerRateLimit:
+    """
+    Extract rate limit from response of Docker Hub to HEAD request of
+    rate limit endpoint
+
+    :param status_code: HTTP status code of response
+    :param headers: Headers of response. Lookup of header names has to be
+        case-insensitive or header names have to be lower case.
+    :raises KeyError: If response does not contain expected headers.
+    :raises RequestException: If Docker Hub did not respond with status code
+        HTTP-200 or HTTP-429.
+    :return: Information about rate limit returned by Docker Hub
+    """
+
+    if status_code == 200:
+        # Check that all required headers have been returned
+        required_headers = [
+            'ratelimit-limit',
+            'ratelimit-remaining',
+            'docker-ratelimit-source']
+        for required_header in required_headers:
+            try:
+                _ = headers[required_header]
+            except KeyError as err:
+                print((
+                    'Error: Response did not contain contain expected '
+                    f'header "{required_header}"'),
+                    file=sys.stderr)
+                raise err
+
+        # Extract response headers
+        response_headers = {key: headers[key] for key in required_headers}
+
+        # Extract relevant information from response headers
+        rate_limit_max, rate_limit_window = parse_rate_limit_header(
+            response_headers['ratelimit-limit'])
+        rate_limit_remaining, _ = parse_rate_limit_header(
+            response_headers['ratelimit-remaining'])
+        rate_limit_identifier = response_headers['docker-ratelimit-source']
+
+        return DockerRateLimit(
+            rate_limit_max=rate_limit_max,
+            rate_limit_remaining=rate_limit_remaining,
+            identifier=rate_limit_identifier,
+            rate_limit_window=rate_limit_window,
+            refreshed_at=time.time())
+
+    if status_code == 429:
+        return DockerRateLimit(
+            rate_limit_max=0,
+            rate_limit_remaining=0,
+            refreshed_at=time.time())
+
+    raise RequestException(
+        'Error when requesting rate limit. '
+        f'Response code was {status_code} instead of 200 or 429.')
+
+
+class CacheState(Enum):
+    """State of cached rate limit"""
+
+    # Cached information can be returned
+    FRESH = 'fresh'
+
+    # Cached information can be returned but has to be refreshed
+    STALE = 'stale'
+
+    # Cached information has to be refreshed before it can be returned
+    EXPIRED = 'expired'
+
+
+# Result of cache lookup for each state of cache as reported in metrics
+CACHE_LOOKUP_RESULTS = {
+    CacheState.FRESH: 'hit',
+    CacheState.STALE: 'stale',
+    CacheState.EXPIRED: 'miss',
+}
+
+
+class DockerHubRequestorBase:  # pylint: disable=too-many-instance-attributes
+    """
+    Caching and credential handling shared by blocking and asyncio
+    requestors.
 
     :param user: User to request token for.
         None for anonymous token.
@@ -26,12 +207,39 @@ class DockerHubRequestor:
         None for anonymous token.
     :param cache_ttl: Number of seconds information should be cached
         before querying Docker Hub for fresh information.
+    :param stale_while_revalidate: Number of seconds after cache expiry
+        during which stale information is returned immediately while it is
+        being refreshed in the background.
+    :param stale_if_error: Number of seconds after cache expiry during
+        which stale information is returned if refreshing it failed.
+    :param token_cache: Cache for tokens used to authorize to Docker Hub.
+        Can be shared between requestors. A new one is created if not given.
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of Docker Hub manifest whose HEAD
+        response reports the rate limit
+    :param history_size: Number of refreshed rate limits kept in history
+    :param adaptive_refresh: Policy choosing the cache TTL after every
+        refresh. The cache TTL stays fixed if not given.
+    :param failure_threshold: Number of consecutive failed refreshes after
+        which Docker Hub is not queried for a while. 0 to keep querying.
+    :param max_backoff: Maximum number of seconds Docker Hub is not queried
+        after failed refreshes
     """
 
+    # pylint: disable=too-many-arguments
     def __init__(self,
             user: Optional[str]=None,
             password: Optional[str]=None,
-            cache_ttl: int=0):
+            cache_ttl: int=0,
+            stale_while_revalidate: int=0,
+            stale_if_error: int=0,
+            token_cache: Optional[TokenCache]=None,
+            token_endpoint: str=TOKEN_RECEIVE_ENDPOINT,
+            rate_limit_endpoint: str=RATE_LIMIT_ENDPOINT,
+            history_size: int=DEFAULT_HISTORY_SIZE,
+            adaptive_refresh: Optional[AdaptiveRefreshPolicy]=None,
+            failure_threshold: int=3,
+            max_backoff: float=300):
 
         self.user = user
         self.password = password
@@ -39,126 +247,529 @@ class DockerHubRequestor:
             rate_limit_max=0,
             rate_limit_remaining=0)
         self.cache_ttl = cache_ttl
-        self.cache_last_refresh = datetime.datetime.fromisoformat('1970-01-01T00:00:00')
+        self.cache_last_refresh = CACHE_NEVER_REFRESHED
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+
+        # Protects rate_limit and cache_last_refresh,
+        # which have to be read and written together
+        self._cache_lock = threading.Lock()
+
+        if token_cache is None:
+            token_cache = TokenCache()
+        self.token_cache: TokenCache = token_cache
 
-    def get_rate_limit(self) -> DockerRateLimit:
+        self.token_endpoint = token_endpoint
+        self.rate_limit_endpoint = rate_limit_endpoint
+
+        # Every refreshed rate limit, for forecasting when it is exhausted
+        self.history = RateLimitHistory(history_size)
+        self.adaptive_refresh = adaptive_refresh
+
+        # Stops querying Docker Hub while it keeps failing
+        self.circuit_breaker = CircuitBreaker(failure_threshold, max_delay=max_backoff)
+
+    @property
+    def cache_age(self) -> float:
+        """
+        Number of seconds since information was last refreshed
+
+        :return: Age of cached information in seconds
+        """
+
+        with self._cache_lock:
+            last_refresh = self.cache_last_refresh
+        return self._age(last_refresh)
+
+    @staticmethod
+    def _age(last_refresh: datetime.datetime) -> float:
+        now = datetime.datetime.now()
+        return (now - last_refresh) / datetime.timedelta(seconds=1)
+
+    def lookup_cache(self) -> Tuple[DockerRateLimit, CacheState]:
+        """
+        Return cached information and whether it can be returned as is.
+
+        :return: Cached information and its state
+        """
+
+        with self._cache_lock:
+            rate_limit = self.rate_limit
+            last_refresh = self.cache_last_refresh
+        cache_age = self._age(last_refresh)
+
+        if cache_age <= self.cache_ttl:
+            return rate_limit, CacheState.FRESH
+        if (last_refresh != CACHE_NEVER_REFRESHED
+                and cache_age <= self.cache_ttl + self.stale_while_revalidate):
+            return rate_limit, CacheState.STALE
+        return rate_limit, CacheState.EXPIRED
+
+    def store_in_cache(self, rate_limit: DockerRateLimit) -> None:
+        """
+        Store freshly requested information in cache
+
+        :param rate_limit: Information to store
+        """
+
+        self.circuit_breaker.record_success()
+        with self._cache_lock:
+            self.rate_limit = rate_limit
+            self.cache_last_refresh = datetime.datetime.now()
+        self.history.record(
+            time.time(),
+            rate_limit.rate_limit_max,
+            rate_limit.rate_limit_remaining,
+            rate_limit.identifier)
+        if self.adaptive_refresh is not None:
+            self.cache_ttl = self.adaptive_refresh.next_interval(
+                rate_limit,
+                self.history.consumption_rate)
+        EXPORTER_METRICS.cache_refreshes.inc('success')
+
+    def cached_rate_limit(self) -> Optional[DockerRateLimit]:
+        """
+        Return cached information if it is fresh or if it is stale and can
+        be returned while it is refreshed in the background.
+
+        :return: Cached information or None if it has to be refreshed
+            before it can be returned
+        """
+
+        rate_limit, state = self.lookup_cache()
+        EXPORTER_METRICS.cache_lookups.inc(CACHE_LOOKUP_RESULTS[state])
+        if state == CacheState.EXPIRED:
+            return None
+
+        # Serve stale information while refreshing in background
+        if state == CacheState.STALE:
+            self.revalidate_in_background()
+        return rate_limit
+
+    def revalidate_in_background(self) -> None:
+        """
+        Refresh cached information in the background unless a background
+        refresh is already running.
+
+        :raises NotImplementedError: Has to be implemented by subclasses
+        """
+
+        raise NotImplementedError()
+
+    def stale_after_error(self, err: Exception) -> DockerRateLimit:
+        """
+        Return cached information after refreshing it failed if it is
+        within the stale-if-error grace period or if Docker Hub is not
+        queried because of previous failures, otherwise raise the error.
+
+        :param err: Error that occurred while refreshing
+        :raises Exception: The given error if cached information can not be
+            returned
+        :return: Cached information
+        """
+
+        with self._cache_lock:
+            rate_limit = self.rate_limit
+            last_refresh = self.cache_last_refresh
+        if last_refresh == CACHE_NEVER_REFRESHED:
+            raise err
+
+        # While Docker Hub is not queried the last known information is
+        # better than waiting for nothing, regardless of its age
+        if (not isinstance(err, CircuitOpenError)
+                and self._age(last_refresh) > self.cache_ttl + self.stale_if_error):
+            raise err
+
+        print(
+            f'Warning: Serving stale rate limit because refresh failed: {err}',
+            file=sys.stderr)
+        EXPORTER_METRICS.stale_responses.inc()
+        return rate_limit
+
+    def record_refresh_error(self) -> None:
+        """
+        Count failed refresh, so Docker Hub is not queried for a while if
+        it keeps failing
+        """
+
+        self.circuit_breaker.record_failure()
+        EXPORTER_METRICS.cache_refreshes.inc('error')
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters useful for debugging the behavior of
+        the circuit breaker and token cache of this requestor.
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        return {
+            'circuit_breaker_failures': self.circuit_breaker.failures,
+            'circuit_breaker_rejected': self.circuit_breaker.rejected,
+            'token_cache_hits': self.token_cache.hits,
+            'token_cache_misses': self.token_cache.misses,
+        }
+
+    @property
+    def token_cache_key(self) -> Tuple[Optional[str], Optional[str], str]:
+        """
+        Key identifying credential and endpoint (including scope) of the
+        token in the token cache. Requestors of the same user with a
+        different password must not share a token, so the password is part
+        of the key, hashed to not keep it around in another place.
+
+        :return: Key for token cache
+        """
+
+        credential_hash = None
+        if self.user is not None and self.password is not None:
+            credential = f'{self.user}:{self.password}'.encode()
+            credential_hash = hashlib.sha256(credential).hexdigest()
+        return (self.user, credential_hash, self.token_endpoint)
+
+
+def background_refresh_failed(err: Exception) -> None:
+    """
+    Report that refreshing cached information in the background failed
+
+    :param err: Error that occurred while refreshing
+    """
+
+    print(f'Error: Refreshing rate limit in background failed: {err}', file=sys.stderr)
+
+
+def oldest_cache_age(requestors: Iterable[DockerHubRequestorBase]) -> float:
+    """
+    Return age of the least recently refreshed cache of requestors.
+    Requestors whose cache has never been refreshed are ignored.
+
+    :param requestors: Requestors to check
+    :return: Age of oldest cached information in seconds
+    """
+
+    return max((
+        requestor.cache_age
+        for requestor in requestors
+        if requestor.cache_last_refresh != CACHE_NEVER_REFRESHED), default=0)
+
+
+class DockerHubRequestor(DockerHubRequestorBase):
+    """
+    Requestor that queries Docker Hub for the current rate limit.
+    Instances are safe to share between threads.
+
+    :param user: User to request token for.
+        None for anonymous token.
+    :param password: Password for user to request token for.
+        None for anonymous token.
+    :param cache_ttl: Number of seconds information should be cached
+        before querying Docker Hub for fresh information.
+    :param single_flight: Coalesces concurrent refreshes of this
+        requestor. Can be shared between requestors, refreshes of different
+        requestors are never coalesced. A new one is created if not given.
+    :param stale_while_revalidate: Number of seconds after cache expiry
+        during which stale information is returned immediately while it is
+        being refreshed in the background.
+    :param stale_if_error: Number of seconds after cache expiry during
+        which stale information is returned if refreshing it failed.
+    :param token_cache: Cache for tokens used to authorize to Docker Hub.
+        Can be shared between requestors. A new one is created if not given.
+    :param session: Session used for requests to Docker Hub. Can be shared
+        between requestors. A new one is created if not given.
+    :param connect_timeout: Number of seconds to wait for a connection to
+        Docker Hub to be established
+    :param read_timeout: Number of seconds to wait for Docker Hub to respond
+    :param token_endpoint: URL of Docker Hub token endpoint
+    :param rate_limit_endpoint: URL of Docker Hub manifest whose HEAD
+        response reports the rate limit
+    :param history_size: Number of refreshed rate limits kept in history
+    :param adaptive_refresh: Policy choosing the cache TTL after every
+        refresh. The cache TTL stays fixed if not given.
+    :param failure_threshold: Number of consecutive failed refreshes after
+        which Docker Hub is not queried for a while. 0 to keep querying.
+    :param max_backoff: Maximum number of seconds Docker Hub is not queried
+        after failed refreshes
+    :param executor: Executor running background refreshes. Can be shared
+        between requestors to limit the number of concurrent refreshes.
+        Every background refresh runs in its own thread if not given.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def __init__(self,
+            user: Optional[str]=None,
+            password: Optional[str]=None,
+            cache_ttl: int=0,
+            single_flight: Optional[SingleFlight[DockerRateLimit]]=None,
+            stale_while_revalidate: int=0,
+            stale_if_error: int=0,
+            token_cache: Optional[TokenCache]=None,
+            session: Optional[requests.Session]=None,
+            connect_timeout: float=10,
+            read_timeout: float=10,
+            token_endpoint: str=TOKEN_RECEIVE_ENDPOINT,
+            rate_limit_endpoint: str=RATE_LIMIT_ENDPOINT,
+            history_size: int=DEFAULT_HISTORY_SIZE,
+            adaptive_refresh: Optional[AdaptiveRefreshPolicy]=None,
+            failure_threshold: int=3,
+            max_backoff: float=300,
+            executor: Optional[Executor]=None):
+
+        super().__init__(
+            user, password, cache_ttl,
+            stale_while_revalidate, stale_if_error, token_cache,
+            token_endpoint, rate_limit_endpoint, history_size,
+            adaptive_refresh, failure_threshold, max_backoff)
+
+        self.executor = executor
+
+        # Whether a background refresh is running, protected by _cache_lock
+        self._revalidating = False
+
+        if single_flight is None:
+            single_flight = SingleFlight()
+        self.single_flight: SingleFlight[DockerRateLimit] = single_flight
+
+        if session is None:
+            session = create_session()
+        self.session: requests.Session = session
+        self.timeout = (connect_timeout, read_timeout)
+
+    def get_rate_limit(self, allow_stale: bool=True) -> DockerRateLimit:
         """
         Returns information about Docker Hub rate limiting.
         If cached information is fresh return information from cache.
         If cache is stale request current rate limit from Docker Hub,
         store information in cache and return it.
+        Stale information is returned instead while it is refreshed in the
+        background or if refreshing failed, as long as it is within the
+        configured stale-while-revalidate or stale-if-error grace periods.
+
+        :param allow_stale: Whether cached information may be returned if
+            refreshing failed. False to always raise the error, e.g.
+            CircuitOpenError while Docker Hub is not queried.
+        :raises RequestException: If Docker Hub could not be queried or is not
+            queried because of previous failures (CircuitOpenError) and
+            cached information can not be returned
+        :raises KeyError: If response by Docker Hub is malformed and cached
+            information can not be returned
+        :raises ValueError: If response by Docker Hub contains invalid
+            values and cached information can not be returned
+        :return: Information about rate limit
+        """
+
+        cached = self.cached_rate_limit()
+        if cached is not None:
+            return cached
+
+        try:
+            return self.revalidate()
+        except (RequestException, KeyError, ValueError) as err:
+            if not allow_stale:
+                raise
+            return self.stale_after_error(err)
+
+    @property
+    def coalesced_refreshes(self) -> int:
+        """
+        Number of refreshes that were not sent to Docker Hub because
+        another refresh of this requestor was already in flight.
+
+        :return: Number of coalesced refreshes
+        """
+
+        return self.single_flight.coalesced_calls
+
+    def connection_stats(self) -> Dict[str, int]:
+        """
+        Return statistics about connections to Docker Hub opened by the
+        session of this requestor.
+
+        :return: Dictionary with number of requests sent, number of
+            connections opened and number of requests that reused an
+            already open connection
+        """
+
+        requests_sent = 0
+        connections = 0
+        for adapter in set(self.session.adapters.values()):
+            if not isinstance(adapter, HTTPAdapter):
+                continue
+            # Container of pools does not support iteration,
+            # keys() returns a thread-safe copy instead
+            pools = adapter.poolmanager.pools
+            pool_keys = pools.keys()
+            for key in pool_keys:
+                try:
+                    pool = pools[key]
+                except KeyError:
+                    # Pool has been evicted in the meantime
+                    continue
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+
+        return {
+            'upstream_requests': requests_sent,
+            'upstream_connections': connections,
+            'upstream_connections_reused': max(0, requests_sent - connections),
+        }
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters useful for debugging the behavior of
+        caches and connections of this requestor.
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        metrics = super().debug_metrics()
+        metrics['coalesced_refreshes'] = self.coalesced_refreshes
+        metrics.update(self.connection_stats())
+        return metrics
+
+    def revalidate(self) -> DockerRateLimit:
+        """
+        Refresh cached information regardless of the age of the cache.
+        Only one refresh of this requestor is in flight, concurrent callers
+        wait for its result.
 
         :return: Information about rate limit
         """
 
-        # Check age of cache
-        now = datetime.datetime.now()
-        cache_age = (now - self.cache_last_refresh) / datetime.timedelta(seconds=1)
+        # Keyed by requestor, not user name: accounts of the same user or
+        # anonymous accounts must each fill their own cache
+        return self.single_flight.do(id(self), self.refresh)
 
-        # If cache is stale then refresh information
-        if cache_age > self.cache_ttl:
-            self.rate_limit = self.get_rate_limit_from_docker_hub()
-            self.cache_last_refresh = datetime.datetime.now()
+    def revalidate_in_background(self) -> None:
+        """
+        Refresh cached information in the executor or a background thread
+        unless a background refresh is already running.
+        """
 
-        # Return information from cache
-        return self.rate_limit
+        with self._cache_lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        def run() -> None:
+            try:
+                self.revalidate()
+            except (RequestException, KeyError, ValueError) as err:
+                background_refresh_failed(err)
+            finally:
+                with self._cache_lock:
+                    self._revalidating = False
+
+        if self.executor is not None:
+            self.executor.submit(run)
+        else:
+            threading.Thread(target=run, name='revalidate', daemon=True).start()
+
+    def refresh(self) -> DockerRateLimit:
+        """
+        Request current rate limit from Docker Hub and store it in cache
+        regardless of the age of the cache.
+        Raises CircuitOpenError without querying Docker Hub if it is not
+        queried because of previous failures.
+
+        :raises Exception: Any error raised while requesting rate limit
+        :return: Information about rate limit
+        """
+
+        # Fail immediately instead of waiting for Docker Hub while it is
+        # failing or has asked to back off
+        self.circuit_breaker.before_request()
+
+        # Refresh information without holding the lock
+        # to not block other threads while waiting for Docker Hub
+        try:
+            rate_limit = self.get_rate_limit_from_docker_hub()
+        except Exception:
+            self.record_refresh_error()
+            raise
+
+        self.store_in_cache(rate_limit)
+        return rate_limit
 
     def request_token(self) -> str:
         """
-        Request token to authorize to Docker Hub with
+        Return token to authorize to Docker Hub with.
+        A cached token is returned if it is still valid, otherwise a new
+        token is requested from Docker Hub.
 
-        :raises KeyError: If JSON returned by Docker Hub is malformed and
-            does not contain expected keys.
-        :raises RequestException: If Docker Hub does not respond with status code
-            HTTP-200.
         :return: Token for given user or anonymous token to authorize to Docker
             Hub with
         """
 
-        if self.user is not None and self.password is not None:
-            req = requests.get(TOKEN_RECEIVE_ENDPOINT, timeout=10, auth=(self.user, self.password))
-        else:
-            req = requests.get(TOKEN_RECEIVE_ENDPOINT, timeout=10)
+        token = self.token_cache.get(self.token_cache_key)
+        if token is None:
+            token, expires_in = self.request_token_from_docker_hub()
+            self.token_cache.put(self.token_cache_key, token, expires_in)
+
+        return token
 
-        # Check for correct status code
-        if req.status_code != 200:
-            raise RequestException(
-                'Error when requesting token. '
-                f'Response code was {req.status_code} instead of 200.')
+    def request_token_from_docker_hub(self) -> Tuple[str, Optional[float]]:
+        """
+        Request new token to authorize to Docker Hub with
 
-        response_json = req.json()
+        :raises KeyError: If JSON returned by Docker Hub is malformed and
+            does not contain expected keys.
+        :raises RequestException: If Docker Hub does not respond with status code
+            HTTP-200.
+        :return: Token for given user or anonymous token to authorize to Docker
+            Hub with and number of seconds the token is valid for (None if
+            not specified by Docker Hub)
+        """
 
-        # Check for malformed json
-        if 'token' not in response_json:
-            raise KeyError(
-                'Error when parsing response: '
-                'Could not find "token" key in response.')
-        if not isinstance(response_json['token'], str):
-            raise KeyError(
-                'Error when parsing response: '
-                '"token" key is not of type string.')
+        with EXPORTER_METRICS.upstream_request('token'):
+            if self.user is not None and self.password is not None:
+                req = self.session.get(
+                    self.token_endpoint,
+                    timeout=self.timeout,
+                    auth=(self.user, self.password))
+            else:
+                req = self.session.get(self.token_endpoint, timeout=self.timeout)
+        self.circuit_breaker.note_response(req.status_code, req.headers)
+        check_token_response(req.status_code)
 
-        return str(response_json['token'])
+        return parse_token_response(req.json())
 
     def get_rate_limit_from_docker_hub(self) -> DockerRateLimit:
         """
         Returns information about Docker Hub rate limiting by actively
         querying Docker Hub for that information.
 
-        :raises KeyError: If JSON returned by Docker Hub is missing malformed and
-            does not contain expected keys.
+        :raises KeyError: If response by Docker Hub is malformed and does
+            not contain expected headers (see :func:`parse_rate_limit_response`).
         :raises RequestException: If Docker Hub does not respond with status code
             HTTP-200 or HTTP-429.
+        :raises ValueError: If rate limit headers returned by Docker Hub are
+            malformed.
         :return: Information about rate limit returned by Docker Hub
         """
 
-        token = self.request_token()
+        req = self.request_rate_limit(self.request_token())
 
-        headers = {'Authorization': f'Bearer {token}'}
-        req = requests.head(RATE_LIMIT_ENDPOINT, timeout=10, headers=headers)
-
-        if req.status_code == 200:
-            # Check that all required headers have been returned
-            required_headers = [
-                'ratelimit-limit',
-                'ratelimit-remaining',
-                'docker-ratelimit-source']
-            for required_header in required_headers:
-                try:
-                    _ = req.headers[required_header]
-                except KeyError as err:
-                    print((
-                        'Error: Response did not contain contain expected '
-                        f'header "{required_header}"'),
-                        file=sys.stderr)
-                    raise err
-
-            # Extract response headers
-            response_headers = {key: req.headers[key] for key in required_headers}
-
-            # Extract relevant information from response headers
-            rate_limit_max = int(
-                re.sub(
-                    r'^(\d*);w=(.*)$', r'\1',
-                    response_headers['ratelimit-limit'])
-                )
-            rate_limit_remaining = int(
-                re.sub(
-                    r'^(\d*);w=(.*)$', r'\1',
-                    response_headers['ratelimit-remaining'])
-                )
-            rate_limit_identifier = response_headers['docker-ratelimit-source']
-
-            return DockerRateLimit(
-                rate_limit_max=rate_limit_max,
-                rate_limit_remaining=rate_limit_remaining,
-                identifier=rate_limit_identifier)
-
-        if req.status_code == 429:
-            return DockerRateLimit(
-                rate_limit_max=0,
-                rate_limit_remaining=0)
+        # Cached token might have been revoked, retry once with a new one
+        if req.status_code == 401:
+            self.token_cache.invalidate(self.token_cache_key)
+            req = self.request_rate_limit(self.request_token())
 
-        raise RequestException(
-            'Error when requesting rate limit. '
-            f'Response code was {req.status_code} instead of 200 or 429.')
+        return parse_rate_limit_response(req.status_code, req.headers)
+
+    def request_rate_limit(self, token: str) -> requests.Response:
+        """
+        Send HEAD request to rate limit endpoint of Docker Hub
+
+        :param token: Token to authorize with
+        :return: Response of Docker Hub
+        """
+
+        headers = {'Authorization': f'Bearer {token}'}
+        with EXPORTER_METRICS.upstream_request('rate_limit'):
+            req = self.session.head(
+                self.rate_limit_endpoint,
+                timeout=self.timeout,
+                headers=headers)
+        EXPORTER_METRICS.upstream_response('rate_limit', req.status_code)
+        self.circuit_breaker.note_response(req.status_code, req.headers)
+        return req
@@ -1,17 +1,52 @@
 #!/usr/bin/env python3
 
 import json
+import re
 from dataclasses import dataclass
+from dataclasses import field
 
 from typing import Dict
+from typing import List
 from typing import Optional
+from typing import Sequence
+from typing import Tuple
 from typing import Union
 
-import yaml
-
 from .output_format import RateLimitOutputFormat
 
 
+# Name, description and attribute of DockerRateLimit of rate limit metrics
+RATE_LIMIT_METRICS = (
+    ('docker_hub_rate_limit_max',
+     'Maximum image pulls for identifier (best case)',
+     'rate_limit_max'),
+    ('docker_hub_rate_limit_remaining',
+     'Currently remaining image pulls for identifier',
+     'rate_limit_remaining'),
+    ('docker_hub_rate_limit_used',
+     'Currently used up image pulls for identifier',
+     'rate_limit_used'),
+)
+
+# Metric family header, name and attribute of DockerRateLimit of rate limit
+# metrics in OpenMetrics format
+OPENMETRICS_METRICS = tuple(
+    (f'# TYPE {name} gauge\n# HELP {name} {description}\n'.encode(),
+     name.encode(),
+     attr)
+    for name, description, attr in RATE_LIMIT_METRICS)
+
+# Attributes of rate limit as JSON object members without opening brace
+JSON_OBJECT_FIELDS = (
+    b'"rate_limit_max":%d,"rate_limit_remaining":%d,"identifier":%s,"rate_limit_used":%d}')
+
+# Characters that require quoting a CSV field
+CSV_QUOTED_CHARACTERS = re.compile('[,"\r\n]')
+
+# Header line of rate limits in CSV format
+CSV_HEADER = b'rate_limit_max,rate_limit_remaining,identifier,rate_limit_used\n'
+
+
 @dataclass
 class DockerRateLimit:
     """Contains information about Docker Hub rate limiting"""
@@ -20,6 +55,14 @@ class DockerRateLimit:
     rate_limit_remaining: int
     identifier: Optional[str]=None
 
+    # Number of seconds the rate limit applies to, None if not reported.
+    # Only used internally, so it is not part of the output.
+    rate_limit_window: Optional[int]=None
+
+    # Unix timestamp of when the rate limit was received from Docker Hub,
+    # None if unknown. Only output as timestamp of OpenMetrics samples.
+    refreshed_at: Optional[float]=field(default=None, compare=False)
+
     @property
     def rate_limit_used(self) -> int:  # pylint: disable=missing-function-docstring
         return self.rate_limit_max - self.rate_limit_remaining
@@ -37,7 +80,8 @@ class DockerRateLimit:
             'identifier',
             'rate_limit_used'
         ]
-        return {a: getattr(self, a) for a in attrs}
+        data: Dict[str, Union[Optional[str], int]] = {a: getattr(self, a) for a in attrs}
+        return data
 
     def to_output_format(self, output_format: RateLimitOutputFormat) -> str:
         """
@@ -54,7 +98,27 @@ class DockerRateLimit:
         if output_format == RateLimitOutputFormat.YAML:
             return self.to_yaml()
 
-        return None  # type: ignore
+        return self.render(output_format).decode('utf-8').rstrip('\n')
+
+    def render(self, output_format: RateLimitOutputFormat) -> bytes:
+        """
+        Return attributes of this object in the requested format encoded
+        as UTF-8 and terminated by a newline character
+
+        :param output_format: Format of output
+        :return: Attributes of this object formatted in requested format
+        """
+
+        if output_format == RateLimitOutputFormat.JSON_COMPACT:
+            return self.to_compact_json()
+        if output_format == RateLimitOutputFormat.NDJSON:
+            return self.to_ndjson()
+        if output_format == RateLimitOutputFormat.CSV:
+            return self.to_csv()
+        if output_format == RateLimitOutputFormat.OPENMETRICS:
+            return self.to_openmetrics()
+
+        return self.to_output_format(output_format).encode('utf-8') + b'\n'
 
     def to_json(self, indent: int=4) -> str:
         """
@@ -74,19 +138,12 @@ class DockerRateLimit:
         :return: String representation of this object as prometheus metrics
         """
 
-        lines = [
-            '# HELP Maximum image pulls for identifier (best case)',
-            (f'docker_hub_rate_limit_max{{identifier="{self.identifier}"}} '
-            f'{self.rate_limit_max}'),
-
-            '# HELP Currently remaining image pulls for identifier',
-            (f'docker_hub_rate_limit_remaining{{identifier="{self.identifier}"}} '
-            f'{self.rate_limit_remaining}'),
-
-            '# HELP Currently used up image pulls for identifier',
-            (f'docker_hub_rate_limit_used{{identifier="{self.identifier}"}} '
-            f'{self.rate_limit_used}'),
-        ]
+        identifier = escape_label_value(str(self.identifier))
+        lines = []
+        for name, description, attr in RATE_LIMIT_METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name}{{identifier="{identifier}"}} {getattr(self, attr)}')
 
         return '\n'.join(lines)
 
@@ -97,7 +154,330 @@ class DockerRateLimit:
         :return: YAML formatted string representation of this object
         """
 
+        # PyYAML is slow to import and only needed for this format
+        import yaml  # pylint: disable=import-outside-toplevel
+
         dict_representation = self.asdict()
         yaml_repr = yaml.safe_dump(dict_representation, explicit_start=True)
         yaml_repr = yaml_repr.strip()
         return yaml_repr
+
+    def to_compact_json(self) -> bytes:
+        """
+        Return attributes of this object as JSON without any whitespace
+
+        :return: JSON formatted representation of this object
+        """
+
+        buffer = bytearray()
+        write_json_object(buffer, self)
+        buffer += b'\n'
+        return bytes(buffer)
+
+    def to_ndjson(self) -> bytes:
+        """
+        Return attributes of this object as a single line of JSON
+
+        :return: Newline-delimited JSON representation of this object
+        """
+
+        return self.to_compact_json()
+
+    def to_csv(self) -> bytes:
+        """
+        Return attributes of this object as CSV with header line
+
+        :return: CSV formatted representation of this object
+        """
+
+        buffer = bytearray(CSV_HEADER)
+        write_csv_row(buffer, self)
+        return bytes(buffer)
+
+    def to_openmetrics(self) -> bytes:
+        """
+        Return attributes of this object as metrics in OpenMetrics text
+        format, with the time of the refresh as timestamp of the samples
+
+        :return: Representation of this object as OpenMetrics exposition
+        """
+
+        labels = b'identifier="%s"' % escape_label_value(str(self.identifier)).encode('utf-8')
+        return render_openmetrics([(labels, self)])
+
+
+def encode_json_string(value: Optional[str]) -> bytes:
+    """
+    Encode string as JSON
+
+    :param value: String to encode
+    :return: Quoted and escaped string or null if there is no string
+    """
+
+    if value is None:
+        return b'null'
+    return json.dumps(value).encode('ascii')
+
+
+def encode_csv_field(value: Optional[str]) -> bytes:
+    """
+    Encode string as CSV field, quoting it if necessary
+
+    :param value: String to encode
+    :return: Field or empty field if there is no string
+    """
+
+    if value is None:
+        return b''
+    if CSV_QUOTED_CHARACTERS.search(value) is not None:
+        value = '"' + value.replace('"', '""') + '"'
+    return value.encode('utf-8')
+
+
+def write_json_object(
+        buffer: bytearray,
+        rate_limit: DockerRateLimit,
+        account: Optional[str]=None) -> None:
+    """
+    Append rate limit as JSON object without any whitespace to buffer
+
+    :param buffer: Buffer to append to
+    :param rate_limit: Rate limit to append
+    :param account: Name of account of rate limit, None to leave it out
+    """
+
+    buffer += b'{'
+    if account is not None:
+        buffer += b'"account":%s,' % encode_json_string(account)
+    buffer += JSON_OBJECT_FIELDS % (
+        rate_limit.rate_limit_max,
+        rate_limit.rate_limit_remaining,
+        encode_json_string(rate_limit.identifier),
+        rate_limit.rate_limit_used)
+
+
+def write_csv_row(
+        buffer: bytearray,
+        rate_limit: DockerRateLimit,
+        account: Optional[str]=None) -> None:
+    """
+    Append rate limit as CSV row to buffer
+
+    :param buffer: Buffer to append to
+    :param rate_limit: Rate limit to append
+    :param account: Name of account of rate limit, None to leave it out
+    """
+
+    if account is not None:
+        buffer += encode_csv_field(account) + b','
+    buffer += b'%d,%d,%s,%d\n' % (
+        rate_limit.rate_limit_max,
+        rate_limit.rate_limit_remaining,
+        encode_csv_field(rate_limit.identifier),
+        rate_limit.rate_limit_used)
+
+
+def render_openmetrics(labeled: Sequence[Tuple[bytes, DockerRateLimit]]) -> bytes:
+    """
+    Render rate limits as metrics in OpenMetrics text format
+
+    :param labeled: Rate limits and labels of their samples
+    :return: OpenMetrics exposition terminated by EOF marker
+    """
+
+    buffer = bytearray()
+    for header, name, attr in OPENMETRICS_METRICS:
+        buffer += header
+        for labels, rate_limit in labeled:
+            buffer += b'%s{%s} %d' % (name, labels, getattr(rate_limit, attr))
+            if rate_limit.refreshed_at is not None:
+                buffer += b' %.3f' % rate_limit.refreshed_at
+            buffer += b'\n'
+    buffer += b'# EOF\n'
+    return bytes(buffer)
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escape string for use as label value in prometheus metrics
+
+    :param value: Label value to escape
+    :return: Escaped label value
+    """
+
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@dataclass
+class DockerRateLimitGroup:
+    """Contains information about Docker Hub rate limiting of multiple accounts"""
+
+    rate_limits: Dict[str, DockerRateLimit]
+
+    def consists_of(self, rate_limits: Dict[str, DockerRateLimit]) -> bool:
+        """
+        Check whether this group contains exactly the given rate limit
+        objects (not just equal ones).
+
+        :param rate_limits: Rate limit of each account
+        :return: True if this group contains the same objects for the
+            same accounts
+        """
+
+        return (
+            self.rate_limits.keys() == rate_limits.keys()
+            and all(
+                self.rate_limits[name] is rate_limit
+                for name, rate_limit in rate_limits.items()))
+
+    def asdicts(self) -> List[Dict[str, Union[Optional[str], int]]]:
+        """
+        Return rate limits of all accounts as list of dictionaries.
+
+        :return: List of dictionary representations of rate limits, each
+            including the name of its account
+        """
+
+        dicts: List[Dict[str, Union[Optional[str], int]]] = []
+        for account, rate_limit in self.rate_limits.items():
+            dict_representation: Dict[str, Union[Optional[str], int]] = {'account': account}
+            dict_representation.update(rate_limit.asdict())
+            dicts.append(dict_representation)
+        return dicts
+
+    def to_output_format(self, output_format: RateLimitOutputFormat) -> str:
+        """
+        Return rate limits of all accounts in the requested format
+
+        :param output_format: Format of output
+        :return: Rate limits formatted in requested format
+        """
+
+        if output_format == RateLimitOutputFormat.JSON:
+            return self.to_json()
+        if output_format == RateLimitOutputFormat.PROMETHEUS:
+            return self.to_prometheus()
+        if output_format == RateLimitOutputFormat.YAML:
+            return self.to_yaml()
+
+        return self.render(output_format).decode('utf-8').rstrip('\n')
+
+    def render(self, output_format: RateLimitOutputFormat) -> bytes:
+        """
+        Return rate limits of all accounts in the requested format encoded
+        as UTF-8 and terminated by a newline character
+
+        :param output_format: Format of output
+        :return: Rate limits formatted in requested format
+        """
+
+        if output_format == RateLimitOutputFormat.JSON_COMPACT:
+            return self.to_compact_json()
+        if output_format == RateLimitOutputFormat.NDJSON:
+            return self.to_ndjson()
+        if output_format == RateLimitOutputFormat.CSV:
+            return self.to_csv()
+        if output_format == RateLimitOutputFormat.OPENMETRICS:
+            return self.to_openmetrics()
+
+        return self.to_output_format(output_format).encode('utf-8') + b'\n'
+
+    def to_json(self, indent: int=4) -> str:
+        """
+        Return rate limits of all accounts as JSON string
+
+        :param indent: Number of spaces for indentation
+        :return: JSON formatted string representation of rate limits
+        """
+
+        return json.dumps(self.asdicts(), indent=indent)
+
+    def to_prometheus(self) -> str:
+        """
+        Return rate limits of all accounts as string containing prometheus
+        metrics labeled by account and identifier
+
+        :return: String representation of rate limits as prometheus metrics
+        """
+
+        lines = []
+        for name, description, attr in RATE_LIMIT_METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            for account, rate_limit in self.rate_limits.items():
+                labels = (
+                    f'account="{escape_label_value(account)}",'
+                    f'identifier="{escape_label_value(str(rate_limit.identifier))}"')
+                lines.append(f'{name}{{{labels}}} {getattr(rate_limit, attr)}')
+
+        return '\n'.join(lines)
+
+    def to_yaml(self) -> str:
+        """
+        Return rate limits of all accounts as YAML string
+
+        :return: YAML formatted string representation of rate limits
+        """
+
+        import yaml  # pylint: disable=import-outside-toplevel
+
+        yaml_repr = yaml.safe_dump(self.asdicts(), explicit_start=True)
+        yaml_repr = yaml_repr.strip()
+        return yaml_repr
+
+    def to_compact_json(self) -> bytes:
+        """
+        Return rate limits of all accounts as JSON array without any
+        whitespace
+
+        :return: JSON formatted representation of rate limits
+        """
+
+        buffer = bytearray(b'[')
+        for index, (account, rate_limit) in enumerate(self.rate_limits.items()):
+            if index > 0:
+                buffer += b','
+            write_json_object(buffer, rate_limit, account)
+        buffer += b']\n'
+        return bytes(buffer)
+
+    def to_ndjson(self) -> bytes:
+        """
+        Return rate limits of all accounts as JSON, one line per account
+
+        :return: Newline-delimited JSON representation of rate limits
+        """
+
+        buffer = bytearray()
+        for account, rate_limit in self.rate_limits.items():
+            write_json_object(buffer, rate_limit, account)
+            buffer += b'\n'
+        return bytes(buffer)
+
+    def to_csv(self) -> bytes:
+        """
+        Return rate limits of all accounts as CSV with header line, one
+        row per account
+
+        :return: CSV formatted representation of rate limits
+        """
+
+        buffer = bytearray(b'account,' + CSV_HEADER)
+        for account, rate_limit in self.rate_limits.items():
+            write_csv_row(buffer, rate_limit, account)
+        return bytes(buffer)
+
+    def to_openmetrics(self) -> bytes:
+        """
+        Return rate limits of all accounts as metrics in OpenMetrics text
+        format labeled by account and identifier, with the time of the
+        refresh as timestamp of the samples
+
+        :return: Representation of rate limits as OpenMetrics exposition
+        """
+
+        return render_openmetrics([
+            ((f'account="{escape_label_value(account)}",'
+              f'identifier="{escape_label_value(str(rate_limit.identifier))}"').encode(),
+             rate_limit)
+            for account, rate_limit in self.rate_limits.items()])
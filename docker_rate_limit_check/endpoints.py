@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+
+# Endpoints of Docker Hub queried for the rate limit. Kept separate from
+# the requestors, so the command line interface can use them as defaults
+# without importing any HTTP library.
+
+TOKEN_SCOPE = 'repository:ratelimitpreview/test:pull'
+TOKEN_RECEIVE_ENDPOINT = f'https://auth.docker.io/token?service=registry.docker.io&scope={TOKEN_SCOPE}'
+RATE_LIMIT_ENDPOINT = 'https://registry-1.docker.io/v2/ratelimitpreview/test/manifests/latest'
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import socket
+
+from typing import Union
+
+from .disk_cache import rate_limit_from_dict
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP connection through a Unix domain socket
+
+    :param unix_socket: Path of Unix domain socket to connect to
+    :param timeout: Seconds to wait for connection and response
+    """
+
+    def __init__(self, unix_socket: str, timeout: float) -> None:
+        super().__init__('localhost', timeout=timeout)
+        self.unix_socket = unix_socket
+
+    def connect(self) -> None:
+        """
+        Connect to Unix domain socket
+
+        :raises OSError: If socket could not be connected to
+        """
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.unix_socket)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def request_rate_limit_from_exporter(
+        unix_socket: str,
+        timeout: float=10) -> Union[DockerRateLimit, DockerRateLimitGroup]:
+    """
+    Request rate limit from running exporter listening on a Unix domain
+    socket instead of from Docker Hub.
+    The rate limit is requested as JSON, so it can be output in any format
+    exactly like a rate limit requested from Docker Hub.
+
+    :param unix_socket: Path of Unix domain socket of exporter
+    :param timeout: Seconds to wait for connection and response
+    :raises ConnectionError: If exporter did not respond with the rate limit
+    :return: Rate limit of single account or of all accounts of exporter
+    """
+
+    conn = UnixHTTPConnection(unix_socket, timeout)
+    try:
+        conn.request('GET', '/?format=json')
+        response = conn.getresponse()
+        body = response.read()
+    finally:
+        conn.close()
+
+    if response.status != 200:
+        raise ConnectionError(
+            f'Exporter responded with status code {response.status}: '
+            f'{body.decode("utf-8", "replace").strip()}')
+
+    data = json.loads(body)
+    if isinstance(data, list):
+        return DockerRateLimitGroup({
+            account.pop('account'): rate_limit_from_dict(account)
+            for account in data})
+    return rate_limit_from_dict(data)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+import csv
+import io
+import json
+import math
+import threading
+from array import array
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .docker_rate_limit import escape_label_value
+from .output_format import RateLimitOutputFormat
+
+
+# Default number of samples kept per account
+DEFAULT_HISTORY_SIZE = 720
+
+# Time constant in seconds of the exponentially weighted consumption rate.
+# Consumption within the last few multiples of it dominates the rate.
+CONSUMPTION_RATE_TIME_CONSTANT = 900.0
+
+
+class RateLimitHistory:  # pylint: disable=too-many-instance-attributes
+    """
+    Thread-safe, fixed-size history of rate limit samples of a single
+    account. Samples are stored in arrays used as ring buffer, so memory
+    usage is bounded and recording a sample does not allocate.
+
+    The consumption rate (pulls per second, exponentially weighted by time)
+    is updated with every sample, so it and the projected time until the
+    rate limit is exhausted can be read in constant time.
+
+    :param size: Maximum number of samples kept, oldest samples are dropped
+    :param time_constant: Time constant in seconds of the exponentially
+        weighted consumption rate
+    """
+
+    __slots__ = (
+        'size', 'time_constant', 'identifier',
+        '_lock', '_timestamps', '_maxima', '_remaining',
+        '_next', '_count', '_rate')
+
+    def __init__(
+            self,
+            size: int=DEFAULT_HISTORY_SIZE,
+            time_constant: float=CONSUMPTION_RATE_TIME_CONSTANT) -> None:
+
+        self.size = max(1, size)
+        self.time_constant = time_constant
+        self.identifier: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._timestamps = array('d', bytes(8 * self.size))
+        self._maxima = array('q', bytes(8 * self.size))
+        self._remaining = array('q', bytes(8 * self.size))
+
+        # Index the next sample is written to and number of samples kept
+        self._next = 0
+        self._count = 0
+
+        # Consumption rate in pulls per second, None until known
+        self._rate: Optional[float] = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def record(
+            self,
+            timestamp: float,
+            rate_limit_max: int,
+            rate_limit_remaining: int,
+            identifier: Optional[str]=None) -> None:
+        """
+        Add sample to history and update consumption rate
+
+        :param timestamp: Time of sample (see :func:`time.time`)
+        :param rate_limit_max: Maximum pulls at time of sample
+        :param rate_limit_remaining: Remaining pulls at time of sample
+        :param identifier: Identifier Docker Hub reported the rate limit for
+        """
+
+        with self._lock:
+            if self._count > 0:
+                last = (self._next - 1) % self.size
+                elapsed = timestamp - self._timestamps[last]
+                if self._maxima[last] != rate_limit_max:
+                    # Rate limit changed (e.g. account was rate limited),
+                    # consumption rate of old limit is meaningless
+                    self._rate = None
+                elif elapsed > 0:
+                    rate = (self._remaining[last] - rate_limit_remaining) / elapsed
+                    if self._rate is None:
+                        self._rate = rate
+                    else:
+                        weight = 1 - math.exp(-elapsed / self.time_constant)
+                        self._rate += weight * (rate - self._rate)
+
+            self._timestamps[self._next] = timestamp
+            self._maxima[self._next] = rate_limit_max
+            self._remaining[self._next] = rate_limit_remaining
+            self._next = (self._next + 1) % self.size
+            self._count = min(self._count + 1, self.size)
+            if identifier is not None:
+                self.identifier = identifier
+
+    def samples(self) -> List[Tuple[float, int, int]]:
+        """
+        Return all samples kept, oldest first
+
+        :return: Timestamp, maximum and remaining pulls of every sample
+        """
+
+        with self._lock:
+            return self._samples()
+
+    def _samples(self) -> List[Tuple[float, int, int]]:
+        start = (self._next - self._count) % self.size
+        indices = [(start + offset) % self.size for offset in range(self._count)]
+        samples: List[Tuple[float, int, int]] = [
+            (self._timestamps[index], self._maxima[index], self._remaining[index])
+            for index in indices
+        ]
+        return samples
+
+    def to_state(self) -> Dict[str, Any]:
+        """
+        Return samples and consumption rate, so the history can be
+        restored by :meth:`from_state`, e.g. in another process.
+
+        :return: JSON serializable state of history
+        """
+
+        with self._lock:
+            return {
+                'size': self.size,
+                'time_constant': self.time_constant,
+                'identifier': self.identifier,
+                'consumption_rate': self._rate,
+                'samples': self._samples(),
+            }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> 'RateLimitHistory':
+        """
+        Restore history from state returned by :meth:`to_state`
+
+        :param state: State of history
+        :return: History equal to the one the state has been taken from
+        """
+
+        history = cls(state['size'], state['time_constant'])
+        samples = state['samples'][-history.size:]
+        for index, (timestamp, rate_limit_max, rate_limit_remaining) in enumerate(samples):
+            history._timestamps[index] = timestamp
+            history._maxima[index] = rate_limit_max
+            history._remaining[index] = rate_limit_remaining
+        history._count = len(samples)
+        history._next = len(samples) % history.size
+        history._rate = state['consumption_rate']
+        history.identifier = state['identifier']
+        return history
+
+    @property
+    def consumption_rate(self) -> Optional[float]:
+        """
+        Pulls consumed per second recently. Negative if pulls are given
+        back faster than they are consumed.
+
+        :return: Consumption rate or None if there are not enough samples
+        """
+
+        with self._lock:
+            rate = self._rate
+        return None if rate is None else float(rate)
+
+    @property
+    def seconds_until_exhausted(self) -> Optional[float]:
+        """
+        Projected number of seconds until no pulls remain if consumption
+        continues at the current rate
+
+        :return: Seconds until exhaustion or None if pulls are not being
+            used up
+        """
+
+        with self._lock:
+            if self._count == 0:
+                return None
+            remaining = self._remaining[(self._next - 1) % self.size]
+            if remaining <= 0:
+                return 0.0
+            if self._rate is None or self._rate <= 0:
+                return None
+            seconds: float = remaining / self._rate
+        return seconds
+
+    def asdict(self) -> Dict[str, Any]:
+        """
+        Return consumption rate, forecast and samples as dictionary.
+
+        :return: Dictionary representation of history
+        """
+
+        return {
+            'identifier': self.identifier,
+            'consumption_rate': self.consumption_rate,
+            'seconds_until_exhausted': self.seconds_until_exhausted,
+            'samples': [
+                {
+                    'timestamp': timestamp,
+                    'rate_limit_max': rate_limit_max,
+                    'rate_limit_remaining': rate_limit_remaining,
+                }
+                for timestamp, rate_limit_max, rate_limit_remaining in self.samples()
+            ],
+        }
+
+
+# History of one or many accounts
+History = Union[RateLimitHistory, Mapping[str, RateLimitHistory]]
+
+
+def history_to_prometheus(history: History) -> str:
+    """
+    Return consumption rate and forecast as prometheus metrics. Samples
+    are left out, as a series must not have multiple samples in one
+    scrape.
+
+    :param history: History of one account or of many accounts by name
+    :return: Prometheus metrics
+    """
+
+    if isinstance(history, RateLimitHistory):
+        labeled = [('', history)]
+    else:
+        labeled = [
+            (f'account="{escape_label_value(account)}",', account_history)
+            for account, account_history in history.items()
+        ]
+
+    metrics = [
+        ('docker_hub_rate_limit_consumption_rate',
+         'Pulls consumed per second recently (exponentially weighted)',
+         'consumption_rate'),
+        ('docker_hub_rate_limit_seconds_until_exhausted',
+         'Projected seconds until no pulls remain at current consumption rate',
+         'seconds_until_exhausted'),
+    ]
+
+    lines = []
+    for name, description, attr in metrics:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} gauge')
+        for account_label, account_history in labeled:
+            value = getattr(account_history, attr)
+            if value is None:
+                continue
+            identifier = escape_label_value(str(account_history.identifier))
+            lines.append(f'{name}{{{account_label}identifier="{identifier}"}} {value}')
+
+    lines.append('# HELP docker_hub_rate_limit_history_samples Samples kept in history')
+    lines.append('# TYPE docker_hub_rate_limit_history_samples gauge')
+    for account_label, account_history in labeled:
+        identifier = escape_label_value(str(account_history.identifier))
+        lines.append(
+            f'docker_hub_rate_limit_history_samples{{{account_label}identifier="{identifier}"}} '
+            f'{len(account_history)}')
+
+    return '\n'.join(lines)
+
+
+def history_to_output_format(  # pylint: disable=too-many-return-statements
+        history: History,
+        output_format: RateLimitOutputFormat) -> str:
+    """
+    Return history in the requested format
+
+    :param history: History of one account or of many accounts by name
+    :param output_format: Format of output
+    :return: History formatted in requested format
+    """
+
+    if output_format == RateLimitOutputFormat.PROMETHEUS:
+        return history_to_prometheus(history)
+    if output_format == RateLimitOutputFormat.OPENMETRICS:
+        return history_to_prometheus(history) + '\n# EOF'
+    if output_format == RateLimitOutputFormat.CSV:
+        return history_to_csv(history)
+
+    data: Union[Dict[str, Any], List[Dict[str, Any]]]
+    if isinstance(history, RateLimitHistory):
+        data = history.asdict()
+    else:
+        data = [
+            {'account': account, **account_history.asdict()}
+            for account, account_history in history.items()
+        ]
+
+    if output_format == RateLimitOutputFormat.YAML:
+        import yaml  # pylint: disable=import-outside-toplevel
+
+        return yaml.safe_dump(data, explicit_start=True, sort_keys=False).strip()
+    if output_format == RateLimitOutputFormat.JSON_COMPACT:
+        return json.dumps(data, separators=(',', ':'))
+    if output_format == RateLimitOutputFormat.NDJSON:
+        return '\n'.join(
+            json.dumps(account_data, separators=(',', ':'))
+            for account_data in (data if isinstance(data, list) else [data]))
+    return json.dumps(data, indent=4)
+
+
+def history_to_csv(history: History) -> str:
+    """
+    Return samples of history as CSV with header line, one row per sample
+
+    :param history: History of one account or of many accounts by name
+    :return: CSV formatted samples
+    """
+
+    if isinstance(history, RateLimitHistory):
+        labeled: List[Tuple[List[str], RateLimitHistory]] = [([], history)]
+        header = []
+    else:
+        labeled = [([account], account_history) for account, account_history in history.items()]
+        header = ['account']
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(header + ['identifier', 'timestamp', 'rate_limit_max', 'rate_limit_remaining'])
+    for account_fields, account_history in labeled:
+        identifier = '' if account_history.identifier is None else account_history.identifier
+        for sample in account_history.samples():
+            writer.writerow(account_fields + [identifier, *sample])
+    return output.getvalue()
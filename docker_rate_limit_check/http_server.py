@@ -1,17 +1,264 @@
 #!/usr/bin/env python3
 
+import contextlib
+import json
+import math
+import os
+import socket
+import stat
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from http.server import BaseHTTPRequestHandler
 from http.server import HTTPServer
+from socketserver import TCPServer
+from socketserver import ThreadingMixIn
 from urllib.parse import parse_qs
 from urllib.parse import urlparse
 
+from typing import TYPE_CHECKING
 from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
 from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
 
+from requests.exceptions import RequestException
+
+from .circuit_breaker import CircuitOpenError
 from .docker_hub_requestor import DockerHubRequestor
+from .history import history_to_output_format
+from .instrumentation import EXPORTER_METRICS
 from .output_format import RateLimitOutputFormat
+from .response_cache import DEFAULT_COMPRESSION_MIN_SIZE
+from .response_cache import RateLimit
+from .response_cache import RenderedResponse
+from .response_cache import ResponseCache
+from .response_cache import compress_response
+from .response_cache import conditional_response
+from .response_cache import freshness_headers
+from .response_cache import negotiate_encoding
+from .response_cache import render_payload
+from .server_mode import HTTPServerMode
+from .watch import RateLimitWatch
+from .watch import format_event
+
+
+# Account pool and shared cache are only referenced by type hints
+if TYPE_CHECKING:
+    from .account_pool import DockerHubAccountPool
+    from .shared_cache import SharedCacheRequestor
+
+
+# Requestor for rate limit of one or many accounts
+RateLimitRequestor = Union[DockerHubRequestor, 'DockerHubAccountPool', 'SharedCacheRequestor']
+
+# Paths that are answered with the rate limit
+RATE_LIMIT_PATHS = ('/', '/metrics')
+
+# Path that is answered with the history of the rate limit
+HISTORY_PATH = '/history'
+
+# Path that is answered whenever the rate limit changes
+WATCH_PATH = '/watch'
+
+# Maximum number of seconds a long-polling request waits for a change
+MAX_WATCH_WAIT = 300.0
+
+# Number of seconds after which an idle event stream is sent a comment,
+# so closed connections are noticed
+WATCH_HEARTBEAT_INTERVAL = 15.0
+
+# Number of seconds clients are asked to wait before retrying a request
+# that failed because Docker Hub could not be queried
+UPSTREAM_ERROR_RETRY_AFTER = 5
+
+# Default maximum number of clients waiting on /watch in dedicated threads
+# of a server handling requests using a worker pool
+DEFAULT_MAX_WATCHERS = 100
+
+# Number of seconds clients are asked to wait before retrying a request to
+# /watch that was refused because too many clients are waiting
+WATCHERS_EXHAUSTED_RETRY_AFTER = 30
+
+
+class HTTPRequestError(Exception):
+    """
+    Request can not be answered with the rate limit
+
+    :param code: HTTP error code to respond with
+    :param message: Plaintext message to respond with
+    """
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def parse_rate_limit_request(
+        path: str,
+        arguments: Dict[str, List[str]]) -> Optional[RateLimitOutputFormat]:
+    """
+    Validate GET request for rate limit or its history and decide output
+    format.
+
+    :param path: Requested path
+    :param arguments: Parsed query string of request
+    :raises HTTPRequestError: If request is not valid
+    :return: Requested output format or None if default format should
+        be used
+    """
+
+    # Return HTTP-404 for every location but /, /metrics and /history
+    if path not in RATE_LIMIT_PATHS and path != HISTORY_PATH:
+        raise HTTPRequestError(404, 'HTTP 404 - Not Found')
+
+    check_arguments(arguments, {'format'})
+
+    # In case path is /metrics always default to prometheus output format
+    if path == '/metrics' and 'format' not in arguments:
+        return RateLimitOutputFormat.PROMETHEUS
+
+    return parse_format_argument(arguments)
+
+
+def check_arguments(arguments: Dict[str, List[str]], supported_args: Set[str]) -> None:
+    """
+    Check that query string of request contains only supported arguments,
+    each of them only once.
+
+    :param arguments: Parsed query string of request
+    :param supported_args: Names of supported arguments
+    :raises HTTPRequestError: If request contains other arguments
+    """
+
+    for arg, values in arguments.items():
+        if arg not in supported_args:
+            raise HTTPRequestError(400, f'Error: Unknown query string "{arg}"')
+        if len(values) > 1:
+            raise HTTPRequestError(
+                400,
+                f'Error: Expected exactly one value for parameter "{arg}"')
+
+
+def parse_format_argument(arguments: Dict[str, List[str]]) -> Optional[RateLimitOutputFormat]:
+    """
+    Extract output format from query string of request
+
+    :param arguments: Parsed query string of request
+    :raises HTTPRequestError: If format is not supported
+    :return: Requested output format or None if default format should
+        be used
+    """
+
+    if 'format' not in arguments:
+        return None
+
+    format_str = arguments['format'][0].lower()
+    try:
+        return RateLimitOutputFormat(format_str)
+    except ValueError as err:
+        raise HTTPRequestError(
+            400,
+            f'Error: Unsupported format \"{format_str}\"') from err
+
+
+def parse_watch_request(
+        arguments: Dict[str, List[str]]
+        ) -> Tuple[Optional[RateLimitOutputFormat], Optional[float], Optional[str]]:
+    """
+    Validate GET request for changes of the rate limit. Requests with a
+    ?wait=SECONDS argument are answered once the rate limit differs from
+    the ?version=VERSION the client has seen last (long polling), other
+    requests with a stream of Server-Sent Events.
+
+    :param arguments: Parsed query string of request
+    :raises HTTPRequestError: If request is not valid
+    :return: Requested output format (None if default format should be
+        used), number of seconds to wait (None to stream events) and
+        version seen last by the client
+    """
+
+    check_arguments(arguments, {'format', 'wait', 'version'})
+
+    wait = None
+    if 'wait' in arguments:
+        try:
+            wait = float(arguments['wait'][0])
+        except ValueError as err:
+            raise HTTPRequestError(400, 'Error: "wait" has to be a number of seconds') from err
+        if not 0 <= wait <= MAX_WATCH_WAIT:
+            raise HTTPRequestError(
+                400,
+                f'Error: "wait" has to be between 0 and {MAX_WATCH_WAIT:.0f} seconds')
+
+    version = arguments['version'][0] if 'version' in arguments else None
+    return parse_format_argument(arguments), wait, version
+
+
+def rate_limit_response(
+        response_cache: ResponseCache,
+        rate_limit: RateLimit,
+        output_format: RateLimitOutputFormat,
+        accept_encoding: Optional[str],
+        self_metrics: bool) -> RenderedResponse:
+    """
+    Get response for rate limit from cache, compressed if the client
+    accepts it
+
+    :param response_cache: Cache for rendered responses
+    :param rate_limit: Rate limit to respond with
+    :param output_format: Format in which to respond
+    :param accept_encoding: Value of Accept-Encoding request header if any
+    :param self_metrics: Whether to append metrics describing the exporter
+        itself to responses in prometheus format
+    :return: Rendered response
+    """
+
+    encoding = negotiate_encoding(accept_encoding)
+    if self_metrics and output_format == RateLimitOutputFormat.PROMETHEUS:
+        return response_cache.get_with_exporter_metrics(
+            rate_limit, EXPORTER_METRICS.render(), encoding)
+    return response_cache.get(rate_limit, output_format, encoding)
+
+
+def upstream_error_response(
+        err: Union[RequestException, KeyError, ValueError]) -> Tuple[int, str, Dict[str, str]]:
+    """
+    Get error response to a request for the rate limit that can not be
+    answered, because querying Docker Hub failed and there is no cached
+    information to fall back to
+
+    :param err: Error raised by requestor
+    :return: Status code, message and headers of response
+    """
+
+    print(f'Error: Could not get rate limit: {err}', file=sys.stderr)
+    if isinstance(err, CircuitOpenError):
+        # Docker Hub is not queried for now
+        return 503, f'Error: {err}', {'Retry-After': str(math.ceil(err.seconds_until_retry))}
+    return (
+        502,
+        f'Error: Could not get rate limit from Docker Hub: {err}',
+        {'Retry-After': str(UPSTREAM_ERROR_RETRY_AFTER)})
+
+
+def remove_unix_socket(path: str) -> None:
+    """
+    Remove Unix domain socket, e.g. left behind by a previous server.
+    Other kinds of files are not removed.
+
+    :param path: Path of Unix domain socket
+    """
+
+    with contextlib.suppress(FileNotFoundError):
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
 
 
 class DockerRateLimitHTTPServer(HTTPServer):
@@ -24,26 +271,233 @@ class DockerRateLimitHTTPServer(HTTPServer):
         query parameter ?format=XYZ in GET request.
     :param docker_hub_requestor: Requestor for querying Docker Hub.
     :param host: Host string to bind on (default=0.0.0.0)
+    :param debug_metrics: Whether to expose internal counters of the
+        requestor on the /debug endpoint
+    :param keep_alive_timeout: Number of seconds an idle connection is
+        kept open waiting for the next request
+    :param max_keep_alive_requests: Maximum number of requests answered
+        on one connection before it is closed
+    :param self_metrics: Whether to append metrics describing the
+        exporter itself to responses in prometheus format
+    :param unix_socket: Path of Unix domain socket to listen on instead of
+        host and port
+    :param unix_socket_mode: Permissions of Unix domain socket
+    :param compression_min_size: Size in bytes of smallest response body
+        to compress if the client accepts gzip or deflate, None to never
+        compress responses
     """
 
+    # Whether connections are kept open after a response. A server that
+    # handles one request at a time closes them, as an idle connection
+    # would block every other client.
+    persistent_connections = False
+
+    # pylint: disable=too-many-arguments
     def __init__(
             self,
             port: int,
             default_format: RateLimitOutputFormat,
-            docker_hub_requestor: DockerHubRequestor,
-            host: str='0.0.0.0') -> None:
+            docker_hub_requestor: RateLimitRequestor,
+            host: str='0.0.0.0',
+            debug_metrics: bool=False,
+            keep_alive_timeout: float=15,
+            max_keep_alive_requests: int=100,
+            self_metrics: bool=True,
+            unix_socket: Optional[str]=None,
+            unix_socket_mode: int=0o660,
+            compression_min_size: Optional[int]=DEFAULT_COMPRESSION_MIN_SIZE) -> None:
+
+        # Rendered responses and changes of the rate limit are shared by
+        # all requests
+        self.response_cache = ResponseCache(compression_min_size)
+        self.watch = RateLimitWatch(docker_hub_requestor)
 
         # Prepare request handler
+        if not self.persistent_connections:
+            max_keep_alive_requests = 1
         request_handler = partial(
-                DockerRateLimitRequestHandler,
+                DockerRateLimitRequestHandler if unix_socket is None
+                else UnixDockerRateLimitRequestHandler,
                 default_format,
-                docker_hub_requestor)
+                docker_hub_requestor,
+                debug_metrics,
+                self.response_cache,
+                watch=self.watch if self.persistent_connections else None,
+                keep_alive_timeout=keep_alive_timeout,
+                max_keep_alive_requests=max_keep_alive_requests,
+                self_metrics=self_metrics)
 
         # Call parent init
-        conn = (host, port)
-        super().__init__(conn, request_handler)
+        self.unix_socket = unix_socket
+        self.unix_socket_mode = unix_socket_mode
+        conn: Union[str, Tuple[str, int]] = (host, port)
+        if unix_socket is not None:
+            self.address_family = socket.AF_UNIX
+            conn = unix_socket
+        super().__init__(conn, request_handler)  # type: ignore[arg-type]
+
+    def server_bind(self) -> None:
+        """
+        Bind socket to host and port or to path of Unix domain socket.
+        A Unix domain socket left behind by a previous server is replaced.
+        """
+
+        if self.unix_socket is None:
+            super().server_bind()
+            return
+
+        remove_unix_socket(self.unix_socket)
+
+        # HTTPServer expects host and port, there are none
+        TCPServer.server_bind(self)
+        os.chmod(self.unix_socket, self.unix_socket_mode)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self) -> None:
+        """
+        Close server, end requests waiting for the rate limit to change and
+        remove Unix domain socket
+        """
+
+        self.watch.close()
+        super().server_close()
+        if self.unix_socket is not None:
+            remove_unix_socket(self.unix_socket)
+
+class ThreadingDockerRateLimitHTTPServer(ThreadingMixIn, DockerRateLimitHTTPServer):
+    """
+    HTTP server answering GET request with the current Docker Hub
+    rate limit. Every request is handled in a new thread.
+
+    See :class:`DockerRateLimitHTTPServer` for parameters.
+    """
+
+    daemon_threads = True
+    persistent_connections = True
+
+class WorkerPoolDockerRateLimitHTTPServer(DockerRateLimitHTTPServer):
+    """
+    HTTP server answering GET request with the current Docker Hub
+    rate limit. Requests are handled by a fixed number of worker threads.
+
+    :param *args: Arguments for :class:`DockerRateLimitHTTPServer`
+    :param workers: Maximum number of requests handled concurrently
+    :param max_watchers: Maximum number of connections handled
+        concurrently in dedicated threads
+    :param **kwargs: Arguments for :class:`DockerRateLimitHTTPServer`
+    """
+
+    persistent_connections = True
+
+    def __init__(
+            self,
+            *args: Any,
+            workers: int=8,
+            max_watchers: int=DEFAULT_MAX_WATCHERS,
+            **kwargs: Any) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='http-worker')
+
+        # Functions continuing to handle connections in dedicated threads
+        self._detached_requests: Dict[Any, Callable[[], None]] = {}
+        self._detached_slots = threading.BoundedSemaphore(max_watchers)
+
+        super().__init__(*args, **kwargs)
+
+    def detach_request(self, request: Any, function: Callable[[], None]) -> bool:
+        """
+        Continue handling connection in a dedicated thread instead of
+        closing it once the worker thread is done with it, so a long
+        running response does not occupy a worker thread
+
+        :param request: Connection handled by calling worker thread
+        :param function: Function to call in dedicated thread. It has to
+            close the connection using :meth:`shutdown_request`.
+        :return: False if the maximum number of dedicated threads is
+            reached and the connection has to be handled by the caller
+        """
+
+        if not self._detached_slots.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return False
+
+        def run_detached() -> None:
+            try:
+                function()
+            finally:
+                self._detached_slots.release()
+
+        self._detached_requests[request] = run_detached
+        return True
+
+    def process_request_thread(self, request: Any, client_address: Tuple[str, int]) -> None:
+        """
+        Handle request inside of worker thread
+
+        :param request: Request to handle
+        :param client_address: Address of client that sent the request
+        """
+
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.handle_error(request, client_address)
+        finally:
+            detached = self._detached_requests.pop(request, None)
+            if detached is None:
+                self.shutdown_request(request)
+            else:
+                threading.Thread(target=detached, name='http-watch', daemon=True).start()
+
+    def process_request(self, request: Any, client_address: Tuple[str, int]) -> None:
+        """
+        Hand request over to worker pool
+
+        :param request: Request to handle
+        :param client_address: Address of client that sent the request
+        """
+
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self) -> None:
+        """
+        Close server and wait for worker threads to finish
+        """
 
-class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+def create_http_server(
+        mode: HTTPServerMode=HTTPServerMode.SINGLE,
+        workers: int=8,
+        max_watchers: int=DEFAULT_MAX_WATCHERS,
+        **kwargs: Any) -> DockerRateLimitHTTPServer:
+    """
+    Create HTTP server answering GET request with the current Docker Hub
+    rate limit using the requested concurrency model.
+
+    :param mode: Concurrency model of the server
+    :param workers: Number of worker threads if mode is
+        :attr:`HTTPServerMode.POOL`
+    :param max_watchers: Maximum number of clients waiting on /watch if
+        mode is :attr:`HTTPServerMode.POOL`
+    :param **kwargs: Arguments for :class:`DockerRateLimitHTTPServer`
+    :return: HTTP server ready to serve requests
+    """
+
+    # Every process of a pre-fork server handles requests in threads
+    if mode in (HTTPServerMode.THREADED, HTTPServerMode.PREFORK):
+        return ThreadingDockerRateLimitHTTPServer(**kwargs)
+    if mode == HTTPServerMode.POOL:
+        return WorkerPoolDockerRateLimitHTTPServer(
+            workers=workers,
+            max_watchers=max_watchers,
+            **kwargs)
+
+    return DockerRateLimitHTTPServer(**kwargs)
+
+class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):  # pylint: disable=too-many-instance-attributes
     """
     Request handler for basic HTTP server.
     Answers with the current Docker Hub rate limit to GET requests.
@@ -51,21 +505,55 @@ class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):
     :param default_format: Default output format if not specified using
         query parameter ?format=XYZ in GET request.
     :param docker_hub_requestor: Requestor for querying Docker Hub.
+    :param debug_metrics: Whether to expose internal counters of the
+        requestor on the /debug endpoint
+    :param response_cache: Cache for rendered responses
     :param *args: Arguments for parent class
+    :param watch: Notifier for changes of the rate limit, None if the
+        /watch endpoint is not supported
+    :param keep_alive_timeout: Number of seconds an idle connection is
+        kept open waiting for the next request
+    :param max_keep_alive_requests: Maximum number of requests answered
+        on one connection before it is closed
+    :param self_metrics: Whether to append metrics describing the
+        exporter itself to responses in prometheus format
     :param **kwargs: Arguments for parent class
     """
 
+    # Keep connections open unless the client asks to close them
+    protocol_version = 'HTTP/1.1'
+
+    # Send headers and body of a response in one segment
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    # pylint: disable=too-many-arguments
     def __init__(
             self,
             default_format: RateLimitOutputFormat,
-            docker_hub_requestor: DockerHubRequestor,
+            docker_hub_requestor: RateLimitRequestor,
+            debug_metrics: bool,
+            response_cache: ResponseCache,
             *args: Any,
+            watch: Optional[RateLimitWatch]=None,
+            keep_alive_timeout: float=15,
+            max_keep_alive_requests: int=100,
+            self_metrics: bool=True,
             **kwargs: Any) -> None:
 
         # Set default output format if not specified in request
         self.default_format = default_format
 
         self.docker_hub_requestor = docker_hub_requestor
+        self.debug_metrics = debug_metrics
+        self.response_cache = response_cache
+        self.watch = watch
+
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.self_metrics = self_metrics
+        self.requests_handled = 0
+        self.detached = False
 
         # Set content of "Server" response header
         self.server_version = __name__
@@ -73,22 +561,102 @@ class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):
 
         super().__init__(*args, **kwargs)
 
-    def send_http_error_message(self, code: int, message: str) -> None:
+    def setup(self) -> None:
+        """
+        Prepare connection for handling requests
+        """
+
+        super().setup()
+
+        # Idle connections are closed once reading from the socket times out
+        self.connection.settimeout(self.keep_alive_timeout)
+
+    def finish(self) -> None:
+        """
+        Clean up after handling requests, unless the connection is handled
+        further in a dedicated thread
+        """
+
+        if not self.detached:
+            super().finish()
+
+    def handle_detached_watch_request(self, arguments: Dict[str, List[str]]) -> None:
+        """
+        Answer request to /watch in a dedicated thread, then close the
+        connection
+
+        :param arguments: Parsed query string of request
+        """
+
+        # Ask client to close the connection after this response
+        self.max_keep_alive_requests = 0
+        try:
+            self.handle_watch_request(arguments)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.server.handle_error(self.request, self.client_address)
+        finally:
+            # Client might have closed the connection already
+            with contextlib.suppress(OSError):
+                super().finish()
+            self.server.shutdown_request(self.request)
+
+    def handle(self) -> None:
+        """
+        Handle requests on connection until the client closes it or the
+        connection is idle for too long
+        """
+
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            # Wait for next request, idle connections are closed silently
+            try:
+                if not self.rfile.peek(1):  # type: ignore[attr-defined]
+                    break
+            except (socket.timeout, ConnectionError):
+                break
+            self.handle_one_request()
+
+    def send_response(self, code: int, message: Optional[str]=None) -> None:
+        """
+        Send response status line and common headers. Asks the client to
+        close the connection once it has been used for the maximum number
+        of requests.
+
+        :param code: HTTP status code to send
+        :param message: Reason phrase to send instead of the default one
+        """
+
+        super().send_response(code, message)
+
+        self.requests_handled += 1
+        if self.requests_handled >= self.max_keep_alive_requests:
+            self.send_header('Connection', 'close')
+
+    def send_http_error_message(
+            self,
+            code: int,
+            message: str,
+            headers: Optional[Dict[str, str]]=None) -> None:
         """
         Send HTTP error message
 
         :param code: HTTP error code to send
         :param message: Plaintext message to include in body of response
+        :param headers: Additional headers to send
         """
         # End message with newline character
         if len(message) > 0 and message[-1] != '\n':
             message += '\n'
+        body = message.encode('utf-8')
 
-        self.protocol_version = 'HTTP/1.1'
         self.send_response(code)
-        self.send_header('Content-Length', str(len(message)))
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(bytes(message, 'utf-8'))
+        self.wfile.write(body)
 
     def send_rate_limit_response(
             self,
@@ -104,25 +672,202 @@ class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):
             output_format = self.default_format
 
         # Get rate limit
-        rate_limit = self.docker_hub_requestor.get_rate_limit()
-        payload = rate_limit.to_output_format(output_format)
+        try:
+            rate_limit = self.docker_hub_requestor.get_rate_limit()
+        except (RequestException, KeyError, ValueError) as err:
+            self.send_http_error_message(*upstream_error_response(err))
+            return
+        response = rate_limit_response(
+            self.response_cache,
+            rate_limit,
+            output_format,
+            self.headers.get('Accept-Encoding'),
+            self.self_metrics)
+        status, headers, body = conditional_response(
+            response,
+            freshness_headers(self.docker_hub_requestor),
+            self.headers.get('If-None-Match'))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
 
-        # End payload with newline character
-        if len(payload) > 0 and payload[-1] != '\n':
-            payload += '\n'
+    def send_history_response(
+            self,
+            output_format: Optional[RateLimitOutputFormat]=None) -> None:
+        """
+        Send HTTP response with history of rate limit in specified format.
+
+        :param output_format: Format in which to respond
+        """
+
+        # If not specified use default format
+        if output_format is None:
+            output_format = self.default_format
+
+        history = self.docker_hub_requestor.history
+        response = compress_response(
+            render_payload(history_to_output_format(history, output_format), output_format),
+            negotiate_encoding(self.headers.get('Accept-Encoding')),
+            self.response_cache.compression_min_size)
+        status, headers, body = conditional_response(
+            response,
+            {'Cache-Control': 'no-cache'},
+            self.headers.get('If-None-Match'))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_watch_request(self, arguments: Dict[str, List[str]]) -> None:
+        """
+        Handle GET request for changes of the rate limit
+
+        :param arguments: Parsed query string of request
+        """
+
+        if self.watch is None:
+            # Waiting client would block every other client
+            self.send_http_error_message(
+                501,
+                'Error: /watch is not supported by a server handling one request at a time')
+            return
 
-        self.protocol_version = 'HTTP/1.1'
+        # Waiting client would occupy a worker thread, continue in a
+        # dedicated thread once this one is done with the connection.
+        # The number of dedicated threads is limited like the worker pool.
+        if isinstance(self.server, WorkerPoolDockerRateLimitHTTPServer) and not self.detached:
+            detached = self.server.detach_request(
+                self.request,
+                partial(self.handle_detached_watch_request, arguments))
+            if not detached:
+                self.send_http_error_message(
+                    503,
+                    'Error: Too many clients are waiting for changes of the rate limit',
+                    {'Retry-After': str(WATCHERS_EXHAUSTED_RETRY_AFTER)})
+                return
+            self.detached = True
+            self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+            return
+
+        try:
+            format_enum, wait, version = parse_watch_request(arguments)
+        except HTTPRequestError as err:
+            self.send_http_error_message(err.code, err.message)
+            return
+
+        self.send_watch_response(self.watch, format_enum, wait, version)
+
+    def send_watch_response(
+            self,
+            watch: RateLimitWatch,
+            output_format: Optional[RateLimitOutputFormat],
+            wait: Optional[float],
+            last_version: Optional[str]) -> None:
+        """
+        Send HTTP response with docker rate limit once it differs from the
+        version the client has seen last, or stream every change of the
+        rate limit if no time to wait is given.
+
+        :param watch: Notifier for changes of the rate limit
+        :param output_format: Format in which to respond
+        :param wait: Maximum number of seconds to wait for a change, None to
+            stream changes
+        :param last_version: Version of rate limit the client has seen last
+        """
+
+        # If not specified use default format
+        if output_format is None:
+            output_format = self.default_format
+
+        if wait is None:
+            self.send_event_stream(watch, output_format)
+            return
+
+        version, rate_limit = watch.wait(last_version, wait)
+        if version is None or rate_limit is None:
+            self.send_http_error_message(
+                503,
+                'Error: Rate limit is not known yet',
+                {'Retry-After': '1'})
+            return
+
+        headers = {'Cache-Control': 'no-cache', 'X-Rate-Limit-Version': version}
+
+        # Rate limit did not change in time
+        if version == last_version:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        response = self.response_cache.get(rate_limit, output_format)
         self.send_response(200)
-        self.send_header('Content-Length', str(len(payload)))
+        for name, value in {**response.headers, **headers}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response.body)
 
-        # Set Content-Type header accordingly
-        if output_format is RateLimitOutputFormat.JSON:
-            self.send_header('Content-Type', 'application/json')
-        if output_format is RateLimitOutputFormat.YAML:
-            self.send_header('Content-Type', 'application/yaml')
+    def send_event_stream(
+            self,
+            watch: RateLimitWatch,
+            output_format: RateLimitOutputFormat) -> None:
+        """
+        Send every change of the rate limit as Server-Sent Event until the
+        client closes the connection. A client reconnecting with a
+        Last-Event-ID header is only sent changes it has not seen yet.
 
+        :param watch: Notifier for changes of the rate limit
+        :param output_format: Format in which to send rate limit
+        """
+
+        # Stream ends when connection is closed
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        if not self.close_connection:
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(bytes(payload, 'utf-8'))
+
+        version = self.headers.get('Last-Event-ID')
+        try:
+            self.wfile.flush()
+            while True:
+                new_version, rate_limit = watch.wait(version, WATCH_HEARTBEAT_INTERVAL)
+                if watch.closed:
+                    return
+
+                if new_version is not None and new_version != version and rate_limit is not None:
+                    version = new_version
+                    payload = self.response_cache.get(rate_limit, output_format).body
+                    self.wfile.write(format_event(version, payload))
+                else:
+                    self.wfile.write(b': keep-alive\n\n')
+                self.wfile.flush()
+        except OSError:
+            # Client closed connection
+            return
+
+    def send_debug_metrics_response(self) -> None:
+        """
+        Send HTTP response with internal counters of the requestor as JSON
+        """
+
+        metrics = self.docker_hub_requestor.debug_metrics()
+        metrics['response_cache_hits'] = self.response_cache.hits
+        metrics['response_cache_misses'] = self.response_cache.misses
+        body = (json.dumps(metrics, indent=4) + '\n').encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
 
     # pylint: disable=invalid-name
     def do_GET(self) -> None:
@@ -135,40 +880,45 @@ class DockerRateLimitRequestHandler(BaseHTTPRequestHandler):
         path = urltuple.path
         arguments = parse_qs(urltuple.query)
 
-        # Return HTTP-404 for every location but / and /metrics
-        if path not in ['/', '/metrics']:
-            self.send_http_error_message(404, 'HTTP 404 - Not Found')
+        # Waiting for changes is not measured as handling a request
+        if path == WATCH_PATH:
+            self.handle_watch_request(arguments)
             return
 
-        # Check for unexpected arguments
-        supported_args = {'format'}
-        for arg in arguments:
-            if arg not in supported_args:
-                message = f'Error: Unknown query string "{arg}"'
-                self.send_http_error_message(400, message)
+        with EXPORTER_METRICS.http_request():
+            if path == '/debug' and self.debug_metrics:
+                self.send_debug_metrics_response()
                 return
 
-        # Decide output format
-        format_enum = None
-
-        # In case path is /metrics always default to prometheus output format
-        if path == '/metrics':
-            format_enum = RateLimitOutputFormat.PROMETHEUS
-
-        # Extract format from request
-        if 'format' in arguments:
-            if len(arguments['format']) > 1:
-                message = 'Error: Expected exactly one value for parameter "format"'
-                self.send_http_error_message(400, message)
+            try:
+                format_enum = parse_rate_limit_request(path, arguments)
+            except HTTPRequestError as err:
+                self.send_http_error_message(err.code, err.message)
                 return
 
-            format_str = arguments['format'][0].lower()
-            try:
-                format_enum = RateLimitOutputFormat(format_str)
-            except ValueError:
-                message = f'Error: Unsupported format \"{format_str}\"'
-                self.send_http_error_message(400, message)
+            if path == HISTORY_PATH:
+                self.send_history_response(format_enum)
                 return
 
-        self.send_rate_limit_response(format_enum)
-        return
+            self.send_rate_limit_response(format_enum)
+            return
+
+class UnixDockerRateLimitRequestHandler(DockerRateLimitRequestHandler):
+    """
+    Request handler for HTTP server listening on a Unix domain socket.
+
+    See :class:`DockerRateLimitRequestHandler` for parameters.
+    """
+
+    # Nagle's algorithm only applies to TCP
+    disable_nagle_algorithm = False
+
+    def address_string(self) -> str:
+        """
+        Return address of client for logging. Clients connected through
+        a Unix domain socket have none.
+
+        :return: Name of socket type
+        """
+
+        return 'unix'
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from .docker_rate_limit import escape_label_value
+
+
+# Upper bounds of histogram buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of all metrics describing the exporter itself
+METRIC_PREFIX = 'docker_rate_limit_check'
+
+
+def format_labels(label_names: Sequence[str], label_values: Sequence[str]) -> str:
+    """
+    Format labels of a prometheus metric
+
+    :param label_names: Names of labels
+    :param label_values: Values of labels in the same order
+    :return: Labels including curly braces or empty string if there are
+        no labels
+    """
+
+    if len(label_names) == 0:
+        return ''
+
+    labels = ','.join(
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(label_names, label_values))
+    return f'{{{labels}}}'
+
+
+class Metric:
+    """
+    Thread-safe metric with optional labels
+
+    :param name: Name of metric
+    :param documentation: Description of metric
+    :param label_names: Names of labels of metric
+    """
+
+    metric_type = 'untyped'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str]=()) -> None:
+
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        """
+        Render metric in prometheus text format
+
+        :return: Lines describing metric
+        """
+
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+            *self.render_samples(),
+        ]
+
+    def render_samples(self) -> List[str]:
+        """
+        Render current values of metric in prometheus text format
+
+        :raises NotImplementedError: Has to be implemented by subclasses
+        :return: One line for every sample
+        """
+
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value for each combination of labels.
+
+    :param name: Name of metric
+    :param documentation: Description of metric
+    :param label_names: Names of labels of metric
+    """
+
+    metric_type = 'counter'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str]=()) -> None:
+
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float=1) -> None:
+        """
+        Increase value of counter
+
+        :param *label_values: Values of labels in order of label names
+        :param amount: Amount to increase counter by
+        """
+
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        """
+        Return current value of counter
+
+        :param *label_values: Values of labels in order of label names
+        :return: Current value
+        """
+
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render_samples(self) -> List[str]:
+        """
+        Render current values of counter in prometheus text format
+
+        :return: One line for every combination of labels
+        """
+
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f'{self.name}{format_labels(self.label_names, labels)} {value}'
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down for each combination of labels.
+    See :class:`Metric` for parameters.
+    """
+
+    metric_type = 'gauge'
+
+    def dec(self, *label_values: str, amount: float=1) -> None:
+        """
+        Decrease value of gauge
+
+        :param *label_values: Values of labels in order of label names
+        :param amount: Amount to decrease gauge by
+        """
+
+        self.inc(*label_values, amount=-amount)
+
+    @contextmanager
+    def track_in_progress(self, *label_values: str) -> Iterator[None]:
+        """
+        Increase gauge while context is active
+
+        :param *label_values: Values of labels in order of label names
+        """
+
+        self.inc(*label_values)
+        try:
+            yield
+        finally:
+            self.dec(*label_values)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values for each combination of labels.
+
+    :param name: Name of metric
+    :param documentation: Description of metric
+    :param label_names: Names of labels of metric
+    :param buckets: Upper bounds of buckets in ascending order
+    """
+
+    metric_type = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            label_names: Sequence[str]=(),
+            buckets: Sequence[float]=DEFAULT_BUCKETS) -> None:
+
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+        # Count of observations per bucket (not cumulative, last bucket
+        # is +Inf) and sum of observations for each combination of labels
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Record observed value
+
+        :param value: Observed value
+        :param *label_values: Values of labels in order of label names
+        """
+
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(label_values)
+            if counts is None:
+                counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+                self._sums[label_values] = 0.0
+            counts[index] += 1
+            self._sums[label_values] += value
+
+    @contextmanager
+    def measure(self, *label_values: str) -> Iterator[None]:
+        """
+        Observe number of seconds the context is active
+
+        :param *label_values: Values of labels in order of label names
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        """
+        Return number of observations
+
+        :param *label_values: Values of labels in order of label names
+        :return: Number of observed values
+        """
+
+        with self._lock:
+            return sum(self._counts.get(label_values, []))
+
+    def render_samples(self) -> List[str]:
+        """
+        Render buckets, sum and count of observations in prometheus text
+        format
+
+        :return: Lines for every combination of labels
+        """
+
+        with self._lock:
+            observations = [
+                (labels, list(counts), self._sums[labels])
+                for labels, counts in sorted(self._counts.items())
+            ]
+
+        lines = []
+        for labels, counts, total in observations:
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = format_labels(
+                    (*self.label_names, 'le'),
+                    (*labels, bound))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            formatted_labels = format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{formatted_labels} {total}')
+            lines.append(f'{self.name}_count{formatted_labels} {cumulative}')
+        return lines
+
+
+class ExporterMetrics:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Metrics describing the performance of the exporter itself
+    """
+
+    def __init__(self) -> None:
+        self.upstream_request_duration = Histogram(
+            f'{METRIC_PREFIX}_upstream_request_duration_seconds',
+            'Duration of requests to Docker Hub by endpoint (token or rate_limit)',
+            ['endpoint'])
+        self.upstream_errors = Counter(
+            f'{METRIC_PREFIX}_upstream_errors_total',
+            'Failed requests to Docker Hub by endpoint and status code '
+            '(none if no response was received)',
+            ['endpoint', 'status_code'])
+        self.cache_lookups = Counter(
+            f'{METRIC_PREFIX}_cache_lookups_total',
+            'Lookups of cached rate limit by result (hit, stale or miss)',
+            ['result'])
+        self.cache_refreshes = Counter(
+            f'{METRIC_PREFIX}_cache_refreshes_total',
+            'Refreshes of cached rate limit by result (success or error)',
+            ['result'])
+        self.upstream_circuits_open = Gauge(
+            f'{METRIC_PREFIX}_upstream_circuits_open',
+            'Credentials for which requests to Docker Hub are suspended after failures')
+        self.account_refresh_errors = Counter(
+            f'{METRIC_PREFIX}_account_refresh_errors_total',
+            'Failed refreshes of the rate limit of monitored accounts by account',
+            ['account'])
+        self.stale_responses = Counter(
+            f'{METRIC_PREFIX}_stale_responses_total',
+            'Rate limits served past their cache TTL because refreshing failed '
+            'or requests to Docker Hub are suspended')
+        self.http_request_duration = Histogram(
+            f'{METRIC_PREFIX}_http_request_duration_seconds',
+            'Duration of handling requests to the HTTP server')
+        self.http_requests_in_flight = Gauge(
+            f'{METRIC_PREFIX}_http_requests_in_flight',
+            'Requests to the HTTP server currently being handled')
+        self.watchers = Gauge(
+            f'{METRIC_PREFIX}_watchers',
+            'Clients waiting for the rate limit to change on the /watch endpoint')
+
+    @contextmanager
+    def upstream_request(self, endpoint: str) -> Iterator[None]:
+        """
+        Measure duration of request to Docker Hub and count it as failed
+        if no response was received
+
+        :param endpoint: Name of endpoint the request is sent to
+        :raises Exception: Any error raised while sending the request
+        """
+
+        with self.upstream_request_duration.measure(endpoint):
+            try:
+                yield
+            except Exception:
+                self.upstream_errors.inc(endpoint, 'none')
+                raise
+
+    def upstream_response(self, endpoint: str, status_code: int) -> None:
+        """
+        Count response of Docker Hub as failed if it does not have status
+        code HTTP-200
+
+        :param endpoint: Name of endpoint the request has been sent to
+        :param status_code: Status code of response
+        """
+
+        if status_code != 200:
+            self.upstream_errors.inc(endpoint, str(status_code))
+
+    @contextmanager
+    def http_request(self) -> Iterator[None]:
+        """
+        Measure duration of handling request to the HTTP server and count
+        it as in flight meanwhile
+        """
+
+        with self.http_requests_in_flight.track_in_progress(), self.http_request_duration.measure():
+            yield
+
+    def render(self) -> str:
+        """
+        Render all metrics in prometheus text format
+
+        :return: Metrics, one per line
+        """
+
+        metrics: List[Metric] = [
+            self.upstream_request_duration,
+            self.upstream_errors,
+            self.cache_lookups,
+            self.cache_refreshes,
+            self.upstream_circuits_open,
+            self.account_refresh_errors,
+            self.stale_responses,
+            self.http_request_duration,
+            self.http_requests_in_flight,
+            self.watchers,
+        ]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of this process
+EXPORTER_METRICS = ExporterMetrics()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+import http.client
+import math
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from urllib.parse import urlsplit
+
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+from .exporter_client import UnixHTTPConnection
+from .output_format import RateLimitOutputFormat
+
+
+# Percentiles of latency that are reported
+LATENCY_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Number of seconds a client waits after a request failed without response,
+# doubled on every further failure up to the maximum, so an exporter that
+# is down or overloaded is not flooded with connection attempts
+ERROR_BACKOFF = 0.01
+MAX_ERROR_BACKOFF = 1.0
+
+
+def default_request_mix() -> List[str]:
+    """
+    Return paths requested by default: the rate limit in the default
+    format, the metrics and the rate limit in every format
+
+    :return: Paths to request in turn
+    """
+
+    return ['/', '/metrics'] + [
+        f'/?format={output_format}'
+        for output_format in RateLimitOutputFormat.__members__.values()]
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """
+    Return percentile of values using the nearest-rank method
+
+    :param values: Values sorted in ascending order
+    :param percent: Percentile to return (0 - 100)
+    :return: Value at percentile or NaN if there are no values
+    """
+
+    if len(values) == 0:
+        return math.nan
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Summarize latencies in milliseconds
+
+    :param latencies: Latencies in seconds, sorted in ascending order
+    :return: Minimum, mean, maximum and percentiles, None if there are no
+        latencies
+    """
+
+    if len(latencies) == 0:
+        return {'min': None, 'mean': None, 'max': None, **{
+            f'p{percent:g}': None for percent in LATENCY_PERCENTILES}}
+
+    summary = {
+        'min': latencies[0],
+        'mean': sum(latencies) / len(latencies),
+        'max': latencies[-1],
+        **{f'p{percent:g}': percentile(latencies, percent) for percent in LATENCY_PERCENTILES},
+    }
+    milliseconds: Dict[str, Optional[float]] = {
+        name: round(value * 1000, 3) for name, value in summary.items()}
+    return milliseconds
+
+
+@dataclass
+class RequestStats:
+    """Outcome of requests to a single path"""
+
+    latencies: List[float] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+    bytes_received: int = 0
+
+    def add_error(self, kind: str) -> None:
+        """
+        Count failed request
+
+        :param kind: Status code or exception the request failed with
+        """
+
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other: 'RequestStats') -> None:
+        """
+        Add outcome of other requests to the same path
+
+        :param other: Outcome to add
+        """
+
+        self.latencies.extend(other.latencies)
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.bytes_received += other.bytes_received
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        """
+        Summarize outcome of requests
+
+        :param elapsed: Number of seconds requests have been sent for
+        :return: Number of requests and errors, requests per second,
+            latency in milliseconds and bytes received
+        """
+
+        self.latencies.sort()
+        return {
+            'requests': len(self.latencies),
+            'requests_per_second': round(len(self.latencies) / elapsed, 1),
+            'errors': sum(self.errors.values()),
+            'errors_by_kind': dict(sorted(self.errors.items())),
+            'latency_ms': latency_summary(self.latencies),
+            'bytes_received': self.bytes_received,
+        }
+
+
+class LoadTest:  # pylint: disable=too-many-instance-attributes
+    """
+    Sends GET requests to a running exporter from multiple threads for a
+    fixed time and measures latency, errors and bytes received.
+
+    Every request that got a response counts, responses with a status
+    code of 400 or higher also count as errors. Requests that did not get
+    a response only count as errors.
+
+    :param url: Base URL of exporter (http or https)
+    :param paths: Paths to request in turn
+    :param concurrency: Number of concurrent clients
+    :param duration: Number of seconds to send requests for
+    :param keep_alive: Whether clients reuse their connection, otherwise
+        every request uses a new one
+    :param timeout: Seconds to wait for connection and response
+    :param unix_socket: Path of Unix domain socket of exporter to connect
+        to instead of host and port of URL
+    :param headers: Additional headers sent with every request, e.g.
+        Accept-Encoding
+    :raises ValueError: If URL is not a http or https URL
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            url: str,
+            paths: Sequence[str],
+            concurrency: int,
+            duration: float,
+            keep_alive: bool=True,
+            timeout: float=10,
+            unix_socket: Optional[str]=None,
+            headers: Optional[Dict[str, str]]=None) -> None:
+
+        parsed = urlsplit(url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise ValueError(f'"{url}" is not a http or https URL')
+
+        self.url = url
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.paths = list(paths)
+        self.concurrency = concurrency
+        self.duration = duration
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.unix_socket = unix_socket
+        self.headers = dict(headers or {})
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+
+    def connect(self) -> http.client.HTTPConnection:
+        """
+        Create connection to exporter, it is established on first request
+
+        :return: Connection to exporter
+        """
+
+        if self.unix_socket is not None:
+            return UnixHTTPConnection(self.unix_socket, self.timeout)
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def run_client(self, deadline: float, offset: int) -> Dict[str, RequestStats]:
+        """
+        Send requests until deadline
+
+        :param deadline: Value of monotonic clock at which to stop
+        :param offset: Index of first path to request, so clients do not
+            request the same path at the same time
+        :return: Outcome of requests by path
+        """
+
+        stats = {path: RequestStats() for path in self.paths}
+        conn = self.connect()
+        index = offset
+        backoff = ERROR_BACKOFF
+        try:
+            while time.monotonic() < deadline:
+                path = self.paths[index % len(self.paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers=self.headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException) as err:
+                    stats[path].add_error(type(err).__name__)
+                    conn.close()
+                    time.sleep(max(0.0, min(backoff, deadline - time.monotonic())))
+                    backoff = min(2 * backoff, MAX_ERROR_BACKOFF)
+                    continue
+
+                backoff = ERROR_BACKOFF
+                stats[path].latencies.append(time.perf_counter() - start)
+                stats[path].bytes_received += len(body)
+                if response.status >= 400:
+                    stats[path].add_error(str(response.status))
+                if not self.keep_alive or response.will_close:
+                    conn.close()
+        finally:
+            conn.close()
+        return stats
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Send requests from all clients and summarize their outcome
+
+        :return: Configuration of test and outcome of all requests and of
+            requests to each path
+        """
+
+        results: List[Dict[str, RequestStats]] = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + self.duration
+
+        def client(offset: int) -> None:
+            stats = self.run_client(deadline, offset)
+            with lock:
+                results.append(stats)
+
+        start = time.monotonic()
+        threads = [
+            threading.Thread(target=client, args=(offset,), daemon=True)
+            for offset in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+
+        by_path = {path: RequestStats() for path in self.paths}
+        total = RequestStats()
+        for stats in results:
+            for path, path_stats in stats.items():
+                by_path[path].merge(path_stats)
+                total.merge(path_stats)
+
+        return {
+            'url': self.url,
+            'unix_socket': self.unix_socket,
+            'concurrency': self.concurrency,
+            'keep_alive': self.keep_alive,
+            'duration': round(elapsed, 3),
+            **total.summary(elapsed),
+            'paths': {path: stats.summary(elapsed) for path, stats in by_path.items()},
+        }
@@ -9,6 +9,20 @@ class RateLimitOutputFormat(str, Enum):
     JSON = 'json'
     PROMETHEUS = 'prometheus'
     YAML = 'yaml'
+    JSON_COMPACT = 'json-compact'
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+    OPENMETRICS = 'openmetrics'
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class RateLimitStreamFormat(str, Enum):
+    """Format for streaming Docker Hub rate limit, one line per record"""
+
+    NDJSON = 'ndjson'
+    LINE = 'line'
 
     def __str__(self) -> str:
         return self.value
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+
+import contextlib
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from typing import Any
+from typing import NoReturn
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Union
+
+from requests.exceptions import RequestException
+
+from .account_pool import DockerHubAccountPool
+from .circuit_breaker import CircuitOpenError
+from .docker_hub_requestor import DockerHubRequestor
+from .http_server import DockerRateLimitHTTPServer
+from .shared_cache import SharedRateLimitCache
+
+
+class SharedCacheRefresher:  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps the rate limit in a :class:`SharedRateLimitCache` current using
+    a requestor that queries Docker Hub. Only the process running the
+    refresher sends requests to Docker Hub, all other processes read the
+    shared cache.
+
+    :param requestor: Requestor for querying Docker Hub. It should not
+        cache information itself (cache TTL and grace periods of 0), as
+        the refresher decides when to query Docker Hub.
+    :param shared_cache: Cache shared with worker processes
+    :param cache_ttl: Number of seconds information in shared cache is
+        fresh
+    :param refresh_ahead: Number of seconds before cache expiry at which
+        to refresh the cache without waiting for a worker to ask for it.
+        0 to only refresh when asked.
+    :param retry_interval: Number of seconds to wait before querying
+        Docker Hub again after a refresh failed
+    :raises ValueError: If refresh_ahead is not shorter than cache_ttl,
+        the cache would be refreshed continuously
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            requestor: Union[DockerHubRequestor, DockerHubAccountPool],
+            shared_cache: SharedRateLimitCache,
+            cache_ttl: float,
+            refresh_ahead: float=0,
+            retry_interval: float=1.0) -> None:
+
+        if 0 < cache_ttl <= refresh_ahead:
+            raise ValueError(
+                f'Refresh ahead of {refresh_ahead} seconds has to be shorter '
+                f'than cache TTL of {cache_ttl} seconds')
+
+        self.requestor = requestor
+        self.shared_cache = shared_cache
+        self.cache_ttl = cache_ttl
+        self.refresh_ahead = refresh_ahead
+        self.retry_interval = retry_interval
+
+        self.refreshes = 0
+        self._handled_requests = 0
+        self._retry_at = 0.0
+        self._last_error: Optional[str] = None
+        # Time (time.time()) until which the circuit breaker of the
+        # requestor does not let requests to Docker Hub through
+        self._circuit_open_until = 0.0
+
+    def refresh(self) -> None:
+        """
+        Query Docker Hub and publish the result to the shared cache
+        """
+
+        self.refreshes += 1
+        started = time.time()
+        try:
+            # Information the requestor falls back to, e.g. while its
+            # circuit breaker is open, must not be published as fresh
+            rate_limit = self.requestor.get_rate_limit(allow_stale=False)
+        except (RequestException, KeyError, ValueError) as err:
+            print(f'Error: Refreshing rate limit failed: {err}', file=sys.stderr)
+            self._last_error = str(err) or type(err).__name__
+            self._retry_at = time.monotonic() + self.retry_interval
+            self._circuit_open_until = time.time() + self.seconds_until_retry(err)
+            self.shared_cache.publish(
+                error=self._last_error,
+                retry_at=self._circuit_open_until)
+            return
+
+        self._last_error = None
+        self._circuit_open_until = 0.0
+        self.shared_cache.publish(rate_limit, started, history=self.requestor.history)
+
+    def seconds_until_retry(self, err: Exception) -> float:
+        """
+        Determine for how long Docker Hub is not queried after a failed
+        refresh because the circuit breaker of the requestor is open
+
+        :param err: Error that occurred while refreshing
+        :return: Seconds until Docker Hub is queried again (0 if the
+            circuit is closed)
+        """
+
+        if isinstance(err, CircuitOpenError):
+            return err.seconds_until_retry
+        # Failure may just have opened the circuit. Accounts of a pool are
+        # only all left out until the first one is queried again.
+        if isinstance(self.requestor, DockerHubRequestor):
+            return self.requestor.circuit_breaker.seconds_until_retry
+        seconds: float = min(
+            (requestor.circuit_breaker.seconds_until_retry
+             for requestor in self.requestor.requestors.values()),
+            default=0.0)
+        return seconds
+
+    def seconds_until_due(self) -> float:
+        """
+        Calculate number of seconds until the shared cache has to be
+        refreshed without being asked to
+
+        :return: Seconds until next refresh (0 if refresh is due, infinite
+            if refreshes are only done when asked)
+        """
+
+        if self.refresh_ahead <= 0:
+            return float('inf')
+
+        backoff = max(0.0, self._retry_at - time.monotonic())
+        snapshot = self.shared_cache.read()
+        if snapshot.rate_limit is None:
+            return backoff
+        age = time.time() - snapshot.refreshed_at
+        return max(backoff, self.cache_ttl - self.refresh_ahead - age)
+
+    def is_expired(self) -> bool:
+        """
+        Check whether rate limit in shared cache has to be refreshed
+        before workers can use it
+
+        :return: True if there is no fresh rate limit
+        """
+
+        snapshot = self.shared_cache.read()
+        return (
+            snapshot.rate_limit is None
+            or time.time() - snapshot.refreshed_at > self.cache_ttl)
+
+    def run_once(self, timeout: float) -> None:
+        """
+        Wait for a worker to ask for a refresh or for a refresh to be due
+        and refresh the shared cache
+
+        :param timeout: Number of seconds to wait at most
+        """
+
+        requests = self.shared_cache.wait_for_refresh_request(
+            self._handled_requests,
+            min(timeout, self.seconds_until_due()))
+        requested = requests != self._handled_requests
+        self._handled_requests = requests
+
+        # Workers that asked while a refresh was running have been
+        # answered by that refresh already
+        if not (requested and self.is_expired()) and self.seconds_until_due() > 0:
+            return
+
+        # Do not hammer Docker Hub after a failed refresh, answer waiting
+        # workers with the previous error instead
+        if time.monotonic() < self._retry_at:
+            self.shared_cache.publish(
+                error=self._last_error,
+                retry_at=self._circuit_open_until)
+            return
+
+        self.refresh()
+
+
+class PreforkServer:
+    """
+    Runs a HTTP server in multiple worker processes that share its
+    listening socket, so requests are handled on multiple cores.
+
+    The workers read the rate limit from a shared cache, which is kept
+    current by the main process, so Docker Hub is queried by one process
+    regardless of the number of workers. Workers that exit unexpectedly
+    are replaced.
+
+    :param server: Bound HTTP server answering requests from the shared
+        cache. Its socket is inherited by the workers.
+    :param refresher: Refresher keeping the shared cache current
+    :param processes: Number of worker processes
+    :param additional_servers: Bound HTTP servers, e.g. listening on a Unix
+        domain socket, that are served by every worker in addition to
+        the server
+    """
+
+    def __init__(
+            self,
+            server: DockerRateLimitHTTPServer,
+            refresher: SharedCacheRefresher,
+            processes: int,
+            additional_servers: Sequence[DockerRateLimitHTTPServer]=()) -> None:
+
+        self.server = server
+        self.additional_servers = list(additional_servers)
+        self.refresher = refresher
+        self.processes = processes
+        self.workers: Set[int] = set()
+        self._stop_event = threading.Event()
+
+    def start_worker(self) -> int:
+        """
+        Fork worker process serving requests until it is terminated
+
+        :return: Process ID of worker
+        """
+
+        pid = os.fork()
+        if pid == 0:
+            self.run_worker()
+
+        self.workers.add(pid)
+        return pid
+
+    def run_worker(self) -> NoReturn:
+        """
+        Serve requests in forked worker process until it is terminated
+        """
+
+        exit_code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            for server in self.additional_servers:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.server.serve_forever()
+        except BaseException:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            os._exit(exit_code)  # pylint: disable=protected-access
+
+    def reap_workers(self) -> None:
+        """
+        Collect exited worker processes and replace them unless the server
+        is shutting down
+        """
+
+        for pid in list(self.workers):
+            try:
+                exited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                exited, status = pid, 0
+            if exited == 0:
+                continue
+
+            self.workers.discard(pid)
+            if not self._stop_event.is_set():
+                print(
+                    f'Error: Worker {pid} exited with status {status}, starting new worker',
+                    file=sys.stderr)
+                self.start_worker()
+
+    def serve_forever(self, poll_interval: float=0.5) -> None:
+        """
+        Start worker processes and refresh shared cache until
+        :meth:`shutdown` is called or SIGTERM or SIGINT is received.
+
+        :param poll_interval: Number of seconds between checks for exited
+            workers and shutdown
+        """
+
+        # Signal handlers can only be installed in the main thread
+        if threading.current_thread() is threading.main_thread():
+            def stop(*_: Any) -> None:
+                self._stop_event.set()
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+
+        try:
+            for _ in range(self.processes):
+                self.start_worker()
+
+            while not self._stop_event.is_set():
+                self.refresher.run_once(poll_interval)
+                self.reap_workers()
+        finally:
+            self.stop_workers()
+
+    def shutdown(self) -> None:
+        """
+        Stop :meth:`serve_forever` loop and all worker processes
+        """
+
+        self._stop_event.set()
+
+    def stop_workers(self) -> None:
+        """
+        Terminate all worker processes and wait for them to exit
+        """
+
+        self._stop_event.set()
+        for pid in self.workers:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+        for pid in self.workers:
+            with contextlib.suppress(ChildProcessError):
+                os.waitpid(pid, 0)
+        self.workers.clear()
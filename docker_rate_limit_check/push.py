@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+
+import socket
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import requests
+from requests.exceptions import RequestException
+
+from .account_pool import DockerHubAccountPool
+from .docker_hub_requestor import DockerHubRequestor
+from .docker_rate_limit import RATE_LIMIT_METRICS
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .instrumentation import EXPORTER_METRICS
+from .instrumentation import format_labels
+
+
+# Job name used when pushing to a Prometheus Pushgateway
+DEFAULT_PUSHGATEWAY_JOB = 'docker_rate_limit_check'
+
+# Characters separating StatsD tags, replaced in tag values
+STATSD_TAG_SEPARATORS = str.maketrans('|,#\n', '____')
+
+# Largest StatsD datagram that is not fragmented on common networks
+STATSD_MAX_PACKET_SIZE = 1432
+
+# Maximum number of samples sent in a single remote-write request
+REMOTE_WRITE_BATCH_SIZE = 500
+
+# Maximum number of samples kept for retrying while remote-write fails
+REMOTE_WRITE_MAX_PENDING = 10000
+
+
+@dataclass(frozen=True)
+class PushSample:
+    """Value of a single metric to push"""
+
+    name: str
+    labels: Tuple[Tuple[str, str], ...]
+    value: float
+
+
+def rate_limit_samples(
+        rate_limit: Union[DockerRateLimit, DockerRateLimitGroup]) -> Tuple[PushSample, ...]:
+    """
+    Convert rate limit to samples of the metrics also exposed by the
+    HTTP server in prometheus format
+
+    :param rate_limit: Rate limit of single account or of multiple accounts
+    :return: Samples of all metrics
+    """
+
+    labeled: List[Tuple[Tuple[Tuple[str, str], ...], DockerRateLimit]]
+    if isinstance(rate_limit, DockerRateLimitGroup):
+        labeled = [
+            ((('account', account), ('identifier', str(account_rate_limit.identifier))),
+             account_rate_limit)
+            for account, account_rate_limit in rate_limit.rate_limits.items()]
+    else:
+        labeled = [((('identifier', str(rate_limit.identifier)),), rate_limit)]
+
+    return tuple(
+        PushSample(name, labels, float(getattr(labeled_rate_limit, attr)))
+        for name, _, attr in RATE_LIMIT_METRICS
+        for labels, labeled_rate_limit in labeled)
+
+
+def format_value(value: float) -> str:
+    """
+    Format value of sample without a fractional part if possible
+
+    :param value: Value to format
+    :return: Formatted value
+    """
+
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class PushSink:
+    """
+    Destination rate limit metrics are pushed to.
+    Samples are only sent if they changed since they were last sent
+    successfully.
+    """
+
+    def __init__(self) -> None:
+        self.last_pushed: Optional[Tuple[PushSample, ...]] = None
+
+    def push(self, samples: Sequence[PushSample], timestamp: float) -> bool:
+        """
+        Send samples unless they have already been sent
+
+        :param samples: Samples to send
+        :param timestamp: Time (see :func:`time.time`) the samples were taken at
+        :return: True if samples were sent, False if they did not change
+        """
+
+        samples = tuple(samples)
+        if samples == self.last_pushed:
+            return False
+
+        self.send(samples, timestamp)
+        self.last_pushed = samples
+        return True
+
+    def send(self, samples: Tuple[PushSample, ...], timestamp: float) -> None:
+        """
+        Send samples to destination
+
+        :param samples: Samples to send
+        :param timestamp: Time (see :func:`time.time`) the samples were taken at
+        :raises NotImplementedError: Has to be implemented by subclasses
+        """
+
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """
+        Release connections to destination
+        """
+
+
+class PushgatewaySink(PushSink):
+    """
+    Pushes samples to a Prometheus Pushgateway, replacing all metrics of
+    the job, so metrics of accounts that are no longer monitored vanish.
+
+    :param url: Base URL of Pushgateway
+    :param session: Session keeping the connection to the Pushgateway alive
+    :param job: Job name to group metrics by
+    :param timeout: Seconds to wait for connection and response
+    """
+
+    def __init__(
+            self,
+            url: str,
+            session: requests.Session,
+            job: str=DEFAULT_PUSHGATEWAY_JOB,
+            timeout: Tuple[float, float]=(10, 10)) -> None:
+
+        super().__init__()
+        self.url = f'{url.rstrip("/")}/metrics/job/{urllib.parse.quote(job, safe="")}'
+        self.session = session
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        return f'Pushgateway {self.url}'
+
+    def send(self, samples: Tuple[PushSample, ...], timestamp: float) -> None:
+        """
+        Replace metrics of job on Pushgateway
+
+        :param samples: Samples to send
+        :param timestamp: Ignored, the Pushgateway records the push time itself
+        :raises RequestException: If Pushgateway did not accept the metrics
+        """
+
+        lines = []
+        for name, description, _ in RATE_LIMIT_METRICS:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            for sample in samples:
+                if sample.name != name:
+                    continue
+                labels = format_labels(
+                    [label for label, _ in sample.labels],
+                    [value for _, value in sample.labels])
+                lines.append(f'{name}{labels} {format_value(sample.value)}')
+
+        response = self.session.put(
+            self.url,
+            data=('\n'.join(lines) + '\n').encode('utf-8'),
+            headers={'Content-Type': 'text/plain; version=0.0.4'},
+            timeout=self.timeout)
+        EXPORTER_METRICS.upstream_response('pushgateway', response.status_code)
+        if response.status_code not in (200, 202):
+            raise RequestException(
+                f'Pushgateway responded with status code {response.status_code}')
+
+
+class StatsDSink(PushSink):
+    """
+    Sends samples as StatsD gauges over UDP. Labels are sent as tags in
+    the format understood by DogStatsD and Telegraf. As many gauges as
+    possible are sent in a single datagram.
+
+    :param host: Host of StatsD server
+    :param port: Port of StatsD server
+    :param prefix: Prefix of metric names
+    :param max_packet_size: Maximum size of datagrams in bytes
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int=8125,
+            prefix: str='',
+            max_packet_size: int=STATSD_MAX_PACKET_SIZE) -> None:
+
+        super().__init__()
+        self.address = (host, port)
+        self.prefix = prefix
+        self.max_packet_size = max_packet_size
+        self._socket: Optional[socket.socket] = None
+
+    def __str__(self) -> str:
+        return f'StatsD {self.address[0]}:{self.address[1]}'
+
+    def format_gauge(self, sample: PushSample) -> bytes:
+        """
+        Format sample as StatsD gauge
+
+        :param sample: Sample to format
+        :return: Gauge in StatsD line format
+        """
+
+        tags = ','.join(
+            f'{label}:{value.translate(STATSD_TAG_SEPARATORS)}'
+            for label, value in sample.labels)
+        return f'{self.prefix}{sample.name}:{format_value(sample.value)}|g|#{tags}'.encode()
+
+    def packets(self, samples: Iterable[PushSample]) -> List[bytes]:
+        """
+        Combine gauges of samples into as few datagrams as possible
+
+        :param samples: Samples to send
+        :return: Datagrams to send
+        """
+
+        packets = []
+        packet = b''
+        for sample in samples:
+            gauge = self.format_gauge(sample)
+            if packet and len(packet) + 1 + len(gauge) > self.max_packet_size:
+                packets.append(packet)
+                packet = b''
+            packet = packet + b'\n' + gauge if packet else gauge
+        if packet:
+            packets.append(packet)
+        return packets
+
+    def send(self, samples: Tuple[PushSample, ...], timestamp: float) -> None:
+        """
+        Send samples as gauges to StatsD server
+
+        :param samples: Samples to send
+        :param timestamp: Ignored, StatsD records the receive time itself
+        """
+
+        if self._socket is None:
+            family = socket.getaddrinfo(*self.address, type=socket.SOCK_DGRAM)[0][0]
+            self._socket = socket.socket(family, socket.SOCK_DGRAM)
+            self._socket.connect(self.address)
+
+        for packet in self.packets(samples):
+            self._socket.send(packet)
+
+    def close(self) -> None:
+        """
+        Close socket
+        """
+
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode unsigned integer as protobuf varint
+
+    :param value: Integer to encode
+    :return: Encoded integer
+    """
+
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append((value & 0x7f) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def encode_length_delimited(field_number: int, payload: bytes) -> bytes:
+    """
+    Encode protobuf field of type string, bytes or embedded message
+
+    :param field_number: Number of field
+    :param payload: Content of field
+    :return: Encoded field
+    """
+
+    return encode_varint(field_number << 3 | 2) + encode_varint(len(payload)) + payload
+
+
+def encode_write_request(series: Iterable[Tuple[PushSample, float]]) -> bytes:
+    """
+    Encode samples as Prometheus remote-write ``WriteRequest`` protobuf
+    message, one time series per sample
+
+    :param series: Samples with the time (see :func:`time.time`) they were
+        taken at
+    :return: Encoded message
+    """
+
+    message = bytearray()
+    for sample, timestamp in series:
+        time_series = bytearray()
+
+        # Labels have to be sorted by name
+        labels = sorted((('__name__', sample.name),) + sample.labels)
+        for name, value in labels:
+            time_series += encode_length_delimited(
+                1,
+                encode_length_delimited(1, name.encode('utf-8'))
+                + encode_length_delimited(2, value.encode('utf-8')))
+
+        # Sample consists of double value and int64 timestamp in milliseconds
+        encoded_sample = (
+            b'\x09' + struct.pack('<d', sample.value)
+            + b'\x10' + encode_varint(int(timestamp * 1000)))
+        time_series += encode_length_delimited(2, encoded_sample)
+
+        message += encode_length_delimited(1, bytes(time_series))
+    return bytes(message)
+
+
+def snappy_compress(data: bytes) -> bytes:
+    """
+    Encode data in snappy block format as required by remote-write.
+    Data is stored as literals without actually compressing it, which is
+    valid snappy and avoids depending on a snappy library for messages
+    of a few hundred bytes.
+
+    :param data: Data to encode
+    :return: Encoded data
+    """
+
+    encoded = bytearray(encode_varint(len(data)))
+    for offset in range(0, len(data), 65536):
+        chunk = data[offset:offset + 65536]
+        length = len(chunk) - 1
+        if length < 60:
+            encoded.append(length << 2)
+        elif length < 0x100:
+            encoded += bytes((60 << 2, length))
+        else:
+            encoded += bytes((61 << 2,)) + length.to_bytes(2, 'little')
+        encoded += chunk
+    return bytes(encoded)
+
+
+class RemoteWriteSink(PushSink):
+    """
+    Sends samples to an endpoint implementing the Prometheus remote-write
+    protocol. Samples that could not be sent are kept and sent together
+    with the next ones.
+
+    :param url: URL of remote-write endpoint
+    :param session: Session keeping the connection to the endpoint alive
+    :param batch_size: Maximum number of samples per request
+    :param max_pending: Maximum number of samples kept while sending fails.
+        The oldest samples are dropped first.
+    :param timeout: Seconds to wait for connection and response
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            url: str,
+            session: requests.Session,
+            batch_size: int=REMOTE_WRITE_BATCH_SIZE,
+            max_pending: int=REMOTE_WRITE_MAX_PENDING,
+            timeout: Tuple[float, float]=(10, 10)) -> None:
+
+        super().__init__()
+        self.url = url
+        self.session = session
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending: List[Tuple[PushSample, float]] = []
+
+    def __str__(self) -> str:
+        return f'remote-write endpoint {self.url}'
+
+    def send(self, samples: Tuple[PushSample, ...], timestamp: float) -> None:
+        """
+        Send samples and previously failed samples in batches
+
+        :param samples: Samples to send
+        :param timestamp: Time (see :func:`time.time`) the samples were taken at
+        :raises RequestException: If endpoint did not accept the samples
+        """
+
+        self.pending.extend((sample, timestamp) for sample in samples)
+        del self.pending[:-self.max_pending]
+
+        while self.pending:
+            batch = self.pending[:self.batch_size]
+            response = self.session.post(
+                self.url,
+                data=snappy_compress(encode_write_request(batch)),
+                headers={
+                    'Content-Encoding': 'snappy',
+                    'Content-Type': 'application/x-protobuf',
+                    'X-Prometheus-Remote-Write-Version': '0.1.0',
+                },
+                timeout=self.timeout)
+            EXPORTER_METRICS.upstream_response('remote_write', response.status_code)
+
+            # Samples rejected as malformed would be rejected again
+            if response.status_code >= 500 or response.status_code == 429:
+                raise RequestException(
+                    f'Remote-write endpoint responded with status code {response.status_code}')
+            del self.pending[:len(batch)]
+            if response.status_code >= 300:
+                raise RequestException(
+                    f'Remote-write endpoint rejected samples with status code '
+                    f'{response.status_code}')
+
+
+class Pusher:
+    """
+    Refreshes rate limit on a schedule and pushes it to sinks whenever it
+    changed.
+
+    :param requestor: Requestor (or pool of requestors) to get rate limit from
+    :param sinks: Destinations to push rate limit to
+    :param interval: Number of seconds between refreshes
+    """
+
+    def __init__(
+            self,
+            requestor: Union[DockerHubRequestor, DockerHubAccountPool],
+            sinks: Sequence[PushSink],
+            interval: float) -> None:
+
+        self.requestor = requestor
+        self.sinks = list(sinks)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def push_once(self) -> None:
+        """
+        Refresh rate limit and push it to every sink it changed for
+        """
+
+        try:
+            rate_limit = self.requestor.get_rate_limit()
+        except (RequestException, KeyError, ValueError) as err:
+            print(f'Error: Refreshing rate limit failed: {err}', file=sys.stderr)
+            return
+
+        samples = rate_limit_samples(rate_limit)
+        timestamp = time.time()
+        for sink in self.sinks:
+            try:
+                sink.push(samples, timestamp)
+            except OSError as err:
+                print(f'Error: Pushing to {sink} failed: {err}', file=sys.stderr)
+
+    def run(self) -> None:
+        """
+        Push rate limit until stopped
+        """
+
+        try:
+            while not self._stop_event.is_set():
+                start = time.monotonic()
+                self.push_once()
+                self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - start)))
+        finally:
+            for sink in self.sinks:
+                sink.close()
+
+    def stop(self) -> None:
+        """
+        Stop pushing after the current push
+        """
+
+        self._stop_event.set()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import sys
+import threading
+import time
+
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import TextIO
+from typing import Union
+
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .output_format import RateLimitStreamFormat
+
+
+# Rate limit of one or many accounts
+RateLimit = Union[DockerRateLimit, DockerRateLimitGroup]
+
+# Rate limit of a single account as output
+RateLimitRecord = Dict[str, Union[Optional[str], int]]
+
+
+def rate_limit_records(rate_limit: RateLimit) -> List[RateLimitRecord]:
+    """
+    Split rate limit into one record per account
+
+    :param rate_limit: Rate limit of one or many accounts
+    :return: Attributes of rate limit of every account
+    """
+
+    if isinstance(rate_limit, DockerRateLimitGroup):
+        return rate_limit.asdicts()
+    return [rate_limit.asdict()]
+
+
+def format_logfmt_value(value: Union[Optional[str], int]) -> str:
+    """
+    Format value of single-line record, quoting it if necessary
+
+    :param value: Value of attribute of rate limit
+    :return: Value as it appears in single-line record
+    """
+
+    if value is None:
+        return ''
+    text = str(value)
+    if not text or any(char in text for char in ' "=\\'):
+        return json.dumps(text)
+    return text
+
+
+def format_records(
+        records: List[RateLimitRecord],
+        timestamp: float,
+        stream_format: RateLimitStreamFormat) -> str:
+    """
+    Format records of one refresh, one line per record
+
+    :param records: Attributes of rate limit of every account
+    :param timestamp: Time of refresh as Unix timestamp
+    :param stream_format: Format of every line
+    :return: Lines including trailing newline
+    """
+
+    refreshed = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    time_text = refreshed.isoformat(timespec='seconds')
+    lines = []
+    for record in records:
+        if stream_format == RateLimitStreamFormat.NDJSON:
+            lines.append(json.dumps({'time': time_text, **record}, separators=(',', ':')))
+        else:
+            lines.append(' '.join(
+                [f'time={time_text}']
+                + [f'{key}={format_logfmt_value(value)}' for key, value in record.items()]))
+    return ''.join(f'{line}\n' for line in lines)
+
+
+class RateLimitStreamer:
+    """
+    Refreshes rate limit on a schedule and writes one line per account and
+    refresh to a stream, e.g. to be read by another program through a
+    pipe.
+
+    :param get_rate_limit: Function refreshing the rate limit. It is
+        called for every refresh, so it should reuse connections.
+    :param interval: Number of seconds between refreshes
+    :param stream_format: Format of every line
+    :param changes_only: Whether to only write rate limits that differ
+        from the last one written
+    :param output: Stream to write to
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            get_rate_limit: Callable[[], RateLimit],
+            interval: float,
+            stream_format: RateLimitStreamFormat=RateLimitStreamFormat.NDJSON,
+            changes_only: bool=False,
+            output: TextIO=sys.stdout) -> None:
+
+        self.get_rate_limit = get_rate_limit
+        self.interval = interval
+        self.stream_format = stream_format
+        self.changes_only = changes_only
+        self.output = output
+        self.last_records: Optional[List[RateLimitRecord]] = None
+        self._stop_event = threading.Event()
+
+    def refresh_once(self) -> bool:
+        """
+        Refresh rate limit and write it unless only changes are written and
+        it did not change
+
+        :return: Whether the rate limit was written
+        """
+
+        try:
+            rate_limit = self.get_rate_limit()
+        except (OSError, KeyError, ValueError) as err:
+            # Errors by requests, the disk cache and the exporter are OSErrors
+            print(f'Error: Refreshing rate limit failed: {err}', file=sys.stderr)
+            return False
+
+        records = rate_limit_records(rate_limit)
+        if self.changes_only and records == self.last_records:
+            return False
+        self.last_records = records
+
+        # Readers of a pipe should not have to wait for the buffer to fill
+        self.output.write(format_records(records, time.time(), self.stream_format))
+        self.output.flush()
+        return True
+
+    def run(self) -> None:
+        """
+        Write rate limit until stopped
+        """
+
+        while not self._stop_event.is_set():
+            start = time.monotonic()
+            self.refresh_once()
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - start)))
+
+    def stop(self) -> None:
+        """
+        Stop writing after the current refresh
+        """
+
+        self._stop_event.set()
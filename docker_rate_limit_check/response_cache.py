@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+
+import gzip
+import hashlib
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+
+from typing import TYPE_CHECKING
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .docker_hub_requestor import DockerHubRequestorBase
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .output_format import RateLimitOutputFormat
+
+
+# Only needed for type hints, importing them would load the requestors of
+# every server mode
+if TYPE_CHECKING:
+    from .account_pool import DockerHubAccountPool
+    from .async_requestor import AsyncDockerHubAccountPool
+    from .shared_cache import SharedCacheRequestor
+
+
+# Rate limit of one or many accounts
+RateLimit = Union[DockerRateLimit, DockerRateLimitGroup]
+
+# Requestor caching rate limit of one or many accounts
+CachingRequestor = Union[
+    DockerHubRequestorBase,
+    'DockerHubAccountPool',
+    'AsyncDockerHubAccountPool',
+    'SharedCacheRequestor']
+
+# Value of Content-Type header for each output format
+CONTENT_TYPES = {
+    RateLimitOutputFormat.JSON: 'application/json',
+    RateLimitOutputFormat.YAML: 'application/yaml',
+    RateLimitOutputFormat.PROMETHEUS: 'text/plain; version=0.0.4; charset=utf-8',
+    RateLimitOutputFormat.JSON_COMPACT: 'application/json',
+    RateLimitOutputFormat.NDJSON: 'application/x-ndjson',
+    RateLimitOutputFormat.CSV: 'text/csv; charset=utf-8; header=present',
+    RateLimitOutputFormat.OPENMETRICS: 'application/openmetrics-text; version=1.0.0; charset=utf-8',
+}
+
+# Content codings responses can be compressed with, preferred first
+CONTENT_ENCODINGS = ('gzip', 'deflate')
+
+# Smallest body in bytes that is compressed by default. Smaller bodies
+# barely shrink and fit into a single packet anyway.
+DEFAULT_COMPRESSION_MIN_SIZE = 1024
+
+# Compression level of gzip and deflate, the zlib default trades size for
+# speed well
+COMPRESSION_LEVEL = 6
+
+# Header of gzip member without modification time (RFC 1952, section 2.3)
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# Header of zlib stream with 32K window and default compression level
+# (RFC 1950, section 2.2)
+ZLIB_HEADER = b'\x78\x9c'
+
+
+@dataclass(frozen=True)
+class RenderedResponse:
+    """Rate limit rendered in an output format, ready to be sent"""
+
+    body: bytes
+    headers: Dict[str, str]
+
+
+def render_response(
+        rate_limit: RateLimit,
+        output_format: RateLimitOutputFormat) -> RenderedResponse:
+    """
+    Render rate limit in output format and encode it for sending it as
+    body of a HTTP response.
+
+    :param rate_limit: Rate limit to render
+    :param output_format: Format in which to render rate limit
+    :return: Encoded body and matching Content-Length, Content-Type and
+        ETag headers
+    """
+
+    return render_body(rate_limit.render(output_format), output_format)
+
+
+def render_payload(payload: str, output_format: RateLimitOutputFormat) -> RenderedResponse:
+    """
+    Encode payload rendered in output format for sending it as body of a
+    HTTP response.
+
+    :param payload: Rendered payload
+    :param output_format: Format the payload has been rendered in
+    :return: Encoded body and matching Content-Length, Content-Type and
+        ETag headers
+    """
+
+    # End payload with newline character
+    if len(payload) > 0 and payload[-1] != '\n':
+        payload += '\n'
+
+    return render_body(payload.encode('utf-8'), output_format)
+
+
+def render_body(body: bytes, output_format: RateLimitOutputFormat) -> RenderedResponse:
+    """
+    Prepare body rendered in output format for sending it in a HTTP
+    response.
+
+    :param body: Rendered and encoded body ending with a newline character
+    :param output_format: Format the body has been rendered in
+    :return: Body and matching Content-Length, Content-Type and ETag
+        headers
+    """
+
+    digest = hashlib.blake2b(body, digest_size=8, person=output_format.value.encode('utf-8'))
+    headers = {
+        'Content-Length': str(len(body)),
+        'ETag': f'"{digest.hexdigest()}"',
+    }
+
+    # Set Content-Type header accordingly
+    content_type = CONTENT_TYPES.get(output_format)
+    if content_type is not None:
+        headers['Content-Type'] = content_type
+
+    return RenderedResponse(body=body, headers=headers)
+
+
+def with_exporter_metrics(response: RenderedResponse, metrics: str) -> RenderedResponse:
+    """
+    Append metrics describing the exporter itself to rendered prometheus
+    response. The result changes with every request, so it has no ETag.
+
+    :param response: Rendered response containing rate limit
+    :param metrics: Metrics of exporter in prometheus text format
+    :return: Response containing rate limit and metrics of exporter
+    """
+
+    body = response.body + metrics.encode('utf-8')
+    headers = {name: value for name, value in response.headers.items() if name != 'ETag'}
+    headers['Content-Length'] = str(len(body))
+    return RenderedResponse(body=body, headers=headers)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Choose content coding to compress response with based on
+    Accept-Encoding request header (RFC 9110, section 12.5.3).
+
+    :param accept_encoding: Value of Accept-Encoding header if any
+    :return: Supported content coding acceptable to the client, None if
+        response should not be compressed
+    """
+
+    if accept_encoding is None:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        coding, _, parameters = item.partition(';')
+        quality = 1.0
+        parameters = parameters.strip().lower()
+        if parameters.startswith('q='):
+            try:
+                quality = float(parameters[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best_encoding = None
+    best_quality = 0.0
+    for encoding in CONTENT_ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+def compress_response(
+        response: RenderedResponse,
+        encoding: Optional[str],
+        min_size: Optional[int]) -> RenderedResponse:
+    """
+    Compress body of rendered response with content coding. Bodies smaller
+    than the minimum size are not compressed. Larger ones are marked as
+    varying by Accept-Encoding, even if the client does not accept any
+    supported content coding.
+
+    :param response: Rendered uncompressed response
+    :param encoding: Content coding to compress with, None to only mark
+        response
+    :param min_size: Size in bytes of smallest body to compress, None if
+        responses are never compressed
+    :return: Compressed response with matching Content-Encoding,
+        Content-Length and ETag headers
+    """
+
+    if min_size is None or len(response.body) < min_size:
+        return response
+
+    headers = {**response.headers, 'Vary': 'Accept-Encoding'}
+    if encoding is None:
+        return RenderedResponse(body=response.body, headers=headers)
+
+    if encoding == 'gzip':
+        # Without modification time the result is the same for every refresh
+        body = gzip.compress(response.body, compresslevel=COMPRESSION_LEVEL, mtime=0)
+    else:
+        # Deflate content coding is the zlib format (RFC 9110, section 8.4.1.2)
+        body = zlib.compress(response.body, COMPRESSION_LEVEL)
+
+    headers['Content-Encoding'] = encoding
+    headers['Content-Length'] = str(len(body))
+    etag = headers.get('ETag')
+    if etag is not None:
+        # Every representation needs its own strong entity tag
+        headers['ETag'] = f'{etag[:-1]}-{encoding}"'
+    return RenderedResponse(body=body, headers=headers)
+
+
+@dataclass(frozen=True)
+class CompressedPrefix:
+    """
+    Start of a body compressed with a content coding, which can be
+    completed with more data without compressing the start again
+    """
+
+    encoding: str
+    # Header and deflate blocks ending at a byte boundary, without final block
+    data: bytes
+    # CRC-32 (gzip) or Adler-32 (deflate) checksum of uncompressed data
+    checksum: int
+    # Length of uncompressed data
+    size: int
+
+
+def compress_prefix(body: bytes, encoding: str) -> CompressedPrefix:
+    """
+    Compress start of a body with content coding
+
+    :param body: Uncompressed start of body
+    :param encoding: Content coding to compress with (gzip or deflate)
+    :return: Compressed start of body to pass to :func:`finish_compressed`
+    """
+
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(body) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if encoding == 'gzip':
+        return CompressedPrefix(encoding, GZIP_HEADER + data, zlib.crc32(body), len(body))
+    return CompressedPrefix(encoding, ZLIB_HEADER + data, zlib.adler32(body), len(body))
+
+
+def finish_compressed(prefix: CompressedPrefix, suffix: bytes) -> bytes:
+    """
+    Complete compressed start of a body with the rest of the body. Only
+    the rest is compressed, the result is a single gzip member or zlib
+    stream.
+
+    :param prefix: Compressed start of body
+    :param suffix: Uncompressed rest of body
+    :return: Compressed body
+    """
+
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = prefix.data + compressor.compress(suffix) + compressor.flush()
+    if prefix.encoding == 'gzip':
+        crc = zlib.crc32(suffix, prefix.checksum)
+        return data + struct.pack('<II', crc, (prefix.size + len(suffix)) & 0xffffffff)
+    return data + struct.pack('>I', zlib.adler32(suffix, prefix.checksum))
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check whether value of If-None-Match request header matches entity
+    tag of response (using weak comparison).
+
+    :param if_none_match: Value of If-None-Match header
+    :param etag: Entity tag of response
+    :return: True if client already has the response
+    """
+
+    if if_none_match.strip() == '*':
+        return True
+
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def freshness_headers(requestor: CachingRequestor) -> Dict[str, str]:
+    """
+    Create Age and Cache-Control headers telling clients and proxies how
+    long a response created from the cache of the requestor stays fresh.
+    Stale responses are marked by an X-Rate-Limit-Stale header.
+
+    :param requestor: Requestor whose cached information is sent
+    :return: Age, Cache-Control and X-Rate-Limit-Stale headers
+    """
+
+    age = max(0, int(requestor.cache_age))
+    directives = [f'max-age={max(0, requestor.cache_ttl - age)}']
+    if requestor.stale_while_revalidate > 0:
+        directives.append(f'stale-while-revalidate={requestor.stale_while_revalidate}')
+    if requestor.stale_if_error > 0:
+        directives.append(f'stale-if-error={requestor.stale_if_error}')
+
+    headers = {
+        'Cache-Control': ', '.join(directives),
+        'Age': str(age),
+    }
+
+    # Tell clients that information could not be refreshed in time. The
+    # Warning header is obsolete (RFC 9111, section 5.5), so a header of
+    # our own is used instead.
+    if age > requestor.cache_ttl:
+        headers['X-Rate-Limit-Stale'] = '1'
+    return headers
+
+
+def conditional_response(
+        response: RenderedResponse,
+        cache_headers: Dict[str, str],
+        if_none_match: Optional[str]) -> Tuple[int, Dict[str, str], bytes]:
+    """
+    Decide whether to send rendered response or to tell the client that
+    its copy is still up to date.
+
+    :param response: Rendered response
+    :param cache_headers: Additional headers describing freshness
+    :param if_none_match: Value of If-None-Match request header if any
+    :return: Status code, headers and body to send
+    """
+
+    etag = response.headers.get('ETag')
+    if etag is not None and if_none_match is not None and etag_matches(if_none_match, etag):
+        not_modified_headers = {
+            name: value for name, value in response.headers.items() if name in ('ETag', 'Vary')}
+        return 304, {**not_modified_headers, **cache_headers}, b''
+
+    return 200, {**response.headers, **cache_headers}, response.body
+
+
+class ResponseCache:  # pylint: disable=too-few-public-methods
+    """
+    Thread-safe cache for responses rendered from the same rate limit.
+
+    Requestors hand out the same rate limit object until their cache is
+    refreshed, so responses are rendered (and compressed) once per output
+    format, content coding and refresh instead of once per request.
+
+    :param compression_min_size: Size in bytes of smallest body to
+        compress, None to never compress responses
+    """
+
+    def __init__(self, compression_min_size: Optional[int]=DEFAULT_COMPRESSION_MIN_SIZE) -> None:
+        self.compression_min_size = compression_min_size
+
+        self._lock = threading.Lock()
+        self._rate_limit: Optional[RateLimit] = None
+        self._responses: Dict[Tuple[RateLimitOutputFormat, Optional[str]], RenderedResponse] = {}
+        self._prefixes: Dict[str, CompressedPrefix] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+            self,
+            rate_limit: RateLimit,
+            output_format: RateLimitOutputFormat,
+            encoding: Optional[str]=None) -> RenderedResponse:
+        """
+        Return response for rate limit in output format, render it if it
+        has not been rendered yet.
+
+        :param rate_limit: Rate limit to respond with
+        :param output_format: Format in which to respond
+        :param encoding: Content coding to compress response with if it is
+            large enough, None for uncompressed response
+        :return: Rendered response
+        """
+
+        key = (output_format, encoding)
+        with self._lock:
+            if self._rate_limit is rate_limit:
+                response = self._responses.get(key)
+                if response is not None:
+                    self.hits += 1
+                    return response
+            else:
+                self._drop(rate_limit)
+            self.misses += 1
+
+        # Render outside of lock, concurrent renderings yield the same result.
+        # Compressed responses are created from the cached uncompressed one.
+        if encoding is None:
+            response = render_response(rate_limit, output_format)
+        else:
+            response = self.get(rate_limit, output_format)
+        response = compress_response(response, encoding, self.compression_min_size)
+
+        with self._lock:
+            if self._rate_limit is rate_limit:
+                self._responses[key] = response
+
+        return response
+
+    def get_with_exporter_metrics(
+            self,
+            rate_limit: RateLimit,
+            metrics: str,
+            encoding: Optional[str]=None) -> RenderedResponse:
+        """
+        Return response for rate limit in prometheus format with metrics
+        describing the exporter itself appended. These change with every
+        request, so only they are compressed for every request, while the
+        rate limit is compressed once per refresh.
+
+        :param rate_limit: Rate limit to respond with
+        :param metrics: Metrics of exporter in prometheus text format
+        :param encoding: Content coding to compress response with if it is
+            large enough, None for uncompressed response
+        :return: Rendered response
+        """
+
+        response = with_exporter_metrics(
+            self.get(rate_limit, RateLimitOutputFormat.PROMETHEUS),
+            metrics)
+        if (encoding is None or self.compression_min_size is None
+                or len(response.body) < self.compression_min_size):
+            return compress_response(response, None, self.compression_min_size)
+
+        prefix = self._compressed_prefix(rate_limit, encoding)
+        body = finish_compressed(prefix, metrics.encode('utf-8'))
+        return RenderedResponse(body=body, headers={
+            **response.headers,
+            'Vary': 'Accept-Encoding',
+            'Content-Encoding': encoding,
+            'Content-Length': str(len(body)),
+        })
+
+    def _compressed_prefix(self, rate_limit: RateLimit, encoding: str) -> CompressedPrefix:
+        """
+        Return rate limit in prometheus format compressed with content
+        coding, compress it if it has not been compressed yet.
+
+        :param rate_limit: Rate limit to respond with
+        :param encoding: Content coding to compress with
+        :return: Compressed rate limit, which can be completed with more data
+        """
+
+        with self._lock:
+            if self._rate_limit is rate_limit:
+                prefix = self._prefixes.get(encoding)
+                if prefix is not None:
+                    self.hits += 1
+                    return prefix
+            else:
+                self._drop(rate_limit)
+            self.misses += 1
+
+        prefix = compress_prefix(
+            self.get(rate_limit, RateLimitOutputFormat.PROMETHEUS).body,
+            encoding)
+
+        with self._lock:
+            if self._rate_limit is rate_limit:
+                self._prefixes[encoding] = prefix
+
+        return prefix
+
+    def _drop(self, rate_limit: RateLimit) -> None:
+        """
+        Drop all responses rendered from previous rate limit after it has
+        been refreshed. Has to be called while holding the lock.
+
+        :param rate_limit: Refreshed rate limit
+        """
+
+        self._rate_limit = rate_limit
+        self._responses = {}
+        self._prefixes = {}
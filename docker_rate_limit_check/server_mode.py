@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+from enum import Enum
+
+
+class HTTPServerMode(str, Enum):
+    """Concurrency model used by the HTTP server"""
+
+    SINGLE = 'single'
+    THREADED = 'threaded'
+    POOL = 'pool'
+    ASYNCIO = 'asyncio'
+    PREFORK = 'prefork'
+
+    def __str__(self) -> str:
+        return self.value
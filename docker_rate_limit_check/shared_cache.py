@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+
+import dataclasses
+import json
+import mmap
+import multiprocessing
+import struct
+import time
+
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from requests.exceptions import RequestException
+
+from .circuit_breaker import CircuitOpenError
+from .disk_cache import rate_limit_from_dict
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .history import History
+from .history import RateLimitHistory
+
+
+# Rate limit of one or many accounts
+RateLimit = Union[DockerRateLimit, DockerRateLimitGroup]
+
+# Layout of the header at the start of the shared memory:
+# generation (incremented on every publish), number of refreshes requested
+# by workers, time of last successful refresh (time.time(), 0 if never),
+# time until which Docker Hub is not queried because the circuit breaker
+# is open (time.time(), 0 if it is queried), length of encoded rate limit,
+# length of encoded history and length of error message. The encoded rate
+# limit follows the header, the encoded history follows the rate limit and
+# the error message follows the history.
+HEADER = struct.Struct('<QQddIII')
+COUNTER = struct.Struct('<Q')
+REQUESTS_OFFSET = 8  # COUNTER.size
+
+# Default size of the shared memory. Only pages written to are backed by
+# memory, history of every account takes up to ~30 KiB.
+DEFAULT_SIZE = 8 * 1024 * 1024
+
+
+def encode_rate_limit(rate_limit: RateLimit) -> bytes:
+    """
+    Encode rate limit for storing it in shared memory
+
+    :param rate_limit: Rate limit to encode
+    :return: Encoded rate limit
+    """
+
+    if isinstance(rate_limit, DockerRateLimitGroup):
+        data: Dict[str, Any] = {'accounts': {
+            name: dataclasses.asdict(account_rate_limit)
+            for name, account_rate_limit in rate_limit.rate_limits.items()
+        }}
+    else:
+        data = {'rate_limit': dataclasses.asdict(rate_limit)}
+    return json.dumps(data).encode('utf-8')
+
+
+def decode_rate_limit(encoded: bytes) -> RateLimit:
+    """
+    Decode rate limit stored in shared memory
+
+    :param encoded: Rate limit encoded by :func:`encode_rate_limit`
+    :return: Rate limit
+    """
+
+    data = json.loads(encoded)
+    if 'accounts' in data:
+        return DockerRateLimitGroup(rate_limits={
+            name: rate_limit_from_dict(account_rate_limit)
+            for name, account_rate_limit in data['accounts'].items()
+        })
+    return rate_limit_from_dict(data['rate_limit'])
+
+
+def encode_history(history: History) -> bytes:
+    """
+    Encode history for storing it in shared memory
+
+    :param history: History of one account or of many accounts by name
+    :return: Encoded history
+    """
+
+    if isinstance(history, RateLimitHistory):
+        data: Dict[str, Any] = {'history': history.to_state()}
+    else:
+        data = {'accounts': {
+            name: account_history.to_state()
+            for name, account_history in history.items()
+        }}
+    return json.dumps(data).encode('utf-8')
+
+
+def decode_history(encoded: bytes) -> History:
+    """
+    Decode history stored in shared memory
+
+    :param encoded: History encoded by :func:`encode_history`
+    :return: History of one account or of many accounts by name
+    """
+
+    data = json.loads(encoded)
+    if 'accounts' in data:
+        accounts: Dict[str, RateLimitHistory] = {
+            name: RateLimitHistory.from_state(state)
+            for name, state in data['accounts'].items()
+        }
+        return accounts
+    return RateLimitHistory.from_state(data['history'])
+
+
+@dataclasses.dataclass(frozen=True)
+class SharedCacheSnapshot:
+    """Content of shared cache at one point in time"""
+
+    generation: int
+    refresh_requests: int
+    refreshed_at: float
+    retry_at: float
+    rate_limit: Optional[bytes]
+    history: Optional[bytes]
+    error: Optional[str]
+
+
+class SharedRateLimitCache:
+    """
+    Rate limit stored in anonymous shared memory, so it can be read by
+    all processes forked after the cache has been created, while a single
+    process refreshes it.
+
+    Writes and full reads are protected by a process-shared condition
+    that is also used by readers to request a refresh and to wait for it.
+
+    :param size: Size of shared memory in bytes
+    """
+
+    def __init__(self, size: int=DEFAULT_SIZE) -> None:
+        self.size = size
+        self._memory = mmap.mmap(-1, size)
+        self.condition = multiprocessing.get_context('fork').Condition()
+
+    @property
+    def generation(self) -> int:
+        """
+        Number of times the cache has been written. Can be read without
+        locking to check whether a previous read is still current.
+
+        :return: Generation of cache
+        """
+
+        return int(COUNTER.unpack_from(self._memory, 0)[0])
+
+    @property
+    def refresh_requests(self) -> int:
+        """
+        Number of refreshes requested by readers so far
+
+        :return: Number of requested refreshes
+        """
+
+        return int(COUNTER.unpack_from(self._memory, REQUESTS_OFFSET)[0])
+
+    def read(self) -> SharedCacheSnapshot:
+        """
+        Read content of cache
+
+        :return: Consistent snapshot of cache
+        """
+
+        with self.condition:
+            return self._read()
+
+    def _read(self) -> SharedCacheSnapshot:
+        (generation, requests, refreshed_at, retry_at,
+         length, history_length, error_length) = HEADER.unpack_from(self._memory, 0)
+        start = HEADER.size
+        rate_limit = self._memory[start:start + length] if length > 0 else None
+        start += length
+        history = self._memory[start:start + history_length] if history_length > 0 else None
+        start += history_length
+        error = (
+            self._memory[start:start + error_length].decode('utf-8', 'replace')
+            if error_length > 0 else None)
+
+        return SharedCacheSnapshot(
+            generation=generation,
+            refresh_requests=requests,
+            refreshed_at=refreshed_at,
+            retry_at=retry_at,
+            rate_limit=rate_limit,
+            history=history,
+            error=error)
+
+    def publish(  # pylint: disable=too-many-arguments
+            self,
+            rate_limit: Optional[RateLimit]=None,
+            refreshed_at: Optional[float]=None,
+            error: Optional[str]=None,
+            history: Optional[History]=None,
+            retry_at: float=0) -> None:
+        """
+        Write result of a refresh and wake up all readers waiting for it.
+
+        :param rate_limit: Current rate limit. None to keep the previous
+            one, e.g. because refreshing failed.
+        :param refreshed_at: Time (see :func:`time.time`) of the refresh
+            the rate limit has been requested in. None to keep the previous
+            one.
+        :param error: Error that occurred while refreshing if any
+        :param history: History of refreshed rate limits. None to keep the
+            previous one. Left out if it does not fit into shared memory.
+        :param retry_at: Time (see :func:`time.time`) until which Docker Hub
+            is not queried because the circuit breaker is open. 0 if it is
+            queried.
+        :raises ValueError: If encoded rate limit does not fit into shared
+            memory
+        """
+
+        with self.condition:
+            current = self._read()
+            encoded = current.rate_limit if rate_limit is None else encode_rate_limit(rate_limit)
+            encoded = encoded or b''
+            if HEADER.size + len(encoded) > self.size:
+                raise ValueError(
+                    f'Rate limit of {len(encoded)} bytes does not fit into shared memory')
+            encoded_history = current.history if history is None else encode_history(history)
+            encoded_history = encoded_history or b''
+            # History is less important than the rate limit
+            if HEADER.size + len(encoded) + len(encoded_history) > self.size:
+                encoded_history = b''
+            encoded_error = error.encode('utf-8') if error is not None else b''
+            # Truncate error message rather than failing to report it
+            encoded_error = encoded_error[
+                :max(0, self.size - HEADER.size - len(encoded) - len(encoded_history))]
+
+            start = HEADER.size
+            for part in (encoded, encoded_history, encoded_error):
+                self._memory[start:start + len(part)] = part
+                start += len(part)
+            HEADER.pack_into(
+                self._memory, 0,
+                current.generation + 1,
+                current.refresh_requests,
+                current.refreshed_at if refreshed_at is None else refreshed_at,
+                retry_at,
+                len(encoded),
+                len(encoded_history),
+                len(encoded_error))
+            self.condition.notify_all()
+
+    def request_refresh(self, generation: int, timeout: Optional[float]) -> SharedCacheSnapshot:
+        """
+        Ask refreshing process to refresh the cache and wait until the
+        cache has been written after the given generation.
+
+        :param generation: Generation of cache the caller considers outdated
+        :param timeout: Number of seconds to wait at most. None to not wait.
+        :return: Snapshot of cache after waiting
+        """
+
+        with self.condition:
+            snapshot = self._read()
+            if snapshot.generation != generation:
+                return snapshot
+
+            COUNTER.pack_into(self._memory, REQUESTS_OFFSET, snapshot.refresh_requests + 1)
+            self.condition.notify_all()
+
+            if timeout is not None:
+                self.condition.wait_for(lambda: self.generation != generation, timeout)
+            return self._read()
+
+    def wait_for_refresh_request(self, handled_requests: int, timeout: float) -> int:
+        """
+        Wait until a reader requests a refresh
+
+        :param handled_requests: Number of requests already handled
+        :param timeout: Number of seconds to wait at most
+        :return: Number of refreshes requested so far
+        """
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.refresh_requests != handled_requests,
+                timeout)
+            return self.refresh_requests
+
+
+class SharedCacheRequestor:  # pylint: disable=too-many-instance-attributes
+    """
+    Requestor reading the rate limit from a :class:`SharedRateLimitCache`
+    instead of querying Docker Hub. Refreshes are requested from the
+    process owning the real requestor.
+
+    :param shared_cache: Cache shared between processes
+    :param cache_ttl: Number of seconds information is fresh
+    :param stale_while_revalidate: Number of seconds after cache expiry
+        during which stale information is returned immediately while it is
+        being refreshed.
+    :param stale_if_error: Number of seconds after cache expiry during
+        which stale information is returned if refreshing it failed.
+    :param refresh_timeout: Number of seconds to wait for a refresh
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            shared_cache: SharedRateLimitCache,
+            cache_ttl: int=0,
+            stale_while_revalidate: int=0,
+            stale_if_error: int=0,
+            refresh_timeout: float=30) -> None:
+
+        self.shared_cache = shared_cache
+        self.cache_ttl = cache_ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.refresh_timeout = refresh_timeout
+
+        # Last snapshot read by this process and the rate limit decoded
+        # from it. The same object is handed out until the rate limit
+        # changes, so responses rendered from it can be reused.
+        self._state: Optional[Tuple[SharedCacheSnapshot, Optional[RateLimit]]] = None
+
+        # History published by the refreshing process and decoded from it
+        self._history: Optional[Tuple[bytes, History]] = None
+
+        self.reads = 0
+        self.refresh_requests = 0
+
+    def _current(self) -> Tuple[SharedCacheSnapshot, Optional[RateLimit]]:
+        state = self._state
+        if state is None or state[0].generation != self.shared_cache.generation:
+            return self._update(self.shared_cache.read())
+        snapshot: SharedCacheSnapshot = state[0]
+        rate_limit: Optional[RateLimit] = state[1]
+        return snapshot, rate_limit
+
+    def _update(
+            self,
+            snapshot: SharedCacheSnapshot) -> Tuple[SharedCacheSnapshot, Optional[RateLimit]]:
+        previous = self._state
+        rate_limit: Optional[RateLimit] = None
+        if snapshot.rate_limit is not None:
+            if previous is not None and previous[0].rate_limit == snapshot.rate_limit:
+                rate_limit = previous[1]
+            else:
+                rate_limit = decode_rate_limit(snapshot.rate_limit)
+
+        # Replace snapshot and rate limit at once, as they are read by
+        # multiple threads
+        state = (snapshot, rate_limit)
+        self._state = state
+        self.reads += 1
+        return state
+
+    @property
+    def history(self) -> History:
+        """
+        History of rate limits recorded by the refreshing process
+
+        :return: History of the account or, if the rate limit of many
+            accounts is shared, dictionary mapping account name to its
+            history
+        """
+
+        snapshot, _ = self._current()
+        if snapshot.history is None:
+            return RateLimitHistory()
+
+        # Decode history once per refresh, it is never modified afterwards
+        cached: Optional[Tuple[bytes, History]] = self._history
+        if cached is None or cached[0] != snapshot.history:
+            cached = (snapshot.history, decode_history(snapshot.history))
+            self._history = cached
+        return cached[1]
+
+    @staticmethod
+    def _age(snapshot: SharedCacheSnapshot) -> float:
+        return time.time() - snapshot.refreshed_at
+
+    @property
+    def cache_age(self) -> float:
+        """
+        Number of seconds since information was last refreshed
+
+        :return: Age of cached information in seconds
+        """
+
+        snapshot, rate_limit = self._current()
+        if rate_limit is None:
+            return 0
+        return self._age(snapshot)
+
+    def get_rate_limit(self) -> RateLimit:
+        """
+        Returns information about Docker Hub rate limiting from the shared
+        cache. If it is expired a refresh is requested and awaited, unless
+        stale information can be returned meanwhile.
+        While Docker Hub is not queried because of previous failures the
+        last known information is returned regardless of its age.
+
+        :raises CircuitOpenError: If Docker Hub is not queried because of
+            previous failures and there is no information to return
+        :raises RequestException: If there is no usable information after
+            the refresh
+        :return: Information about rate limit
+        """
+
+        rate_limit: Optional[RateLimit]
+        snapshot, rate_limit = self._current()
+        if rate_limit is not None:
+            age = self._age(snapshot)
+            if age <= self.cache_ttl:
+                return rate_limit
+            # Serve stale information while refreshing
+            if age <= self.cache_ttl + self.stale_while_revalidate:
+                self.refresh_requests += 1
+                self.shared_cache.request_refresh(snapshot.generation, timeout=None)
+                return rate_limit
+
+        # Refreshing would only report the open circuit again
+        if snapshot.retry_at <= time.time():
+            self.refresh_requests += 1
+            snapshot, rate_limit = self._update(
+                self.shared_cache.request_refresh(snapshot.generation, self.refresh_timeout))
+
+        seconds_until_retry = snapshot.retry_at - time.time()
+        if rate_limit is not None:
+            age = self._age(snapshot)
+            if age <= self.cache_ttl or seconds_until_retry > 0 or (
+                    snapshot.error is not None
+                    and age <= self.cache_ttl + self.stale_if_error):
+                return rate_limit
+
+        if seconds_until_retry > 0:
+            raise CircuitOpenError(seconds_until_retry)
+        if snapshot.error is not None:
+            raise RequestException(snapshot.error)
+        raise RequestException('Timed out waiting for rate limit to be refreshed')
+
+    def debug_metrics(self) -> Dict[str, int]:
+        """
+        Return internal counters of this process about the shared cache
+
+        :return: Dictionary mapping metric name to value
+        """
+
+        return {
+            'shared_cache_generation': self.shared_cache.generation,
+            'shared_cache_reads': self.reads,
+            'shared_cache_refresh_requests': self.refresh_requests,
+        }
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import threading
+from concurrent.futures import Future
+
+from typing import Callable
+from typing import Dict
+from typing import Generic
+from typing import Hashable
+from typing import TypeVar
+
+
+T = TypeVar('T')
+
+
+class SingleFlight(Generic[T]):  # pylint: disable=too-few-public-methods
+    """
+    Coalesces concurrent calls with the same key into a single execution.
+
+    The first caller for a key executes the function, every caller that
+    arrives while that execution is still in flight waits for it and is
+    handed the same result (or exception).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, 'Future[T]'] = {}  # noqa: UP037
+
+        # Number of calls that did not execute the function themselves
+        # but waited for the result of another call
+        self.coalesced_calls = 0
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        """
+        Execute function unless an execution for the same key is already
+        in flight, in which case wait for and return its result.
+
+        :param key: Key identifying calls that can be coalesced
+        :param function: Function to execute
+        :return: Return value of the (possibly shared) execution
+        """
+
+        future: 'Future[T]' = Future()  # noqa: UP037
+        with self._lock:
+            in_flight = self._in_flight.setdefault(key, future)
+            if in_flight is not future:
+                self.coalesced_calls += 1
+
+        # Another call is already executing, wait for its result
+        if in_flight is not future:
+            return in_flight.result()
+
+        try:
+            future.set_result(function())
+        except BaseException as err:  # pylint: disable=broad-exception-caught
+            future.set_exception(err)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return future.result()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+
+
+# Lifetime of a token if Docker Hub does not specify one
+DEFAULT_TOKEN_LIFETIME = 60
+
+
+class TokenCache:
+    """
+    Thread-safe cache for bearer tokens returned by the Docker Hub
+    token endpoint. Tokens are reused until shortly before they expire.
+
+    :param expiry_margin: Number of seconds before its expiry at which a
+        token is no longer handed out
+    """
+
+    def __init__(self, expiry_margin: float=10.0) -> None:
+        self.expiry_margin = expiry_margin
+
+        self._lock = threading.Lock()
+        self._tokens: Dict[Hashable, Tuple[str, float]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """
+        Return cached token if it is still valid.
+
+        :param key: Key identifying credential and scope of token
+        :return: Cached token or None if there is no valid token
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and entry[1] - self.expiry_margin > now:
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, token: str, expires_in: Optional[float]=None) -> None:
+        """
+        Store token in cache
+
+        :param key: Key identifying credential and scope of token
+        :param token: Token to store
+        :param expires_in: Number of seconds the token is valid for
+        """
+
+        if expires_in is None:
+            expires_in = DEFAULT_TOKEN_LIFETIME
+
+        with self._lock:
+            self._tokens[key] = (token, time.monotonic() + expires_in)
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Remove token from cache, e.g. because it has been rejected
+
+        :param key: Key identifying credential and scope of token
+        """
+
+        with self._lock:
+            self._tokens.pop(key, None)
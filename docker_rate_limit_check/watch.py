@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextlib
+import hashlib
+import sys
+import threading
+
+from typing import TYPE_CHECKING
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from requests.exceptions import RequestException
+
+from .docker_hub_requestor import DockerHubRequestor
+from .docker_rate_limit import DockerRateLimit
+from .docker_rate_limit import DockerRateLimitGroup
+from .instrumentation import EXPORTER_METRICS
+from .output_format import RateLimitOutputFormat
+
+
+# Requestors of other server modes are only referenced by type hints
+if TYPE_CHECKING:
+    from .account_pool import DockerHubAccountPool
+    from .async_requestor import AsyncDockerHubAccountPool
+    from .async_requestor import AsyncDockerHubRequestor
+    from .shared_cache import SharedCacheRequestor
+
+
+# Rate limit of one or many accounts
+RateLimit = Union[DockerRateLimit, DockerRateLimitGroup]
+
+# Requestor for rate limit of one or many accounts
+WatchedRequestor = Union[DockerHubRequestor, 'DockerHubAccountPool', 'SharedCacheRequestor']
+
+# Requestor for rate limit of one or many accounts used in an event loop
+AsyncWatchedRequestor = Union['AsyncDockerHubRequestor', 'AsyncDockerHubAccountPool']
+
+# Version of rate limit and rate limit, both None if nothing is known yet
+VersionedRateLimit = Tuple[Optional[str], Optional[RateLimit]]
+
+
+def rate_limit_version(rate_limit: RateLimit) -> str:
+    """
+    Derive version of rate limit from its content, so every process of a
+    pre-fork server assigns the same version to the same rate limit.
+
+    :param rate_limit: Rate limit of one or many accounts
+    :return: Version of rate limit
+    """
+
+    content = rate_limit.to_output_format(RateLimitOutputFormat.JSON).encode('utf-8')
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
+def format_event(version: str, payload: bytes) -> bytes:
+    """
+    Format rendered rate limit as Server-Sent Event
+
+    :param version: Version of rate limit, sent as event ID
+    :param payload: Rate limit rendered in an output format
+    :return: Event including terminating blank line
+    """
+
+    lines = payload.rstrip(b'\n').split(b'\n')
+    data = b''.join(b'data: ' + line + b'\n' for line in lines)
+    return b'id: ' + version.encode('ascii') + b'\nevent: rate_limit\n' + data + b'\n'
+
+
+class RateLimitVersions:  # pylint: disable=too-few-public-methods
+    """
+    Keeps the rate limit last read by a watch and its version
+    """
+
+    def __init__(self) -> None:
+        self._rate_limit: Optional[RateLimit] = None
+        self._version: Optional[str] = None
+
+    def update(self, rate_limit: Optional[RateLimit]) -> bool:
+        """
+        Remember rate limit read from requestor
+
+        :param rate_limit: Rate limit read, None if reading it failed
+        :return: True if the version of the rate limit changed
+        """
+
+        # Requestors hand out the same object until they refresh
+        if rate_limit is None or rate_limit is self._rate_limit:
+            return False
+        self._rate_limit = rate_limit
+        version = rate_limit_version(rate_limit)
+        if version == self._version:
+            return False
+        self._version = version
+        return True
+
+
+class RateLimitWatch(RateLimitVersions):  # pylint: disable=too-many-instance-attributes
+    """
+    Notifies any number of waiting clients when the rate limit changes.
+
+    While clients are waiting a single thread reads the rate limit from
+    the requestor, which refreshes it only when its cache expires. Docker
+    Hub is therefore queried as often as for a single client, no matter
+    how many clients are waiting.
+
+    :param requestor: Requestor to read rate limit from
+    :param poll_interval: Number of seconds between reads of the
+        (usually cached) rate limit
+    """
+
+    def __init__(self, requestor: WatchedRequestor, poll_interval: float=1.0) -> None:
+        super().__init__()
+        self.requestor = requestor
+        self.poll_interval = poll_interval
+
+        self._condition = threading.Condition()
+        self._watchers = 0
+        self._poller: Optional[threading.Thread] = None
+        self._closed = False
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether waiting clients have been released for good
+
+        :return: True if :meth:`close` has been called
+        """
+
+        with self._condition:
+            return self._closed
+
+    def wait(self, last_version: Optional[str], timeout: float) -> VersionedRateLimit:
+        """
+        Wait until a rate limit with a version different from the given
+        one is known
+
+        :param last_version: Version the client has seen last, None if it
+            has not seen any
+        :param timeout: Maximum number of seconds to wait
+        :return: Version of current rate limit and current rate limit.
+            The version equals the given one if it did not change in
+            time.
+        """
+
+        with self._condition:
+            self._watchers += 1
+            EXPORTER_METRICS.watchers.inc()
+            try:
+                if self._poller is None and not self._closed:
+                    self._poller = threading.Thread(
+                        target=self.poll,
+                        name='rate-limit-watch',
+                        daemon=True)
+                    self._poller.start()
+
+                self._condition.wait_for(
+                    lambda: bool(self._closed or (
+                        self._version is not None and self._version != last_version)),
+                    timeout)
+                return self._version, self._rate_limit
+            finally:
+                self._watchers -= 1
+                EXPORTER_METRICS.watchers.dec()
+
+    def poll(self) -> None:
+        """
+        Read rate limit and notify waiting clients whenever it changed,
+        until no client is waiting anymore
+        """
+
+        while True:
+            try:
+                rate_limit: Optional[RateLimit] = self.requestor.get_rate_limit()
+            except (RequestException, KeyError, ValueError) as err:
+                print(f'Error: Refreshing watched rate limit failed: {err}', file=sys.stderr)
+                rate_limit = None
+
+            with self._condition:
+                if self.update(rate_limit):
+                    self._condition.notify_all()
+
+                if self._watchers == 0 or self._closed:
+                    self._poller = None
+                    return
+                self._condition.wait(self.poll_interval)
+
+    def close(self) -> None:
+        """
+        Release all waiting clients and stop reading the rate limit
+        """
+
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AsyncRateLimitWatch(RateLimitVersions):
+    """
+    Notifies any number of clients waiting in an event loop when the
+    rate limit changes. See :class:`RateLimitWatch`, the rate limit is
+    read by a task instead of a thread.
+
+    :param requestor: Requestor to read rate limit from
+    :param poll_interval: Number of seconds between reads of the
+        (usually cached) rate limit
+    """
+
+    def __init__(self, requestor: AsyncWatchedRequestor, poll_interval: float=1.0) -> None:
+        super().__init__()
+        self.requestor = requestor
+        self.poll_interval = poll_interval
+
+        # Condition has to be created inside of the running event loop
+        self._condition: Optional[asyncio.Condition] = None
+        self._watchers = 0
+        self._poller: Optional['asyncio.Task[None]'] = None  # noqa: UP037
+        self.closed = False
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        """
+        Condition notified when the rate limit changed
+
+        :return: Condition of this watch
+        """
+
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        condition: asyncio.Condition = self._condition
+        return condition
+
+    async def wait(self, last_version: Optional[str], timeout: float) -> VersionedRateLimit:
+        """
+        Wait until a rate limit with a version different from the given
+        one is known
+
+        :param last_version: Version the client has seen last, None if it
+            has not seen any
+        :param timeout: Maximum number of seconds to wait
+        :return: Version of current rate limit and current rate limit.
+            The version equals the given one if it did not change in
+            time.
+        """
+
+        async with self.condition:
+            self._watchers += 1
+            EXPORTER_METRICS.watchers.inc()
+            try:
+                if self._poller is None and not self.closed:
+                    self._poller = asyncio.get_running_loop().create_task(self.poll())
+
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self.condition.wait_for(lambda: bool(self.closed or (
+                            self._version is not None and self._version != last_version))),
+                        timeout)
+                return self._version, self._rate_limit
+            finally:
+                self._watchers -= 1
+                EXPORTER_METRICS.watchers.dec()
+
+    async def poll(self) -> None:
+        """
+        Read rate limit and notify waiting clients whenever it changed,
+        until no client is waiting anymore
+        """
+
+        while True:
+            try:
+                rate_limit: Optional[RateLimit] = await self.requestor.get_rate_limit()
+            except (RequestException, KeyError, ValueError) as err:
+                print(f'Error: Refreshing watched rate limit failed: {err}', file=sys.stderr)
+                rate_limit = None
+
+            async with self.condition:
+                if self.update(rate_limit):
+                    self.condition.notify_all()
+
+                if self._watchers == 0 or self.closed:
+                    self._poller = None
+                    return
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def close(self) -> None:
+        """
+        Release all waiting clients and stop reading the rate limit
+        """
+
+        async with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -3,6 +3,7 @@
 
 DOCKER_RATE_LIMIT_USER=${DOCKER_RATE_LIMIT_USER:-''}
 DOCKER_RATE_LIMIT_PASS=${DOCKER_RATE_LIMIT_PASS:-''}
+DOCKER_RATE_LIMIT_CREDENTIALS_FILE=${DOCKER_RATE_LIMIT_CREDENTIALS_FILE:-''}
 DOCKER_RATE_LIMIT_CACHE_TTL=${DOCKER_RATE_LIMIT_CACHE_TTL:-''}
 DOCKER_RATE_LIMIT_DEFAULT_FORMAT=${DOCKER_RATE_LIMIT_DEFAULT_FORMAT:-''}
 
@@ -19,6 +20,12 @@ if [[ "$1" == "docker_rate_limit_check" ]]; then
         CMD+=("$DOCKER_RATE_LIMIT_PASS")
     fi
 
+    # Add credentials file if provided
+    if [[ -n "$DOCKER_RATE_LIMIT_CREDENTIALS_FILE" ]]; then
+        CMD+=('--credentials-file')
+        CMD+=("$DOCKER_RATE_LIMIT_CREDENTIALS_FILE")
+    fi
+
     # Specify cache TTL if provided
     if [[ -n "$DOCKER_RATE_LIMIT_CACHE_TTL" ]]; then
         CMD+=('--cache-ttl')
@@ -0,0 +1,39 @@
+#!/bin/sh
+
+# Directory of this script
+SCRIPT_DIR="$(cd "$(dirname "$(realpath "$0")")" && pwd -P)"
+
+# Root directory of the project
+PROJECT_ROOT="$(cd "$SCRIPT_DIR/.." && pwd -P)"
+
+# Directory of the benchmarks
+BENCHMARK_DIR="${PROJECT_ROOT}/benchmarks"
+
+# Whether or not an error occurred
+errors=no
+
+
+# Change directory to project root
+cd "$PROJECT_ROOT" || exit 1
+
+
+# Check if the benchmarks directory exists
+if [ ! -d "$BENCHMARK_DIR" ]; then
+    echo "Error: Benchmarks directory $BENCHMARK_DIR does not exist!" > /dev/stderr
+    exit 1
+fi
+
+for benchmark in bench_import_time bench_query bench_renderers bench_http_server bench_upstream_calls; do
+    echo "Running benchmark $benchmark..." > /dev/stderr
+    if ! python -m "benchmarks.$benchmark" "$@"; then
+        echo "Error: Benchmark $benchmark failed!" > /dev/stderr
+        errors='yes'
+    fi
+done
+
+
+
+# Return with error code if a benchmark returned an error
+if [ "$errors" = 'yes' ]; then
+    exit 1
+fi
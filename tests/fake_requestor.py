@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import asyncio
+import threading
+import time
+
+from typing import Any
+from typing import List
+from typing import Optional
+
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.async_requestor import AsyncDockerHubRequestor
+from docker_rate_limit_check.docker_hub_requestor import DockerHubRequestor
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+
+
+class FakeDockerHub:
+    """
+    Stand-in for Docker Hub shared by the fake requestors. Reports the
+    configured rate limit and counts how often it has been queried.
+
+    :param remaining: Number of remaining pulls reported
+    :param pulls_per_refresh: Number of pulls consumed by every refresh
+    :param delay: Number of seconds every refresh takes
+    :param errors: Errors raised by the next refreshes, one per refresh
+    :param window: Length of rate limit window in seconds reported
+    :param **kwargs: Arguments for the requestor
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+            self,
+            remaining: int=80,
+            pulls_per_refresh: int=0,
+            delay: float=0.0,
+            errors: Optional[List[Exception]]=None,
+            window: Optional[int]=None,
+            **kwargs: Any) -> None:
+
+        super().__init__(**kwargs)
+        self.remaining = remaining
+        self.pulls_per_refresh = pulls_per_refresh
+        self.delay = delay
+        self.errors = errors if errors is not None else []
+        self.window = window
+        # Whether every refresh fails until reset
+        self.fail = False
+
+        self.upstream_calls = 0
+        self.concurrent_calls = 0
+        self.max_concurrent_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def consume(self) -> None:
+        """
+        Consume a pull, reported by the next refresh
+        """
+
+        self.remaining -= 1
+
+    def begin_call(self) -> None:
+        """
+        Count refresh that starts querying Docker Hub
+        """
+
+        with self._calls_lock:
+            self.upstream_calls += 1
+            self.concurrent_calls += 1
+            self.max_concurrent_calls = max(self.max_concurrent_calls, self.concurrent_calls)
+
+    def end_call(self) -> DockerRateLimit:
+        """
+        Finish refresh, failing with the next error if there is one
+
+        :raises RequestException: If told to fail
+        :return: Rate limit reported by Docker Hub
+        """
+
+        with self._calls_lock:
+            self.concurrent_calls -= 1
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.fail:
+            raise RequestException('Docker Hub is unavailable')
+
+        self.remaining -= self.pulls_per_refresh
+        return DockerRateLimit(
+            rate_limit_max=100,
+            rate_limit_remaining=self.remaining,
+            identifier='127.0.0.1',
+            rate_limit_window=self.window)
+
+
+class FakeDockerHubRequestor(FakeDockerHub, DockerHubRequestor):
+    """
+    Requestor that does not contact Docker Hub but answers like
+    :class:`FakeDockerHub`
+    """
+
+    def get_rate_limit_from_docker_hub(self) -> DockerRateLimit:
+        self.begin_call()
+        time.sleep(self.delay)
+        return self.end_call()
+
+
+class FakeAsyncDockerHubRequestor(FakeDockerHub, AsyncDockerHubRequestor):
+    """
+    Asyncio requestor that does not contact Docker Hub but answers like
+    :class:`FakeDockerHub`
+    """
+
+    async def get_rate_limit_from_docker_hub(self) -> DockerRateLimit:
+        self.begin_call()
+        await asyncio.sleep(self.delay)
+        return self.end_call()
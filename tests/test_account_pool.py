@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.account_pool import DockerHubAccount
+from docker_rate_limit_check.account_pool import DockerHubAccountPool
+from docker_rate_limit_check.account_pool import load_credentials_file
+from docker_rate_limit_check.docker_hub_requestor import DockerHubRequestor
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.instrumentation import EXPORTER_METRICS
+
+
+class TestAccountPool(unittest.TestCase):
+    def helper_write_credentials_file(self, content: str) -> str:
+        """
+        Helper function to write a temporary credentials file.
+
+        :param content: Content of the file
+        :return: Path of the file
+        """
+
+        fd, path = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_load_credentials_file(self) -> None:
+        path = self.helper_write_credentials_file(
+            'accounts:\n'
+            '  - name: team-a\n'
+            '    user: alice\n'
+            '    password: secret\n'
+            '  - user: bob\n'
+            '    password: secret\n'
+            '  - {}\n')
+
+        self.assertEqual(
+            load_credentials_file(path),
+            [
+                DockerHubAccount(name='team-a', user='alice', password='secret'),
+                DockerHubAccount(name='bob', user='bob', password='secret'),
+                DockerHubAccount(name='anonymous'),
+            ])
+
+    def test_load_credentials_file_malformed(self) -> None:
+        contents = [
+            'accounts: []\n',
+            'accounts: {}\n',
+            'accounts:\n  - user: alice\n',
+            'accounts:\n  - name: a\n  - name: a\n',
+        ]
+        for content in contents:
+            path = self.helper_write_credentials_file(content)
+            with self.assertRaises(ValueError, msg=content):
+                load_credentials_file(path)
+
+    def test_get_rate_limit(self) -> None:
+        accounts = [
+            DockerHubAccount(name=f'account-{i}', user=f'user-{i}', password='secret')
+            for i in range(20)
+        ]
+        pool = DockerHubAccountPool(accounts=accounts, cache_ttl=60, max_concurrency=4)
+
+        def get_rate_limit_from_docker_hub(self: DockerHubRequestor) -> DockerRateLimit:
+            if self.user == 'user-3':
+                raise KeyError('malformed response')
+            return DockerRateLimit(
+                rate_limit_max=200,
+                rate_limit_remaining=150,
+                identifier=self.user)
+
+        errors = EXPORTER_METRICS.account_refresh_errors.get('account-3')
+        with patch.object(
+                DockerHubRequestor,
+                'get_rate_limit_from_docker_hub',
+                get_rate_limit_from_docker_hub):
+            group = pool.get_rate_limit()
+
+        # Account that could not be refreshed is left out and counted
+        self.assertEqual(len(group.rate_limits), 19)
+        self.assertNotIn('account-3', group.rate_limits)
+        self.assertEqual(EXPORTER_METRICS.account_refresh_errors.get('account-3'), errors + 1)
+        self.assertEqual(group.rate_limits['account-7'].identifier, 'user-7')
+
+        # Same group is handed out until an account is refreshed
+        self.assertIs(pool.get_rate_limit(), group)
+        pool.requestors['account-7'].store_in_cache(
+            DockerRateLimit(rate_limit_max=200, rate_limit_remaining=100))
+        self.assertIsNot(pool.get_rate_limit(), group)
+
+    def test_all_accounts_failing(self) -> None:
+        accounts = [DockerHubAccount(name='team-a'), DockerHubAccount(name='team-b')]
+        pool = DockerHubAccountPool(accounts=accounts, failure_threshold=0)
+
+        def get_rate_limit_from_docker_hub(_: DockerHubRequestor) -> DockerRateLimit:
+            raise RequestException('Docker Hub is down')
+
+        # Failure is not hidden behind an empty group
+        with patch.object(
+                DockerHubRequestor,
+                'get_rate_limit_from_docker_hub',
+                get_rate_limit_from_docker_hub):
+            with self.assertRaisesRegex(RequestException, 'any of 2 accounts: Docker Hub is down'):
+                pool.get_rate_limit()
+
+    def test_anonymous_accounts(self) -> None:
+        # Anonymous accounts are refreshed and cached independently
+        accounts = [DockerHubAccount(name='anonymous-a'), DockerHubAccount(name='anonymous-b')]
+        pool = DockerHubAccountPool(accounts=accounts, cache_ttl=60, max_concurrency=2)
+        upstream_calls = []
+
+        def get_rate_limit_from_docker_hub(self: DockerHubRequestor) -> DockerRateLimit:
+            upstream_calls.append(self)
+            time.sleep(0.3)
+            return DockerRateLimit(
+                rate_limit_max=100,
+                rate_limit_remaining=100 - len(upstream_calls))
+
+        with patch.object(
+                DockerHubRequestor,
+                'get_rate_limit_from_docker_hub',
+                get_rate_limit_from_docker_hub):
+            group = pool.get_rate_limit()
+
+        self.assertEqual(len(upstream_calls), 2)
+        self.assertEqual(set(group.rate_limits), {'anonymous-a', 'anonymous-b'})
+        for requestor in pool.requestors.values():
+            self.assertLess(requestor.cache_age, requestor.cache_ttl)
+
+    def test_stale_while_revalidate_concurrency(self) -> None:
+        accounts = [DockerHubAccount(name=f'account-{i}') for i in range(20)]
+        pool = DockerHubAccountPool(
+            accounts=accounts, cache_ttl=60, max_concurrency=4, stale_while_revalidate=60)
+        for requestor in pool.requestors.values():
+            requestor.store_in_cache(DockerRateLimit(rate_limit_max=100, rate_limit_remaining=100))
+            requestor.cache_last_refresh -= datetime.timedelta(seconds=90)
+
+        lock = threading.Lock()
+        in_flight = 0
+        peak = 0
+        upstream_calls = []
+
+        def get_rate_limit_from_docker_hub(self: DockerHubRequestor) -> DockerRateLimit:
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.05)
+            with lock:
+                in_flight -= 1
+                upstream_calls.append(self)
+            return DockerRateLimit(rate_limit_max=100, rate_limit_remaining=99)
+
+        with patch.object(
+                DockerHubRequestor,
+                'get_rate_limit_from_docker_hub',
+                get_rate_limit_from_docker_hub):
+            group = pool.get_rate_limit()
+            # Stale information is served while refreshing in background
+            self.assertEqual(group.rate_limits['account-0'].rate_limit_remaining, 100)
+            for _ in range(100):
+                if len(upstream_calls) == len(accounts):
+                    break
+                time.sleep(0.05)
+
+        # Background refreshes are limited by max_concurrency as well
+        self.assertEqual(len(upstream_calls), len(accounts))
+        self.assertLessEqual(peak, 4)
+
+    def test_debug_metrics(self) -> None:
+        accounts = [DockerHubAccount(name='team-a'), DockerHubAccount(name='team-b')]
+        pool = DockerHubAccountPool(accounts=accounts, failure_threshold=5)
+
+        def get_rate_limit_from_docker_hub(_: DockerHubRequestor) -> DockerRateLimit:
+            raise RequestException('Docker Hub is down')
+
+        with patch.object(
+                DockerHubRequestor,
+                'get_rate_limit_from_docker_hub',
+                get_rate_limit_from_docker_hub):
+            for _ in range(2):
+                with self.assertRaises(RequestException):
+                    pool.get_rate_limit()
+
+        # Failures of every account are summed up, shared caches counted once
+        metrics = pool.debug_metrics()
+        self.assertEqual(metrics['accounts'], 2)
+        self.assertEqual(metrics['circuit_breaker_failures'], 4)
+        self.assertEqual(metrics['token_cache_misses'], pool.requestors['team-a'].token_cache.misses)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from docker_rate_limit_check.adaptive_refresh import AdaptiveRefreshPolicy
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+class TestAdaptiveRefreshPolicy(unittest.TestCase):
+    def setUp(self) -> None:
+        self.policy = AdaptiveRefreshPolicy(min_interval=10, max_interval=610)
+
+    def test_budget(self) -> None:
+        def interval(remaining: int) -> int:
+            return self.policy.next_interval(DockerRateLimit(100, remaining), None)
+
+        # Interval shrinks with remaining pulls
+        self.assertEqual(interval(100), 610)
+        self.assertEqual(interval(50), 310)
+        self.assertEqual(interval(1), 16)
+
+        # Exhausted rate limit without known window is checked often
+        self.assertEqual(interval(0), 10)
+        self.assertEqual(self.policy.next_interval(DockerRateLimit(0, 0), None), 10)
+
+    def test_window(self) -> None:
+        # Exhausted rate limit is checked about as often as a pull is
+        # given back
+        exhausted = DockerRateLimit(200, 0, rate_limit_window=21600)
+        self.assertEqual(self.policy.next_interval(exhausted, None), 108)
+
+        # Interval does not exceed window
+        short_window = DockerRateLimit(100, 100, rate_limit_window=60)
+        self.assertEqual(self.policy.next_interval(short_window, None), 60)
+
+    def test_consumption_rate(self) -> None:
+        rate_limit = DockerRateLimit(100, 100)
+
+        # Rate limit exhausted in 1000 seconds is refreshed every 100
+        self.assertEqual(self.policy.next_interval(rate_limit, 0.1), 100)
+        # Slow or negative consumption does not extend the interval
+        self.assertEqual(self.policy.next_interval(rate_limit, 0.0001), 610)
+        self.assertEqual(self.policy.next_interval(rate_limit, -1), 610)
+        # Fast consumption does not shorten it below the minimum
+        self.assertEqual(self.policy.next_interval(rate_limit, 100), 10)
+
+    def test_invalid_bounds(self) -> None:
+        with self.assertRaises(ValueError):
+            AdaptiveRefreshPolicy(min_interval=60, max_interval=10)
+
+    def test_requestor(self) -> None:
+        requestor = FakeDockerHubRequestor(
+            remaining=100,
+            pulls_per_refresh=40,
+            window=21600,
+            cache_ttl=0,
+            adaptive_refresh=self.policy)
+        self.assertEqual(requestor.cache_ttl, 0)
+
+        # Cache TTL is chosen after every refresh
+        requestor.get_rate_limit()
+        self.assertEqual(requestor.cache_ttl, 370)
+        self.assertIs(requestor.get_rate_limit(), requestor.get_rate_limit())
+
+        # 40 pulls consumed within an instant
+        requestor.revalidate()
+        self.assertEqual(requestor.cache_ttl, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
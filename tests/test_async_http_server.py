@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+import asyncio
+import datetime
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from typing import Tuple
+
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.account_pool import DockerHubAccount
+from docker_rate_limit_check.async_http_client import AsyncHTTPClient
+from docker_rate_limit_check.async_http_client import AsyncHTTPResponse
+from docker_rate_limit_check.async_http_client import proxy_for_url
+from docker_rate_limit_check.async_http_server import \
+    AsyncDockerRateLimitHTTPServer
+from docker_rate_limit_check.async_requestor import AsyncDockerHubAccountPool
+from docker_rate_limit_check.async_requestor import AsyncDockerHubRequestor
+from docker_rate_limit_check.async_requestor import refresh_in_background
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.exporter_client import \
+    request_rate_limit_from_exporter
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+
+from fake_requestor import FakeAsyncDockerHubRequestor
+
+
+class TestAsyncHTTPServer(unittest.TestCase):
+    def helper_start_server(
+            self,
+            requestor: AsyncDockerHubRequestor,
+            keep_alive_timeout: float=15) -> Tuple[str, int]:
+        """
+        Helper function to start a server on a random port in the background.
+
+        :param requestor: Requestor to answer requests with
+        :param keep_alive_timeout: Number of seconds to wait for a request
+        :return: Address the server listens on
+        """
+
+        server = AsyncDockerRateLimitHTTPServer(
+            port=0,
+            host='127.0.0.1',
+            default_format=RateLimitOutputFormat.JSON,
+            docker_hub_requestor=requestor,
+            keep_alive_timeout=keep_alive_timeout)
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(server.serve_forever(),),
+            daemon=True)
+        thread.start()
+        server.ready.wait(5)
+
+        def stop() -> None:
+            server.shutdown()
+            thread.join()
+        self.addCleanup(stop)
+
+        assert server.server_address is not None  # for type checkers
+        return server.server_address
+
+    def test_keep_alive(self) -> None:
+        requestor = FakeAsyncDockerHubRequestor(cache_ttl=60)
+        host, port = self.helper_start_server(requestor)
+
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        self.addCleanup(conn.close)
+
+        # Multiple requests are answered on the same connection
+        for path, status in [('/', 200), ('/nothing', 404), ('/?format=xml', 400), ('/', 200)]:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+            self.assertEqual(response.status, status, path)
+
+        self.assertEqual(json.loads(body)['rate_limit_remaining'], 80)
+
+        # Not modified response has no body
+        conn.request('GET', '/', headers={'If-None-Match': str(response.getheader('ETag'))})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b'')
+        conn.request('GET', '/')
+        self.assertEqual(conn.getresponse().read(), body)
+
+        self.assertEqual(requestor.upstream_calls, 1)
+
+    def test_upstream_error(self) -> None:
+        requestor = FakeAsyncDockerHubRequestor(cache_ttl=0, errors=[
+            RequestException('Docker Hub is unavailable'),
+            ValueError('Malformed rate limit'),
+            KeyError('token')])
+        host, port = self.helper_start_server(requestor)
+
+        # Failed refresh without cached information is answered with an
+        # error on the same connection
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        self.addCleanup(conn.close)
+        for message in [b'Docker Hub is unavailable', b'Malformed rate limit', b'token']:
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            self.assertEqual(response.status, 502)
+            self.assertEqual(response.getheader('Retry-After'), '5')
+            self.assertIn(message, response.read())
+
+    def test_watch(self) -> None:
+        requestor = FakeAsyncDockerHubRequestor(remaining=100, cache_ttl=0)
+        host, port = self.helper_start_server(requestor)
+
+        def watch(query: str) -> http.client.HTTPResponse:
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            self.addCleanup(conn.close)
+            conn.request('GET', f'/watch?{query}')
+            response = conn.getresponse()
+            response.read()
+            return response
+
+        # Client that has not seen any version is answered immediately
+        response = watch('wait=10')
+        self.assertEqual(response.status, 200)
+        version = response.getheader('X-Rate-Limit-Version')
+
+        # Event stream starts with the current rate limit
+        stream = http.client.HTTPConnection(host, port, timeout=10)
+        self.addCleanup(stream.close)
+        stream.request('GET', '/watch?format=json-compact')
+        events = stream.getresponse()
+        self.assertEqual(events.getheader('Content-Type'), 'text/event-stream')
+        self.assertEqual(events.fp.readline(), f'id: {version}\n'.encode())
+
+        # Client is answered once the rate limit changes ...
+        threading.Timer(0.5, requestor.consume).start()
+        start = time.monotonic()
+        response = watch(f'wait=10&version={version}')
+        self.assertEqual(response.status, 200)
+        self.assertGreater(time.monotonic() - start, 0.4)
+        self.assertNotEqual(response.getheader('X-Rate-Limit-Version'), version)
+
+        # ... and the change is streamed
+        lines = [events.fp.readline() for _ in range(6)]
+        self.assertIn(b'event: rate_limit\n', lines)
+        self.assertTrue(any(b'"rate_limit_remaining":99' in line for line in lines), lines)
+
+        # ... or when waiting for it to change timed out
+        version = response.getheader('X-Rate-Limit-Version')
+        response = watch(f'wait=0.2&version={version}')
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader('X-Rate-Limit-Version'), version)
+
+        for query in ('wait=-1', 'wait=soon', 'since=0'):
+            self.assertEqual(watch(query).status, 400)
+
+    def test_malformed_request(self) -> None:
+        host, port = self.helper_start_server(FakeAsyncDockerHubRequestor(cache_ttl=0))
+
+        # Malformed request is answered like http.server does
+        for request in [b'GARBAGE\r\n\r\n', b'GET / HTTP/1.1\r\nContent-Length: x\r\n\r\n']:
+            with socket.create_connection((host, port), timeout=5) as sock:
+                sock.sendall(request)
+                response = sock.makefile('rb').read()
+            self.assertTrue(response.startswith(b'HTTP/1.1 400 Bad Request\r\n'), response)
+            self.assertIn(b'Connection: close\r\n', response)
+
+    def test_large_request_body(self) -> None:
+        host, port = self.helper_start_server(FakeAsyncDockerHubRequestor(cache_ttl=0))
+
+        # Body is refused before it has been sent
+        with socket.create_connection((host, port), timeout=5) as sock:
+            sock.sendall(b'GET / HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n')
+            response = sock.makefile('rb').read()
+        self.assertTrue(response.startswith(b'HTTP/1.1 413 Request Entity Too Large\r\n'), response)
+        self.assertIn(b'Connection: close\r\n', response)
+
+    def test_slow_request(self) -> None:
+        host, port = self.helper_start_server(
+            FakeAsyncDockerHubRequestor(cache_ttl=0), keep_alive_timeout=0.5)
+
+        # Request head trickling in is not waited for line by line
+        with socket.create_connection((host, port), timeout=5) as sock:
+            started = time.monotonic()
+            sock.sendall(b'GET / HTTP/1.1\r\n')
+            for _ in range(10):
+                time.sleep(0.2)
+                try:
+                    sock.sendall(b'X-Header: value\r\n')
+                except OSError:
+                    break
+            self.assertEqual(sock.makefile('rb').read(), b'')
+            self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_refresh_in_background_concurrency(self) -> None:
+        requestors = [FakeAsyncDockerHubRequestor(delay=0.1, cache_ttl=60) for _ in range(4)]
+        shared = FakeAsyncDockerHubRequestor(cache_ttl=0)
+        # All requestors record calls in the same counters
+        for requestor in requestors:
+            requestor.get_rate_limit_from_docker_hub = (  # type: ignore[method-assign]
+                shared.get_rate_limit_from_docker_hub)
+
+        async def run() -> None:
+            # Refreshes in background acquire the semaphore of the pool
+            semaphore = asyncio.Semaphore(2)
+            refresher = asyncio.get_running_loop().create_task(refresh_in_background(
+                list(requestors), refresh_ahead=1, semaphore=semaphore))
+            await asyncio.sleep(0.5)
+            refresher.cancel()
+
+        asyncio.run(run())
+        self.assertEqual(shared.upstream_calls, 4)
+        self.assertEqual(shared.max_concurrent_calls, 2)
+
+    def test_account_pool_concurrency(self) -> None:
+        accounts = [DockerHubAccount(name=f'account-{i}') for i in range(8)]
+        pool = AsyncDockerHubAccountPool(
+            accounts=accounts, cache_ttl=60, max_concurrency=2, stale_while_revalidate=60)
+        shared = FakeAsyncDockerHubRequestor(delay=0.05, cache_ttl=0)
+        for requestor in pool.requestors.values():
+            requestor.get_rate_limit_from_docker_hub = (  # type: ignore[method-assign]
+                shared.get_rate_limit_from_docker_hub)
+            requestor.store_in_cache(DockerRateLimit(rate_limit_max=100, rate_limit_remaining=100))
+
+        async def run() -> None:
+            # Fresh information is returned while all refreshes are busy
+            async with pool.semaphore, pool.semaphore:
+                group = await asyncio.wait_for(pool.get_rate_limit(), 1)
+            self.assertEqual(group.rate_limits['account-0'].rate_limit_remaining, 100)
+
+            # Stale information is refreshed in the background holding
+            # the semaphore
+            for requestor in pool.requestors.values():
+                requestor.cache_last_refresh -= datetime.timedelta(seconds=90)
+            await pool.get_rate_limit()
+            await pool.get_rate_limit()
+            for _ in range(100):
+                if shared.upstream_calls == len(accounts):
+                    break
+                await asyncio.sleep(0.05)
+
+        asyncio.run(run())
+        self.assertEqual(shared.upstream_calls, len(accounts))
+        self.assertEqual(shared.max_concurrent_calls, 2)
+
+    def test_concurrent_requests(self) -> None:
+        requestor = FakeAsyncDockerHubRequestor(delay=0.5, cache_ttl=60)
+        host, port = self.helper_start_server(requestor)
+        statuses = []
+
+        def get() -> None:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request('GET', '/metrics')
+            statuses.append(conn.getresponse().status)
+            conn.close()
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=get) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # All requests wait for a single refresh
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(statuses, [200] * 20)
+        self.assertEqual(requestor.upstream_calls, 1)
+        self.assertEqual(requestor.coalesced_refreshes, 19)
+
+
+    def test_client_connection_reuse(self) -> None:
+        requestor = FakeAsyncDockerHubRequestor(cache_ttl=0)
+        host, port = self.helper_start_server(requestor)
+
+        async def run() -> None:
+            client = AsyncHTTPClient()
+            for _ in range(3):
+                response = await client.request('GET', f'http://{host}:{port}/nothing')
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.body, b'HTTP 404 - Not Found\n')
+            await client.close()
+
+            self.assertEqual(client.connection_stats(), {
+                'upstream_requests': 3,
+                'upstream_connections': 1,
+                'upstream_connections_reused': 2,
+            })
+
+        asyncio.run(run())
+
+    def test_client_proxy_and_json(self) -> None:
+        environment = {
+            'HTTPS_PROXY': 'http://proxy.example.com:3128',
+            'NO_PROXY': 'localhost',
+        }
+        with patch.dict(os.environ, environment, clear=True):
+            self.assertEqual(
+                proxy_for_url('https://auth.docker.io/token'),
+                'http://proxy.example.com:3128')
+            self.assertIsNone(proxy_for_url('https://localhost/token'))
+            self.assertIsNone(proxy_for_url('http://auth.docker.io/token'))
+
+        response = AsyncHTTPResponse(status_code=200, headers={}, body=b'{"token": "a"}')
+        self.assertEqual(response.json(), {'token': 'a'})
+        with self.assertRaises(ValueError):
+            AsyncHTTPResponse(status_code=200, headers={}, body=b'["token"]').json()
+
+    def test_unix_socket(self) -> None:
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'exporter.sock')
+
+        server = AsyncDockerRateLimitHTTPServer(
+            port=0,
+            default_format=RateLimitOutputFormat.JSON,
+            docker_hub_requestor=FakeAsyncDockerHubRequestor(cache_ttl=0),
+            unix_socket=path)
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(server.serve_forever(),),
+            daemon=True)
+        thread.start()
+        server.ready.wait(5)
+
+        rate_limit = request_rate_limit_from_exporter(path, timeout=5)
+        self.assertIsInstance(rate_limit, DockerRateLimit)
+        assert isinstance(rate_limit, DockerRateLimit)
+        self.assertEqual(rate_limit.rate_limit_remaining, 80)
+
+        # Socket is removed when server stops
+        server.shutdown()
+        thread.join()
+        self.assertFalse(os.path.exists(path))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from email.utils import formatdate
+
+from docker_rate_limit_check.circuit_breaker import CircuitBreaker
+from docker_rate_limit_check.circuit_breaker import CircuitOpenError
+from docker_rate_limit_check.circuit_breaker import parse_retry_after
+from docker_rate_limit_check.instrumentation import EXPORTER_METRICS
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_parse_retry_after(self) -> None:
+        self.assertEqual(parse_retry_after({'retry-after': '120'}), 120)
+        self.assertIsNone(parse_retry_after({}))
+        self.assertIsNone(parse_retry_after({'retry-after': 'soon'}))
+
+        retry_after = parse_retry_after({'retry-after': formatdate(time.time() + 60)})
+        assert retry_after is not None
+        self.assertAlmostEqual(retry_after, 60, delta=2)
+        self.assertEqual(parse_retry_after({'retry-after': formatdate(0)}), 0)
+
+    def test_backoff(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=2, base_delay=10, max_delay=25)
+        open_circuits = EXPORTER_METRICS.upstream_circuits_open.get()
+
+        # Circuit opens after threshold is reached
+        breaker.before_request()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        breaker.before_request()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertTrue(5 <= breaker.seconds_until_retry <= 10)
+        self.assertEqual(EXPORTER_METRICS.upstream_circuits_open.get() - open_circuits, 1)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+        self.assertEqual(breaker.rejected, 1)
+
+        # Delay doubles with every failure up to the maximum
+        breaker.record_failure()
+        self.assertTrue(10 <= breaker.seconds_until_retry <= 20)
+        breaker.record_failure()
+        self.assertTrue(12.5 <= breaker.seconds_until_retry <= 25)
+
+        # Success closes the circuit
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(breaker.failures, 0)
+        self.assertEqual(EXPORTER_METRICS.upstream_circuits_open.get(), open_circuits)
+
+    def test_trial_request(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=1, base_delay=0.1)
+        breaker.before_request()
+        breaker.record_failure()
+        time.sleep(0.1)
+
+        # Only a single trial request is let through
+        breaker.before_request()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_request()
+        breaker.record_success()
+        breaker.before_request()
+
+    def test_retry_after(self) -> None:
+        breaker = CircuitBreaker(failure_threshold=0, max_delay=1)
+
+        # Failures do not open circuit without threshold
+        breaker.before_request()
+        breaker.note_response(503, {})
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+
+        # Unless Docker Hub asks to back off, even beyond maximum delay
+        breaker.before_request()
+        breaker.note_response(503, {'retry-after': '120'})
+        breaker.record_failure()
+        self.assertTrue(118 <= breaker.seconds_until_retry <= 120)
+
+        # Exhausted rate limit is not queried right away
+        breaker = CircuitBreaker()
+        breaker.before_request()
+        breaker.note_response(429, {'retry-after': '30'})
+        breaker.record_success()
+        self.assertTrue(28 <= breaker.seconds_until_retry <= 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@
 
 import json
 import re
+import subprocess
 import sys
 import unittest
 from io import StringIO
@@ -111,8 +112,9 @@ class TestCliQuery(unittest.TestCase):
         # Check the exit code
         self.assertEqual(exit_code, 0, 'Exit code is not 0')
 
-        # Regular expressions to match HELP and metric lines
+        # Regular expressions to match HELP, TYPE and metric lines
         help_pattern = re.compile(r'^# HELP .*$')
+        type_pattern = re.compile(r'^# TYPE .* gauge$')
         metric_pattern = re.compile(r'^([-_A-Za-z0-9]*){(.*)} ([0-9]*)')
 
         # Split the output into lines
@@ -127,16 +129,18 @@ class TestCliQuery(unittest.TestCase):
             'No output when querying for Prometheus output')
 
 
-        # Check that every metric line has a HELP line
+        # Check that every metric line has HELP and TYPE lines
         for i, line in enumerate(lines):
-            if i % 2 == 0:
+            if i % 3 == 0:
                 self.assertTrue(help_pattern.match(line))
+            elif i % 3 == 1:
+                self.assertTrue(type_pattern.match(line))
             else:
                 self.assertTrue(metric_pattern.match(line))
 
 
         # Check that all "identifier" labels in metrics are the same
-        metric_lines = [line for i, line in enumerate(lines) if i % 2 == 1]
+        metric_lines = [line for i, line in enumerate(lines) if i % 3 == 2]
         metric_labels = []
 
         for line in metric_lines:
@@ -179,3 +183,23 @@ class TestCliQuery(unittest.TestCase):
         self.assertEqual(
             sorted(expected_metrics),
             sorted(found_metrics))
+
+    def test_cli_http_refresh_ahead(self) -> None:
+        # Refreshing ahead by the whole TTL would query Docker Hub continuously
+        result = subprocess.run(  # noqa: S603
+            [sys.executable, '-m', 'docker_rate_limit_check', 'http',
+             '--port', '0', '--cache-ttl', '5', '--refresh-ahead', '5'],
+            check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn(b'--refresh-ahead', result.stderr)
+
+    def test_cli_lazy_imports(self) -> None:
+        # Modules only needed by some commands are not imported on start
+        script = (
+            'import sys, docker_rate_limit_check.__main__; '
+            'print(" ".join(m for m in ("asyncio", "http.server", "requests", "yaml") '
+            'if m in sys.modules))')
+        output = subprocess.run(  # noqa: S603
+            [sys.executable, '-c', script],
+            check=True, stdout=subprocess.PIPE).stdout
+        self.assertEqual(output.decode('utf-8').strip(), '')
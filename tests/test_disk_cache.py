@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from typing import List
+
+from docker_rate_limit_check.disk_cache import DiskCache
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'cache', 'query.json')
+        self.refreshes = 0
+
+    def refresh(self) -> DockerRateLimit:
+        self.refreshes += 1
+        return DockerRateLimit(
+            rate_limit_max=100,
+            rate_limit_remaining=100 - self.refreshes,
+            identifier='127.0.0.1')
+
+    def test_cache(self) -> None:
+        cache = DiskCache(self.path, ttl=60)
+        first = cache.get_or_refresh('a', self.refresh)
+        self.assertEqual(first.rate_limit_remaining, 99)
+
+        # Fresh information is shared between instances (processes)
+        other = DiskCache(self.path, ttl=60)
+        self.assertEqual(other.get_or_refresh('a', self.refresh), first)
+        self.assertEqual(self.refreshes, 1)
+
+        # Keys are cached independently
+        other.get_or_refresh('b', self.refresh)
+        self.assertEqual(self.refreshes, 2)
+        self.assertEqual(cache.get_or_refresh('a', self.refresh), first)
+
+        # No temporary files are left behind
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(self.path))),
+            ['query.json', 'query.json.lock'])
+
+    def test_expired(self) -> None:
+        cache = DiskCache(self.path, ttl=60)
+        cache.get_or_refresh('a', self.refresh)
+
+        with open(self.path, encoding='utf-8') as cache_file:
+            entries = json.load(cache_file)
+        entries['a']['refreshed_at'] = time.time() - 61
+        with open(self.path, 'w', encoding='utf-8') as cache_file:
+            json.dump(entries, cache_file)
+
+        self.assertEqual(cache.get_or_refresh('a', self.refresh).rate_limit_remaining, 98)
+        self.assertEqual(self.refreshes, 2)
+
+    def test_corrupt_file(self) -> None:
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w', encoding='utf-8') as cache_file:
+            cache_file.write('{"a": {"refreshed_at"')
+
+        cache = DiskCache(self.path, ttl=60)
+        self.assertEqual(cache.get_or_refresh('a', self.refresh).rate_limit_remaining, 99)
+        self.assertEqual(cache.get_or_refresh('a', self.refresh).rate_limit_remaining, 99)
+        self.assertEqual(self.refreshes, 1)
+
+    def test_concurrent_refresh(self) -> None:
+        def slow_refresh() -> DockerRateLimit:
+            time.sleep(0.2)
+            return self.refresh()
+
+        results: List[DockerRateLimit] = []
+
+        def query() -> None:
+            results.append(DiskCache(self.path, ttl=60).get_or_refresh('a', slow_refresh))
+
+        threads = [threading.Thread(target=query) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Concurrent invocations wait for a single refresh
+        self.assertEqual(self.refreshes, 1)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result == results[0] for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+from typing import Any
+from typing import Dict
+from typing import List
+
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.background_refresher import BackgroundRefresher
+from docker_rate_limit_check.docker_hub_requestor import DockerHubRequestor
+from docker_rate_limit_check.docker_hub_requestor import \
+    parse_rate_limit_header
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.instrumentation import EXPORTER_METRICS
+from docker_rate_limit_check.response_cache import freshness_headers
+from docker_rate_limit_check.single_flight import SingleFlight
+from docker_rate_limit_check.token_cache import TokenCache
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+def mock_response(
+        status_code: int,
+        json: Any=None,
+        headers: Any=None) -> MagicMock:
+    """
+    Create mock of requests.Response
+
+    :param status_code: HTTP status code of response
+    :param json: Return value of response.json()
+    :param headers: Headers of response
+    :return: Mocked response
+    """
+
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = json
+    response.headers = headers if headers is not None else {}
+    return response
+
+
+RATE_LIMIT_HEADERS = {
+    'ratelimit-limit': '100;w=21600',
+    'ratelimit-remaining': '80;w=21600',
+    'docker-ratelimit-source': '127.0.0.1',
+}
+
+
+class TestDockerHubRequestor(unittest.TestCase):
+    def test_cache(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=60)
+
+        first = requestor.get_rate_limit()
+        second = requestor.get_rate_limit()
+
+        self.assertEqual(requestor.upstream_calls, 1)
+        self.assertEqual(first, second)
+
+    def test_single_flight(self) -> None:
+        requestor = FakeDockerHubRequestor(delay=0.3, cache_ttl=60)
+        results = []
+
+        def get() -> None:
+            results.append(requestor.get_rate_limit())
+
+        threads = [threading.Thread(target=get) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(requestor.upstream_calls, 1)
+        self.assertEqual(requestor.coalesced_refreshes, 9)
+        self.assertEqual(len(results), 10)
+        for result in results:
+            self.assertEqual(result, results[0])
+
+    def test_single_flight_anonymous_accounts(self) -> None:
+        # Refreshes of different anonymous requestors are not coalesced
+        single_flight: SingleFlight[DockerRateLimit] = SingleFlight()
+        requestors = [
+            FakeDockerHubRequestor(delay=0.3, cache_ttl=60, single_flight=single_flight)
+            for _ in range(2)]
+
+        threads = [
+            threading.Thread(target=requestor.get_rate_limit) for requestor in requestors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(single_flight.coalesced_calls, 0)
+        for requestor in requestors:
+            self.assertEqual(requestor.upstream_calls, 1)
+            self.assertLess(requestor.cache_age, requestor.cache_ttl)
+
+    def test_single_flight_exception(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=60)
+
+        def fail() -> DockerRateLimit:
+            raise KeyError('error')
+
+        with self.assertRaises(KeyError):
+            requestor.single_flight.do(None, fail)
+
+        # Failed refresh must not leave a refresh in flight
+        requestor.get_rate_limit()
+        self.assertEqual(requestor.upstream_calls, 1)
+
+    def test_stale_while_revalidate(self) -> None:
+        requestor = FakeDockerHubRequestor(
+            pulls_per_refresh=1,
+            delay=0.3, cache_ttl=1, stale_while_revalidate=60)
+        first = requestor.get_rate_limit()
+        time.sleep(1.1)
+
+        # Stale information is returned without waiting for Docker Hub
+        start = time.monotonic()
+        second = requestor.get_rate_limit()
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertEqual(first, second)
+
+        # Information is refreshed in background
+        time.sleep(0.5)
+        self.assertEqual(requestor.upstream_calls, 2)
+        self.assertNotEqual(requestor.get_rate_limit(), first)
+
+    def test_stale_if_error(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=0, stale_if_error=60)
+        first = requestor.get_rate_limit()
+        requestor.fail = True
+        self.assertEqual(requestor.get_rate_limit(), first)
+
+        requestor.stale_if_error = 0
+        with self.assertRaises(RequestException):
+            requestor.get_rate_limit()
+
+    def test_background_refresher(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=2)
+        refresher = BackgroundRefresher(
+            requestors=[requestor],
+            refresh_ahead=1,
+            min_interval=0.1)
+        refresher.start()
+        self.addCleanup(refresher.stop)
+
+        # Cache is filled and refreshed one second before it expires
+        time.sleep(0.2)
+        self.assertEqual(requestor.upstream_calls, 1)
+        time.sleep(1.2)
+        self.assertEqual(requestor.upstream_calls, 2)
+        self.assertLess(requestor.cache_age, requestor.cache_ttl)
+
+    def test_background_refresher_refresh_ahead(self) -> None:
+        # Refreshing ahead by the whole TTL would query Docker Hub continuously
+        requestor = FakeDockerHubRequestor(cache_ttl=2)
+        with self.assertRaises(ValueError):
+            BackgroundRefresher(requestors=[requestor], refresh_ahead=2)
+        with self.assertRaises(ValueError):
+            BackgroundRefresher(requestors=[requestor], refresh_ahead=3)
+        self.assertEqual(requestor.upstream_calls, 0)
+
+    def test_token_cache(self) -> None:
+        requestor = DockerHubRequestor(connect_timeout=3, read_timeout=7)
+        token_response = mock_response(200, json={'token': 'abc', 'expires_in': 300})
+        head_response = mock_response(200, headers=RATE_LIMIT_HEADERS)
+
+        with patch('requests.Session.get', return_value=token_response) as get, \
+             patch('requests.Session.head', return_value=head_response) as head:
+            rate_limit = requestor.get_rate_limit_from_docker_hub()
+            requestor.get_rate_limit_from_docker_hub()
+
+        self.assertEqual(rate_limit.rate_limit_remaining, 80)
+        self.assertEqual(rate_limit.rate_limit_window, 21600)
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(head.call_count, 2)
+        self.assertEqual(head.call_args.kwargs['timeout'], (3, 7))
+        self.assertEqual(requestor.token_cache.hits, 1)
+        self.assertEqual(requestor.token_cache.misses, 1)
+
+    def test_token_cache_key(self) -> None:
+        token_cache = TokenCache()
+        requestor = DockerHubRequestor(user='alice', password='secret', token_cache=token_cache)
+        token_cache.put(requestor.token_cache_key, 'abc', 300)
+
+        # Token is only shared by requestors with the same credential and
+        # token endpoint
+        same = DockerHubRequestor(user='alice', password='secret', token_cache=token_cache)
+        self.assertEqual(token_cache.get(same.token_cache_key), 'abc')
+        for other in (
+                DockerHubRequestor(user='alice', password='wrong', token_cache=token_cache),
+                DockerHubRequestor(token_cache=token_cache),
+                DockerHubRequestor(
+                    user='alice',
+                    password='secret',
+                    token_cache=token_cache,
+                    token_endpoint='http://127.0.0.1/token')):
+            self.assertIsNone(token_cache.get(other.token_cache_key))
+        self.assertNotIn('secret', repr(requestor.token_cache_key))
+
+    def test_parse_rate_limit_header(self) -> None:
+        self.assertEqual(parse_rate_limit_header('100;w=21600'), (100, 21600))
+        self.assertEqual(parse_rate_limit_header('100'), (100, None))
+        with self.assertRaises(ValueError):
+            parse_rate_limit_header(';w=21600')
+
+    def test_token_cache_expired(self) -> None:
+        requestor = DockerHubRequestor()
+        token_response = mock_response(200, json={'token': 'abc', 'expires_in': 5})
+        head_response = mock_response(200, headers=RATE_LIMIT_HEADERS)
+
+        # Token expiring within the expiry margin is not reused
+        with patch('requests.Session.get', return_value=token_response) as get, \
+             patch('requests.Session.head', return_value=head_response):
+            requestor.get_rate_limit_from_docker_hub()
+            requestor.get_rate_limit_from_docker_hub()
+
+        self.assertEqual(get.call_count, 2)
+
+    def test_token_rejected(self) -> None:
+        requestor = DockerHubRequestor()
+        requestor.token_cache.put(requestor.token_cache_key, 'revoked', 300)
+        token_response = mock_response(200, json={'token': 'abc'})
+        responses: Dict[str, List[MagicMock]] = {
+            'revoked': [mock_response(401)],
+            'abc': [mock_response(200, headers=RATE_LIMIT_HEADERS)],
+        }
+
+        def head(_url: str, headers: Dict[str, str], **_kwargs: Any) -> MagicMock:
+            token = headers['Authorization'].split(' ')[1]
+            return responses[token].pop()
+
+        with patch('requests.Session.get', return_value=token_response) as get, \
+             patch('requests.Session.head', side_effect=head):
+            rate_limit = requestor.get_rate_limit_from_docker_hub()
+
+        self.assertEqual(rate_limit.rate_limit_max, 100)
+        self.assertEqual(get.call_count, 1)
+
+    def test_exporter_metrics(self) -> None:
+        requestor = DockerHubRequestor(cache_ttl=60)
+        token = mock_response(200, json={'token': 'secret'})
+        lookups = EXPORTER_METRICS.cache_lookups
+        errors = EXPORTER_METRICS.upstream_errors
+        durations = EXPORTER_METRICS.upstream_request_duration
+
+        hits = lookups.get('hit')
+        misses = lookups.get('miss')
+        token_requests = durations.count('token')
+        server_errors = errors.get('rate_limit', '503')
+        connection_errors = errors.get('rate_limit', 'none')
+
+        with patch('requests.Session.get', return_value=token), \
+                patch('requests.Session.head', return_value=mock_response(503)):
+            with self.assertRaises(RequestException):
+                requestor.get_rate_limit()
+        with patch('requests.Session.get', return_value=token), \
+                patch('requests.Session.head', side_effect=RequestsConnectionError()):
+            with self.assertRaises(RequestException):
+                requestor.get_rate_limit()
+        with patch('requests.Session.get', return_value=token), \
+                patch('requests.Session.head',
+                      return_value=mock_response(200, headers=RATE_LIMIT_HEADERS)):
+            requestor.get_rate_limit()
+            requestor.get_rate_limit()
+
+        self.assertEqual(lookups.get('miss') - misses, 3)
+        self.assertEqual(lookups.get('hit') - hits, 1)
+        self.assertEqual(durations.count('token') - token_requests, 1)
+        self.assertEqual(errors.get('rate_limit', '503') - server_errors, 1)
+        self.assertEqual(errors.get('rate_limit', 'none') - connection_errors, 1)
+        self.assertIn(
+            'docker_rate_limit_check_cache_lookups_total{result="hit"}',
+            EXPORTER_METRICS.render())
+
+    def test_circuit_breaker(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=0, failure_threshold=2)
+        first = requestor.get_rate_limit()
+        requestor.fail = True
+
+        # Failed refreshes are retried until the circuit opens
+        for _ in range(2):
+            with self.assertRaises(RequestException):
+                requestor.get_rate_limit()
+        self.assertEqual(requestor.upstream_calls, 3)
+
+        # Then the last known rate limit is returned without querying
+        # Docker Hub, marked as stale
+        self.assertIs(requestor.get_rate_limit(), first)
+        self.assertEqual(requestor.upstream_calls, 3)
+        self.assertEqual(requestor.debug_metrics()['circuit_breaker_rejected'], 1)
+        time.sleep(1.1)
+        self.assertEqual(freshness_headers(requestor)['X-Rate-Limit-Stale'], '1')
+
+    def test_circuit_breaker_throttled(self) -> None:
+        requestor = DockerHubRequestor(cache_ttl=0)
+        token = mock_response(200, json={'token': 'secret'})
+        throttled = mock_response(429, headers={
+            **RATE_LIMIT_HEADERS,
+            'ratelimit-remaining': '0;w=21600',
+            'retry-after': '60',
+        })
+
+        with patch('requests.Session.get', return_value=token), \
+                patch('requests.Session.head', return_value=throttled) as head:
+            rate_limit = requestor.get_rate_limit()
+            self.assertEqual(requestor.get_rate_limit(), rate_limit)
+
+        # Exhausted rate limit is answered from cache until Retry-After
+        self.assertEqual(rate_limit, DockerRateLimit(0, 0))
+        self.assertEqual(head.call_count, 1)
+        self.assertTrue(58 <= requestor.circuit_breaker.seconds_until_retry <= 60)
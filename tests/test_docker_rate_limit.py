@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import csv
+import io
 import json
 import re
 import unittest
@@ -7,6 +9,7 @@ import unittest
 import yaml
 
 from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
 from docker_rate_limit_check.output_format import RateLimitOutputFormat
 
 
@@ -44,18 +47,22 @@ class TestDockerRateLimit(unittest.TestCase):
         self.assertEqual(json.loads(self.rate_limit.to_json()), expected_dict)
 
     def test_to_prometheus(self) -> None:
-        # Regular expressions to match HELP and metric lines
-        help_pattern = re.compile(r'^# HELP .*$')
+        # Regular expressions to match HELP, TYPE and metric lines
+        help_pattern = re.compile(r'^# HELP ([_A-Za-z0-9]+) .+$')
+        type_pattern = re.compile(r'^# TYPE ([_A-Za-z0-9]+) gauge$')
         metric_pattern = re.compile(r'^([-_A-Za-z0-9]*){(.*)} ([0-9]*)')
 
-        output = self.rate_limit.to_prometheus()
+        lines = self.rate_limit.to_prometheus().split('\n')
+        self.assertEqual(len(lines), 9)
 
-        # Check that every metric line has a HELP line
-        for i, line in enumerate(output.split('\n')):
-            if i % 2 == 0:
-                self.assertTrue(help_pattern.match(line))
-            else:
-                self.assertTrue(metric_pattern.match(line))
+        # Check that every metric line has HELP and TYPE lines naming it
+        for i in range(0, len(lines), 3):
+            help_match = help_pattern.match(lines[i])
+            type_match = type_pattern.match(lines[i + 1])
+            metric_match = metric_pattern.match(lines[i + 2])
+            assert help_match and type_match and metric_match, lines[i:i + 3]
+            self.assertEqual(help_match.group(1), metric_match.group(1))
+            self.assertEqual(type_match.group(1), metric_match.group(1))
 
         # Check that the expected metrics are present with correct values
         expected_metrics = [
@@ -63,7 +70,7 @@ class TestDockerRateLimit(unittest.TestCase):
             'docker_hub_rate_limit_remaining{identifier="None"} 20',
             'docker_hub_rate_limit_used{identifier="None"} 280'
         ]
-        metrics = [line for i, line in enumerate(output.split('\n')) if i % 2 == 1]
+        metrics = lines[2::3]
 
         for expected_metric in expected_metrics:
             self.assertIn(expected_metric, metrics)
@@ -76,3 +83,88 @@ class TestDockerRateLimit(unittest.TestCase):
             'rate_limit_used': 280
         }
         self.assertEqual(yaml.safe_load(self.rate_limit.to_yaml()), expected_dict)
+
+    def test_to_compact_json(self) -> None:
+        self.assertEqual(
+            self.rate_limit.to_compact_json(),
+            json.dumps(self.rate_limit.asdict(), separators=(',', ':')).encode() + b'\n')
+        self.assertEqual(self.rate_limit.to_ndjson(), self.rate_limit.to_compact_json())
+
+    def test_to_openmetrics(self) -> None:
+        rate_limit = DockerRateLimit(
+            rate_limit_max=100,
+            rate_limit_remaining=80,
+            identifier='127.0.0.1',
+            refreshed_at=1700000000.25)
+        lines = rate_limit.to_openmetrics().decode().split('\n')
+
+        # Every metric has TYPE and HELP lines followed by a timestamped sample
+        self.assertEqual(lines[:3], [
+            '# TYPE docker_hub_rate_limit_max gauge',
+            '# HELP docker_hub_rate_limit_max Maximum image pulls for identifier (best case)',
+            'docker_hub_rate_limit_max{identifier="127.0.0.1"} 100 1700000000.250',
+        ])
+        self.assertEqual(lines[-2:], ['# EOF', ''])
+
+        # Refresh time is not compared
+        self.assertEqual(rate_limit, DockerRateLimit(100, 80, '127.0.0.1'))
+        self.assertIn(b'_used{identifier="None"} 280\n', self.rate_limit.to_openmetrics())
+
+    def test_render(self) -> None:
+        for output_format in RateLimitOutputFormat:
+            rendered = self.rate_limit.render(output_format)
+            self.assertTrue(rendered.endswith(b'\n'), output_format)
+            self.assertEqual(
+                rendered.decode().rstrip('\n'),
+                self.rate_limit.to_output_format(output_format))
+
+
+class TestDockerRateLimitGroup(unittest.TestCase):
+    def setUp(self) -> None:
+        self.group = DockerRateLimitGroup(rate_limits={
+            'team-a': DockerRateLimit(rate_limit_max=200, rate_limit_remaining=150, identifier='a'),
+            'team "b"': DockerRateLimit(rate_limit_max=200, rate_limit_remaining=10, identifier='b'),
+        })
+
+    def test_to_json(self) -> None:
+        data = json.loads(self.group.to_json())
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[0]['account'], 'team-a')
+        self.assertEqual(data[1]['rate_limit_used'], 190)
+
+    def test_to_prometheus(self) -> None:
+        lines = self.group.to_prometheus().split('\n')
+
+        # Every metric has exactly one HELP and TYPE line followed by one
+        # line per account
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(lines[:2], [
+            '# HELP docker_hub_rate_limit_max Maximum image pulls for identifier (best case)',
+            '# TYPE docker_hub_rate_limit_max gauge',
+        ])
+        self.assertIn(
+            'docker_hub_rate_limit_remaining{account="team \\"b\\"",identifier="b"} 10',
+            lines)
+
+    def test_to_yaml(self) -> None:
+        self.assertEqual(yaml.safe_load(self.group.to_yaml()), self.group.asdicts())
+
+    def test_to_compact_json(self) -> None:
+        self.assertEqual(json.loads(self.group.to_compact_json()), self.group.asdicts())
+        self.assertEqual(
+            [json.loads(line) for line in self.group.to_ndjson().splitlines()],
+            self.group.asdicts())
+
+    def test_to_csv(self) -> None:
+        rows = list(csv.DictReader(io.StringIO(self.group.to_csv().decode())))
+        self.assertEqual(
+            rows,
+            [{key: str(value) for key, value in data.items()} for data in self.group.asdicts()])
+
+    def test_to_openmetrics(self) -> None:
+        lines = self.group.to_openmetrics().decode().split('\n')
+        self.assertEqual(len(lines), 14)
+        self.assertIn(
+            'docker_hub_rate_limit_remaining{account="team \\"b\\"",identifier="b"} 10',
+            lines)
+        self.assertEqual(lines[-2], '# EOF')
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+
+from docker_rate_limit_check.history import RateLimitHistory
+from docker_rate_limit_check.history import history_to_output_format
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+
+
+class TestRateLimitHistory(unittest.TestCase):
+    def test_ring_buffer(self) -> None:
+        history = RateLimitHistory(size=3)
+        self.assertEqual(history.samples(), [])
+        self.assertIsNone(history.consumption_rate)
+        self.assertIsNone(history.seconds_until_exhausted)
+
+        for second in range(5):
+            history.record(float(second), 100, 100 - second)
+
+        # Only the newest samples are kept, oldest first
+        self.assertEqual(len(history), 3)
+        self.assertEqual(
+            history.samples(),
+            [(2.0, 100, 98), (3.0, 100, 97), (4.0, 100, 96)])
+
+    def test_forecast(self) -> None:
+        history = RateLimitHistory(time_constant=60)
+        for minute in range(10):
+            history.record(60.0 * minute, 100, 100 - 2 * minute, 'user')
+
+        # Two pulls per minute, 82 pulls remaining
+        rate = history.consumption_rate
+        assert rate is not None
+        self.assertAlmostEqual(rate, 2 / 60)
+        exhausted = history.seconds_until_exhausted
+        assert exhausted is not None
+        self.assertAlmostEqual(exhausted, 82 * 30)
+
+        # Pulls given back, rate limit will not be exhausted
+        history.record(1200.0, 100, 100)
+        self.assertLess(history.consumption_rate or 0, 0)
+        self.assertIsNone(history.seconds_until_exhausted)
+
+        # Rate of old limit does not apply to new one
+        history.record(1260.0, 0, 0)
+        self.assertIsNone(history.consumption_rate)
+        self.assertEqual(history.seconds_until_exhausted, 0)
+
+    def test_output_formats(self) -> None:
+        history = RateLimitHistory()
+        history.record(0.0, 100, 100, '127.0.0.1')
+        history.record(10.0, 100, 90, '127.0.0.1')
+
+        data = json.loads(history_to_output_format(history, RateLimitOutputFormat.JSON))
+        self.assertEqual(data['identifier'], '127.0.0.1')
+        self.assertEqual(data['consumption_rate'], 1.0)
+        self.assertEqual(data['seconds_until_exhausted'], 90.0)
+        self.assertEqual(len(data['samples']), 2)
+
+        prometheus = history_to_output_format(
+            {'team-a': history, 'empty': RateLimitHistory()},
+            RateLimitOutputFormat.PROMETHEUS)
+        self.assertIn(
+            'docker_hub_rate_limit_seconds_until_exhausted'
+            '{account="team-a",identifier="127.0.0.1"} 90.0',
+            prometheus)
+        self.assertIn(
+            'docker_hub_rate_limit_history_samples{account="empty",identifier="None"} 0',
+            prometheus)
+        self.assertNotIn('docker_hub_rate_limit_consumption_rate{account="empty"', prometheus)
+
+        lines = history_to_output_format(
+            {'team-a': history},
+            RateLimitOutputFormat.CSV).splitlines()
+        self.assertEqual(lines, [
+            'account,identifier,timestamp,rate_limit_max,rate_limit_remaining',
+            'team-a,127.0.0.1,0.0,100,100',
+            'team-a,127.0.0.1,10.0,100,90',
+        ])
+
+        compact = history_to_output_format(history, RateLimitOutputFormat.JSON_COMPACT)
+        self.assertEqual(json.loads(compact), data)
+        self.assertNotIn(' ', compact)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+
+import gzip
+import http.client
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.exporter_client import UnixHTTPConnection
+from docker_rate_limit_check.exporter_client import \
+    request_rate_limit_from_exporter
+from docker_rate_limit_check.http_server import DockerRateLimitHTTPServer
+from docker_rate_limit_check.http_server import create_http_server
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+from docker_rate_limit_check.server_mode import HTTPServerMode
+from docker_rate_limit_check.watch import rate_limit_version
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+class TestHTTPServer(unittest.TestCase):
+    def helper_start_server(
+            self,
+            mode: HTTPServerMode,
+            **kwargs: Any) -> DockerRateLimitHTTPServer:
+        """
+        Helper function to start a server on a random port in the background.
+
+        :param mode: Concurrency model of the server
+        :param **kwargs: Additional arguments for the server
+        :return: The running server
+        """
+
+        kwargs.setdefault('docker_hub_requestor', FakeDockerHubRequestor(delay=1.0, cache_ttl=0))
+        server = create_http_server(
+            port=0,
+            host='127.0.0.1',
+            default_format=RateLimitOutputFormat.JSON,
+            mode=mode,
+            workers=2,
+            **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+
+        return server
+
+    def helper_get(self, server: DockerRateLimitHTTPServer, path: str) -> Tuple[int, bytes]:
+        """
+        Helper function to send a GET request to the server.
+
+        :param server: Server to send request to
+        :param path: Path to request
+        :return: Tuple containing the status code and the response body
+        """
+
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+    def helper_test_not_blocked(self, mode: HTTPServerMode) -> None:
+        """
+        Helper function to check that a slow refresh does not block
+        other requests.
+
+        :param mode: Concurrency model of the server
+        """
+
+        server = self.helper_start_server(mode)
+
+        slow_request = threading.Thread(target=self.helper_get, args=(server, '/'))
+        slow_request.start()
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        status, _ = self.helper_get(server, '/not-found')
+        duration = time.monotonic() - start
+        slow_request.join()
+
+        self.assertEqual(status, 404)
+        self.assertLess(duration, 0.5, 'Request was blocked by slow refresh')
+
+    def test_threaded_not_blocked(self) -> None:
+        self.helper_test_not_blocked(HTTPServerMode.THREADED)
+
+    def test_pool_not_blocked(self) -> None:
+        self.helper_test_not_blocked(HTTPServerMode.POOL)
+
+    def test_rate_limit_response(self) -> None:
+        server = self.helper_start_server(HTTPServerMode.THREADED)
+        status, body = self.helper_get(server, '/metrics')
+
+        self.assertEqual(status, 200)
+        self.assertIn(b'docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 80', body)
+        self.assertIn(b'# TYPE docker_rate_limit_check_http_request_duration_seconds', body)
+
+        # Metrics describing exporter itself can be disabled
+        server = self.helper_start_server(HTTPServerMode.THREADED, self_metrics=False)
+        status, body = self.helper_get(server, '/metrics')
+        self.assertEqual(status, 200)
+        self.assertNotIn(b'docker_rate_limit_check_', body)
+
+        # OpenMetrics exposition ends with EOF marker
+        status, body = self.helper_get(server, '/metrics?format=openmetrics')
+        self.assertEqual(status, 200)
+        self.assertIn(b'# TYPE docker_hub_rate_limit_remaining gauge\n', body)
+        self.assertTrue(body.endswith(b'\n# EOF\n'))
+
+    def test_debug_metrics(self) -> None:
+        server = self.helper_start_server(HTTPServerMode.SINGLE)
+        status, _ = self.helper_get(server, '/debug')
+        self.assertEqual(status, 404)
+
+        server = self.helper_start_server(HTTPServerMode.SINGLE, debug_metrics=True)
+        status, body = self.helper_get(server, '/debug')
+        self.assertEqual(status, 200)
+        self.assertIn('upstream_connections_reused', json.loads(body))
+
+    def test_history(self) -> None:
+        server = self.helper_start_server(
+            HTTPServerMode.SINGLE,
+            docker_hub_requestor=FakeDockerHubRequestor(cache_ttl=0))
+        for _ in range(3):
+            self.helper_get(server, '/')
+
+        status, body = self.helper_get(server, '/history')
+        self.assertEqual(status, 200)
+        history = json.loads(body)
+        self.assertEqual(history['identifier'], '127.0.0.1')
+        self.assertEqual(len(history['samples']), 3)
+        self.assertEqual(history['samples'][-1]['rate_limit_remaining'], 80)
+
+        status, body = self.helper_get(server, '/history?format=prometheus')
+        self.assertEqual(status, 200)
+        self.assertIn(b'docker_hub_rate_limit_history_samples{identifier="127.0.0.1"} 3', body)
+
+        status, _ = self.helper_get(server, '/history?since=0')
+        self.assertEqual(status, 400)
+
+    def test_circuit_open(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=0)
+        requestor.circuit_breaker.before_request()
+        requestor.circuit_breaker.note_response(503, {'retry-after': '30'})
+        requestor.circuit_breaker.record_failure()
+        server = self.helper_start_server(HTTPServerMode.SINGLE, docker_hub_requestor=requestor)
+
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        self.addCleanup(conn.close)
+        conn.request('GET', '/')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 503)
+        self.assertIn(response.getheader('Retry-After'), ('29', '30'))
+
+    def test_upstream_error(self) -> None:
+        requestor = FakeDockerHubRequestor(cache_ttl=0, errors=[
+            RequestException('Docker Hub is unavailable'),
+            ValueError('Malformed rate limit'),
+            KeyError('token')])
+        server = self.helper_start_server(HTTPServerMode.SINGLE, docker_hub_requestor=requestor)
+
+        # Failed refresh without cached information is answered with an error
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        self.addCleanup(conn.close)
+        for message in [b'Docker Hub is unavailable', b'Malformed rate limit', b'token']:
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            self.assertEqual(response.status, 502)
+            self.assertEqual(response.getheader('Retry-After'), '5')
+            self.assertIn(message, response.read())
+
+    def test_conditional_request(self) -> None:
+        server = self.helper_start_server(
+            HTTPServerMode.SINGLE,
+            docker_hub_requestor=FakeDockerHubRequestor(cache_ttl=60))
+        host, port = server.server_address[:2]
+
+        def get(path: str, etag: Optional[str]=None) -> http.client.HTTPResponse:
+            conn = http.client.HTTPConnection(str(host), port, timeout=5)
+            self.addCleanup(conn.close)
+            conn.request('GET', path, headers={} if etag is None else {'If-None-Match': etag})
+            return conn.getresponse()
+
+        response = get('/')
+        etag = response.getheader('ETag')
+        self.assertEqual(response.status, 200)
+        self.assertIsNotNone(etag)
+        self.assertEqual(response.getheader('Cache-Control'), 'max-age=60')
+        self.assertEqual(response.getheader('Age'), '0')
+
+        # Matching entity tag is answered without body
+        for if_none_match in [str(etag), f'"other", W/{etag}', '*']:
+            response = get('/', if_none_match)
+            self.assertEqual(response.status, 304, if_none_match)
+            self.assertEqual(response.read(), b'')
+            self.assertEqual(response.getheader('ETag'), etag)
+
+        # Other format has other entity tag
+        response = get('/?format=yaml', etag)
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.getheader('ETag'), etag)
+
+    def test_keep_alive(self) -> None:
+        server = self.helper_start_server(
+            HTTPServerMode.THREADED,
+            docker_hub_requestor=FakeDockerHubRequestor(cache_ttl=60),
+            max_keep_alive_requests=4)
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        self.addCleanup(conn.close)
+
+        # Every response can be read without closing the connection
+        conn.connect()
+        sock = conn.sock
+        for path, status in [('/', 200), ('/?format=%C3%BC', 400), ('/nothing', 404)]:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            body = response.read()
+            self.assertEqual(response.status, status, path)
+            self.assertEqual(response.getheader('Content-Length'), str(len(body)))
+            self.assertIsNone(response.getheader('Connection'))
+            self.assertIsNotNone(response.getheader('Content-Type'))
+            self.assertIs(conn.sock, sock)
+
+        # Connection is closed after maximum number of requests
+        conn.request('GET', '/metrics')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(
+            response.getheader('Content-Type'),
+            'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_single_no_keep_alive(self) -> None:
+        server = self.helper_start_server(HTTPServerMode.SINGLE)
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        self.addCleanup(conn.close)
+
+        conn.request('GET', '/nothing')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.getheader('Connection'), 'close')
+
+    def test_watch_long_poll(self) -> None:
+        requestor = FakeDockerHubRequestor(remaining=100, cache_ttl=0)
+        server = self.helper_start_server(HTTPServerMode.THREADED, docker_hub_requestor=requestor)
+        host, port = server.server_address[:2]
+
+        def watch(query: str) -> http.client.HTTPResponse:
+            conn = http.client.HTTPConnection(str(host), port, timeout=10)
+            self.addCleanup(conn.close)
+            conn.request('GET', f'/watch?{query}')
+            response = conn.getresponse()
+            response.read()
+            return response
+
+        # Client that has not seen any version is answered immediately
+        response = watch('wait=10')
+        self.assertEqual(response.status, 200)
+        version = response.getheader('X-Rate-Limit-Version')
+
+        # Client is answered once the rate limit changes ...
+        threading.Timer(0.5, requestor.consume).start()
+        start = time.monotonic()
+        response = watch(f'wait=10&version={version}')
+        self.assertEqual(response.status, 200)
+        self.assertGreater(time.monotonic() - start, 0.4)
+        self.assertNotEqual(response.getheader('X-Rate-Limit-Version'), version)
+
+        # ... or when waiting for it to change timed out
+        version = response.getheader('X-Rate-Limit-Version')
+        response = watch(f'wait=0.2&version={version}')
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.getheader('X-Rate-Limit-Version'), version)
+
+        for query in ('wait=-1', 'wait=soon', 'wait=1&wait=2', 'since=0'):
+            self.assertEqual(watch(query).status, 400)
+
+    def test_watch_shared_refresh(self) -> None:
+        requestor = FakeDockerHubRequestor(remaining=100, cache_ttl=0)
+        server = self.helper_start_server(HTTPServerMode.THREADED, docker_hub_requestor=requestor)
+        version = rate_limit_version(DockerRateLimit(100, 100, '127.0.0.1'))
+
+        # Many waiting clients do not query Docker Hub more often
+        statuses: List[int] = []
+        watchers = [
+            threading.Thread(target=lambda: statuses.append(
+                self.helper_get(server, f'/watch?wait=1&version={version}')[0]))
+            for _ in range(6)]
+        for watcher in watchers:
+            watcher.start()
+        for watcher in watchers:
+            watcher.join()
+        self.assertEqual(statuses, [304] * 6)
+        self.assertLessEqual(requestor.upstream_calls, 3)
+
+    def test_watch_event_stream(self) -> None:
+        requestor = FakeDockerHubRequestor(remaining=100, cache_ttl=0)
+        server = self.helper_start_server(HTTPServerMode.THREADED, docker_hub_requestor=requestor)
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=10)
+        self.addCleanup(conn.close)
+
+        conn.request('GET', '/watch?format=prometheus')
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+
+        def read_event() -> List[bytes]:
+            lines: List[bytes] = []
+            while True:
+                line = response.fp.readline()
+                if line == b'\n':
+                    return lines
+                lines.append(line)
+
+        # Current rate limit is sent right away, every change once it happens
+        first = read_event()
+        self.assertTrue(first[0].startswith(b'id: '))
+        self.assertEqual(first[1], b'event: rate_limit\n')
+        self.assertIn(b'data: docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 100\n', first)
+        requestor.consume()
+        second = read_event()
+        self.assertNotEqual(first[0], second[0])
+        self.assertIn(b'data: docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 99\n', second)
+
+    def test_watch_pool_not_blocked(self) -> None:
+        requestor = FakeDockerHubRequestor(remaining=100, cache_ttl=0)
+        server = self.helper_start_server(HTTPServerMode.POOL, docker_hub_requestor=requestor)
+        host, port = server.server_address[:2]
+
+        conn = http.client.HTTPConnection(str(host), port, timeout=10)
+        self.addCleanup(conn.close)
+        conn.request('GET', '/watch?wait=10')
+        response = conn.getresponse()
+        response.read()
+        version = response.getheader('X-Rate-Limit-Version')
+
+        # More waiting clients than worker threads
+        streams = []
+        for _ in range(3):
+            stream = http.client.HTTPConnection(str(host), port, timeout=10)
+            self.addCleanup(stream.close)
+            stream.request('GET', '/watch')
+            self.assertEqual(stream.getresponse().status, 200)
+            streams.append(stream)
+        long_poll = http.client.HTTPConnection(str(host), port, timeout=10)
+        self.addCleanup(long_poll.close)
+        long_poll.request('GET', f'/watch?wait=30&version={version}')
+
+        # Other requests are still answered by the worker threads
+        start = time.monotonic()
+        for _ in range(4):
+            status, _ = self.helper_get(server, '/metrics')
+            self.assertEqual(status, 200)
+        self.assertLess(time.monotonic() - start, 1)
+
+        # Waiting client is answered once the rate limit changes
+        requestor.consume()
+        response = long_poll.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(json.loads(response.read())['rate_limit_remaining'], 99)
+
+    def test_watch_pool_max_watchers(self) -> None:
+        server = self.helper_start_server(
+            HTTPServerMode.POOL,
+            docker_hub_requestor=FakeDockerHubRequestor(remaining=100, cache_ttl=0),
+            max_watchers=2)
+        host, port = server.server_address[:2]
+        version = rate_limit_version(DockerRateLimit(100, 100, '127.0.0.1'))
+
+        # Waiting clients occupy every dedicated thread
+        long_polls = []
+        for _ in range(2):
+            long_poll = http.client.HTTPConnection(str(host), port, timeout=10)
+            self.addCleanup(long_poll.close)
+            long_poll.request('GET', f'/watch?wait=1&version={version}')
+            long_polls.append(long_poll)
+        time.sleep(0.3)
+
+        # Further clients are refused ...
+        conn = http.client.HTTPConnection(str(host), port, timeout=10)
+        self.addCleanup(conn.close)
+        conn.request('GET', '/watch?wait=1')
+        response = conn.getresponse()
+        response.read()
+        self.assertEqual(response.status, 503)
+        self.assertIsNotNone(response.getheader('Retry-After'))
+
+        # ... until waiting clients have been answered
+        for long_poll in long_polls:
+            self.assertEqual(long_poll.getresponse().status, 304)
+        time.sleep(0.1)
+        status, _ = self.helper_get(server, '/watch?wait=1')
+        self.assertEqual(status, 200)
+
+    def test_watch_single(self) -> None:
+        server = self.helper_start_server(HTTPServerMode.SINGLE)
+        status, _ = self.helper_get(server, '/watch?wait=1')
+        self.assertEqual(status, 501)
+
+    def test_unix_socket(self) -> None:
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'exporter.sock')
+
+        # Socket left behind by a previous server is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        for mode in (HTTPServerMode.SINGLE, HTTPServerMode.THREADED):
+            server = self.helper_start_server(
+                mode,
+                docker_hub_requestor=FakeDockerHubRequestor(cache_ttl=0),
+                unix_socket=path,
+                unix_socket_mode=0o600)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+            conn = UnixHTTPConnection(path, timeout=5)
+            try:
+                conn.request('GET', '/metrics')
+                response = conn.getresponse()
+                self.assertEqual(response.status, 200)
+                self.assertIn(
+                    b'docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 80',
+                    response.read())
+            finally:
+                conn.close()
+
+            rate_limit = request_rate_limit_from_exporter(path, timeout=5)
+            self.assertIsInstance(rate_limit, DockerRateLimit)
+            assert isinstance(rate_limit, DockerRateLimit)
+            self.assertEqual(rate_limit.rate_limit_remaining, 80)
+            self.assertEqual(rate_limit.identifier, '127.0.0.1')
+
+            # Socket is removed when server is closed
+            server.shutdown()
+            server.server_close()
+            self.assertFalse(os.path.exists(path))
+
+    def test_compression(self) -> None:
+        server = self.helper_start_server(HTTPServerMode.THREADED, compression_min_size=0)
+        host, port = server.server_address[:2]
+        conn = http.client.HTTPConnection(str(host), port, timeout=5)
+        self.addCleanup(conn.close)
+
+        # Cached rate limit and metrics of exporter appended on every
+        # request are compressed alike
+        for path, expected in (
+                ('/?format=json', b'"rate_limit_remaining": 80'),
+                ('/metrics', b'docker_rate_limit_check_http_requests_in_flight'),
+                ('/history', b'"samples"')):
+            conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            body = response.read()
+            self.assertEqual(response.status, 200, path)
+            self.assertEqual(response.getheader('Content-Encoding'), 'gzip', path)
+            self.assertEqual(response.getheader('Vary'), 'Accept-Encoding', path)
+            self.assertIn(expected, gzip.decompress(body), path)
+
+        conn.request('GET', '/', headers={'Accept-Encoding': 'identity'})
+        response = conn.getresponse()
+        self.assertEqual(json.loads(response.read())['rate_limit_remaining'], 80)
+        self.assertIsNone(response.getheader('Content-Encoding'))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from docker_rate_limit_check.instrumentation import Counter
+from docker_rate_limit_check.instrumentation import Gauge
+from docker_rate_limit_check.instrumentation import Histogram
+
+
+class TestInstrumentation(unittest.TestCase):
+    def test_counter(self) -> None:
+        counter = Counter('requests_total', 'Requests by code', ['code'])
+        counter.inc('200')
+        counter.inc('200')
+        counter.inc('4"4')
+
+        self.assertEqual(counter.get('200'), 2)
+        self.assertEqual(counter.render(), [
+            '# HELP requests_total Requests by code',
+            '# TYPE requests_total counter',
+            'requests_total{code="200"} 2',
+            'requests_total{code="4\\"4"} 1',
+        ])
+
+    def test_gauge(self) -> None:
+        gauge = Gauge('in_flight', 'Requests in flight')
+        with gauge.track_in_progress():
+            self.assertEqual(gauge.get(), 1)
+        self.assertEqual(gauge.render_samples(), ['in_flight 0'])
+
+    def test_histogram(self) -> None:
+        histogram = Histogram('duration_seconds', 'Duration', buckets=[0.1, 1.0])
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count(), 4)
+        self.assertEqual(histogram.render_samples(), [
+            'duration_seconds_bucket{le="0.1"} 2',
+            'duration_seconds_bucket{le="1.0"} 3',
+            'duration_seconds_bucket{le="+Inf"} 4',
+            'duration_seconds_sum 3.65',
+            'duration_seconds_count 4',
+        ])
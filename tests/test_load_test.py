@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from docker_rate_limit_check.http_server import create_http_server
+from docker_rate_limit_check.load_test import LoadTest
+from docker_rate_limit_check.load_test import default_request_mix
+from docker_rate_limit_check.load_test import percentile
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+from docker_rate_limit_check.server_mode import HTTPServerMode
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+class TestLoadTest(unittest.TestCase):
+    def setUp(self) -> None:
+        server = create_http_server(
+            port=0,
+            host='127.0.0.1',
+            default_format=RateLimitOutputFormat.JSON,
+            docker_hub_requestor=FakeDockerHubRequestor(cache_ttl=60),
+            mode=HTTPServerMode.THREADED)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+
+        host, port = server.server_address[:2]
+        self.url = f'http://{host!s}:{port}'
+
+    def test_load_test(self) -> None:
+        for keep_alive in (True, False):
+            result = LoadTest(
+                url=self.url,
+                paths=['/', '/not-found'],
+                concurrency=2,
+                duration=0.5,
+                keep_alive=keep_alive).run()
+
+            paths = result['paths']
+            self.assertGreater(paths['/']['requests'], 0)
+            self.assertEqual(paths['/']['errors'], 0)
+            self.assertEqual(paths['/not-found']['errors'], paths['/not-found']['requests'])
+            self.assertEqual(result['errors_by_kind'], {'404': paths['/not-found']['requests']})
+            self.assertEqual(
+                result['requests'],
+                paths['/']['requests'] + paths['/not-found']['requests'])
+            self.assertGreater(result['requests_per_second'], 0)
+            self.assertGreater(result['bytes_received'], 0)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+
+    def test_connection_errors(self) -> None:
+        with self.assertRaises(ValueError):
+            LoadTest(url='127.0.0.1:8080', paths=['/'], concurrency=1, duration=1)
+
+        # Requests without response are errors without latency
+        result = LoadTest(
+            url='http://127.0.0.1:8080',
+            paths=['/'],
+            concurrency=1,
+            duration=0.2,
+            unix_socket='/nonexistent/exporter.sock').run()
+        self.assertEqual(result['requests'], 0)
+        self.assertGreater(result['errors_by_kind']['FileNotFoundError'], 0)
+        self.assertIsNone(result['latency_ms']['p50'])
+
+        # Failed connections are retried with backoff instead of immediately
+        self.assertLess(result['errors'], 10)
+
+    def test_request_mix(self) -> None:
+        paths = default_request_mix()
+        self.assertEqual(paths[:2], ['/', '/metrics'])
+        self.assertIn('/?format=openmetrics', paths)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 50), 2.0)
+        self.assertEqual(percentile([1.0, 2.0, 3.0, 4.0], 99), 4.0)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+import http.client
+import json
+import threading
+import time
+import unittest
+
+from requests.exceptions import RequestException
+
+from docker_rate_limit_check.circuit_breaker import CircuitOpenError
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
+from docker_rate_limit_check.history import RateLimitHistory
+from docker_rate_limit_check.http_server import create_http_server
+from docker_rate_limit_check.http_server import upstream_error_response
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+from docker_rate_limit_check.prefork_server import PreforkServer
+from docker_rate_limit_check.prefork_server import SharedCacheRefresher
+from docker_rate_limit_check.server_mode import HTTPServerMode
+from docker_rate_limit_check.shared_cache import SharedCacheRequestor
+from docker_rate_limit_check.shared_cache import SharedRateLimitCache
+from docker_rate_limit_check.shared_cache import decode_history
+from docker_rate_limit_check.shared_cache import decode_rate_limit
+from docker_rate_limit_check.shared_cache import encode_history
+from docker_rate_limit_check.shared_cache import encode_rate_limit
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+class TestPreforkServer(unittest.TestCase):
+    def helper_start_refresher(self, refresher: SharedCacheRefresher) -> None:
+        """
+        Helper function to run the refresher in the background.
+
+        :param refresher: Refresher to run
+        """
+
+        stop_event = threading.Event()
+
+        def run() -> None:
+            while not stop_event.is_set():
+                refresher.run_once(0.05)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            stop_event.set()
+            thread.join()
+        self.addCleanup(stop)
+
+    def test_encode_rate_limit(self) -> None:
+        rate_limit = DockerRateLimit(rate_limit_max=100, rate_limit_remaining=20, identifier='a')
+        self.assertEqual(decode_rate_limit(encode_rate_limit(rate_limit)), rate_limit)
+
+        group = DockerRateLimitGroup(rate_limits={'team-a': rate_limit, 'team-b': rate_limit})
+        self.assertEqual(decode_rate_limit(encode_rate_limit(group)), group)
+
+    def test_encode_history(self) -> None:
+        history = RateLimitHistory(size=3)
+        for second in range(5):
+            history.record(float(second), 100, 100 - second, 'a')
+
+        decoded = decode_history(encode_history({'team-a': history}))
+        assert isinstance(decoded, dict)
+        self.assertEqual(decoded['team-a'].samples(), history.samples())
+        self.assertEqual(decoded['team-a'].consumption_rate, history.consumption_rate)
+        self.assertEqual(decoded['team-a'].identifier, 'a')
+
+        # History that does not fit is left out rather than the rate limit
+        shared_cache = SharedRateLimitCache(size=256)
+        rate_limit = DockerRateLimit(rate_limit_max=100, rate_limit_remaining=20)
+        shared_cache.publish(rate_limit, 1.0, history=decoded['team-a'])
+        snapshot = shared_cache.read()
+        self.assertIsNone(snapshot.history)
+        self.assertEqual(snapshot.rate_limit, encode_rate_limit(rate_limit))
+
+    def test_shared_cache(self) -> None:
+        shared_cache = SharedRateLimitCache(size=4096)
+        requestor = FakeDockerHubRequestor(remaining=100, pulls_per_refresh=1)
+        refresher = SharedCacheRefresher(requestor, shared_cache, cache_ttl=60, retry_interval=0)
+        self.helper_start_refresher(refresher)
+
+        # Rate limit is requested once and the same object is handed out
+        reader = SharedCacheRequestor(shared_cache, cache_ttl=60, refresh_timeout=5)
+        rate_limit = reader.get_rate_limit()
+        self.assertEqual(rate_limit, DockerRateLimit(100, 99, '127.0.0.1'))
+        self.assertIs(reader.get_rate_limit(), rate_limit)
+        self.assertEqual(
+            SharedCacheRequestor(shared_cache, cache_ttl=60).get_rate_limit(),
+            rate_limit)
+        self.assertEqual(requestor.upstream_calls, 1)
+        self.assertLess(reader.cache_age, 5)
+
+        # History is recorded by the refreshing process, including
+        # refreshes no reader has seen
+        refresher.refresh()
+        history = reader.history
+        assert isinstance(history, RateLimitHistory)
+        self.assertEqual([sample[2] for sample in history.samples()], [99, 98])
+        self.assertEqual(history.identifier, '127.0.0.1')
+        self.assertEqual(history.consumption_rate, requestor.history.consumption_rate)
+        self.assertIs(reader.history, history)
+
+        # Expired rate limit is refreshed
+        reader.cache_ttl = 0
+        refresher.cache_ttl = 0
+        time.sleep(0.01)
+        requestor.fail = True
+        with self.assertRaisesRegex(RequestException, 'Docker Hub is unavailable'):
+            reader.get_rate_limit()
+
+        # Unless it can be served after an error
+        reader.stale_if_error = 60
+        self.assertEqual(reader.get_rate_limit(), DockerRateLimit(100, 98, '127.0.0.1'))
+
+        # Failed refresh keeps the history
+        self.assertEqual(len(reader.history), 2)
+
+    def test_circuit_open(self) -> None:
+        shared_cache = SharedRateLimitCache(size=4096)
+        requestor = FakeDockerHubRequestor(remaining=100, pulls_per_refresh=1)
+        refresher = SharedCacheRefresher(requestor, shared_cache, cache_ttl=60)
+        refresher.refresh()
+        refreshed_at = shared_cache.read().refreshed_at
+        time.sleep(0.05)
+
+        # Open circuit
+        requestor.fail = True
+        for _ in range(requestor.circuit_breaker.failure_threshold):
+            refresher.refresh()
+        self.assertTrue(requestor.circuit_breaker.is_open)
+
+        # Rate limit the requestor falls back to while the circuit is open
+        # is not published as fresh
+        calls = requestor.upstream_calls
+        refresher.refresh()
+        self.assertEqual(requestor.upstream_calls, calls)
+        snapshot = shared_cache.read()
+        self.assertEqual(snapshot.refreshed_at, refreshed_at)
+        self.assertIsNotNone(snapshot.error)
+        self.assertIn('Not querying Docker Hub', str(snapshot.error))
+
+        reader = SharedCacheRequestor(shared_cache, cache_ttl=60)
+        self.assertEqual(reader.get_rate_limit(), DockerRateLimit(100, 99, '127.0.0.1'))
+        self.assertGreaterEqual(reader.cache_age, 0.05)
+
+        # Workers keep answering with it while the circuit is open,
+        # regardless of its age
+        self.assertGreater(snapshot.retry_at, time.time())
+        reader.cache_ttl = 0
+        self.assertEqual(reader.get_rate_limit(), DockerRateLimit(100, 99, '127.0.0.1'))
+
+        # Without a rate limit they answer when Docker Hub is queried again
+        empty_cache = SharedRateLimitCache(size=4096)
+        SharedCacheRefresher(requestor, empty_cache, cache_ttl=60).refresh()
+        with self.assertRaises(CircuitOpenError) as context:
+            SharedCacheRequestor(empty_cache, cache_ttl=60).get_rate_limit()
+        status, _, headers = upstream_error_response(context.exception)
+        self.assertEqual(status, 503)
+        self.assertGreater(int(headers['Retry-After']), 0)
+
+    def test_prefork_server(self) -> None:
+        shared_cache = SharedRateLimitCache()
+        requestor = FakeDockerHubRequestor(remaining=100, pulls_per_refresh=1)
+        server = create_http_server(
+            port=0,
+            host='127.0.0.1',
+            default_format=RateLimitOutputFormat.JSON,
+            docker_hub_requestor=SharedCacheRequestor(
+                shared_cache,
+                cache_ttl=60,
+                refresh_timeout=5),
+            mode=HTTPServerMode.PREFORK)
+        prefork_server = PreforkServer(
+            server=server,
+            refresher=SharedCacheRefresher(requestor, shared_cache, cache_ttl=60),
+            processes=3)
+        thread = threading.Thread(
+            target=prefork_server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            prefork_server.shutdown()
+            thread.join()
+            server.server_close()
+        self.addCleanup(stop)
+
+        # All workers answer with the rate limit requested once by the
+        # main process
+        host, port = server.server_address[:2]
+        bodies = set()
+        for _ in range(20):
+            conn = http.client.HTTPConnection(str(host), port, timeout=10)
+            conn.request('GET', '/')
+            response = conn.getresponse()
+            self.assertEqual(response.status, 200)
+            bodies.add(response.read())
+            conn.close()
+
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(json.loads(bodies.pop())['rate_limit_remaining'], 99)
+        self.assertEqual(requestor.upstream_calls, 1)
+        self.assertEqual(len(prefork_server.workers), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
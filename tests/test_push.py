@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import socket
+import struct
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from typing import Any
+from typing import List
+from typing import Tuple
+
+from docker_rate_limit_check.docker_hub_requestor import create_session
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
+from docker_rate_limit_check.push import Pusher
+from docker_rate_limit_check.push import PushgatewaySink
+from docker_rate_limit_check.push import RemoteWriteSink
+from docker_rate_limit_check.push import StatsDSink
+from docker_rate_limit_check.push import encode_varint
+from docker_rate_limit_check.push import rate_limit_samples
+from docker_rate_limit_check.push import snappy_compress
+
+from fake_requestor import FakeDockerHubRequestor
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for Pushgateway and remote-write endpoint recording requests
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self) -> None:  # pylint: disable=missing-function-docstring
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.command, self.path, dict(self.headers), body))  # type: ignore
+        self.send_response(self.server.status_code)  # type: ignore
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_PUT = handle_request
+    do_POST = handle_request
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    """
+    Decode snappy block consisting only of literals
+
+    :param data: Encoded data
+    :return: Decoded data
+    """
+
+    length, shift, offset = 0, 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        length |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+
+    decoded = b''
+    while offset < len(data):
+        tag = data[offset] >> 2
+        offset += 1
+        if tag >= 60:
+            size = tag - 59
+            tag = int.from_bytes(data[offset:offset + size], 'little')
+            offset += size
+        decoded += data[offset:offset + tag + 1]
+        offset += tag + 1
+
+    assert len(decoded) == length
+    return decoded
+
+
+class TestPush(unittest.TestCase):
+    def helper_start_server(self, status_code: int=200) -> Tuple[str, List[Any]]:
+        """
+        Helper function to start a recording HTTP server in the background.
+
+        :param status_code: Status code to respond to every request with
+        :return: URL of the server and list of recorded requests
+        """
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+        server.requests = []  # type: ignore
+        server.status_code = status_code  # type: ignore
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        def stop() -> None:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.addCleanup(stop)
+
+        return f'http://127.0.0.1:{server.server_address[1]}', server.requests  # type: ignore
+
+    def test_samples(self) -> None:
+        samples = rate_limit_samples(DockerRateLimitGroup({
+            'team-a': DockerRateLimit(100, 80, 'user-a'),
+            'team-b': DockerRateLimit(200, 150, 'user-b'),
+        }))
+        self.assertEqual(len(samples), 6)
+        self.assertEqual(samples[3].name, 'docker_hub_rate_limit_remaining')
+        self.assertEqual(samples[3].labels, (('account', 'team-b'), ('identifier', 'user-b')))
+        self.assertEqual(samples[3].value, 150)
+
+    def test_pushgateway(self) -> None:
+        url, requests = self.helper_start_server()
+        sink = PushgatewaySink(url, create_session(), job='docker hub')
+        samples = rate_limit_samples(DockerRateLimit(100, 80, '127.0.0.1'))
+
+        # Unchanged samples are not pushed again
+        self.assertTrue(sink.push(samples, 0))
+        self.assertFalse(sink.push(samples, 1))
+        self.assertEqual(len(requests), 1)
+
+        method, path, _, body = requests[0]
+        self.assertEqual(method, 'PUT')
+        self.assertEqual(path, '/metrics/job/docker%20hub')
+        self.assertIn(b'# TYPE docker_hub_rate_limit_used gauge\n', body)
+        self.assertIn(b'docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 80\n', body)
+
+    def test_pushgateway_error(self) -> None:
+        url, requests = self.helper_start_server(status_code=500)
+        sink = PushgatewaySink(url, create_session())
+        samples = rate_limit_samples(DockerRateLimit(100, 80))
+
+        # Samples are pushed again after pushing them failed
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                sink.push(samples, 0)
+        self.assertEqual(len(requests), 2)
+
+    def test_statsd(self) -> None:
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(server.close)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+
+        sink = StatsDSink('127.0.0.1', server.getsockname()[1], prefix='ci.', max_packet_size=150)
+        self.addCleanup(sink.close)
+        sink.push(rate_limit_samples(DockerRateLimit(100, 80, 'a|b')), 0)
+
+        # Gauges are batched into as few datagrams as fit
+        packets = [server.recv(4096), server.recv(4096)]
+        lines = b'\n'.join(packets).split(b'\n')
+        self.assertTrue(all(len(packet) <= 150 for packet in packets))
+        self.assertEqual(lines, [
+            b'ci.docker_hub_rate_limit_max:100|g|#identifier:a_b',
+            b'ci.docker_hub_rate_limit_remaining:80|g|#identifier:a_b',
+            b'ci.docker_hub_rate_limit_used:20|g|#identifier:a_b',
+        ])
+
+    def test_snappy(self) -> None:
+        self.assertEqual(encode_varint(300), b'\xac\x02')
+        for size in (0, 1, 60, 61, 300, 70000):
+            data = bytes(range(256)) * (size // 256) + bytes(range(size % 256))
+            self.assertEqual(snappy_decompress(snappy_compress(data)), data)
+
+    def test_remote_write(self) -> None:
+        url, requests = self.helper_start_server()
+        sink = RemoteWriteSink(url, create_session(), batch_size=2)
+        sink.push(rate_limit_samples(DockerRateLimit(100, 80, '127.0.0.1')), 1700000000.5)
+
+        # Three samples are sent in two batches
+        self.assertEqual(len(requests), 2)
+        method, _, headers, body = requests[0]
+        self.assertEqual(method, 'POST')
+        self.assertEqual(headers['Content-Encoding'], 'snappy')
+        self.assertEqual(headers['X-Prometheus-Remote-Write-Version'], '0.1.0')
+
+        # Labels are sorted by name, sample has value and timestamp in ms
+        message = snappy_decompress(body)
+        name = b'\x0a\x08__name__\x12\x19docker_hub_rate_limit_max'
+        identifier = b'\x0a\x0aidentifier\x12\x09127.0.0.1'
+        sample = b'\x09' + struct.pack('<d', 100.0) + b'\x10' + encode_varint(1700000000500)
+        self.assertIn(name, message)
+        self.assertLess(message.index(name), message.index(identifier))
+        self.assertIn(sample, message)
+        self.assertEqual(len(snappy_decompress(requests[1][3]).split(b'__name__')), 2)
+
+    def test_remote_write_retry(self) -> None:
+        url, requests = self.helper_start_server(status_code=503)
+        sink = RemoteWriteSink(url, create_session(), max_pending=4)
+        for timestamp in range(2):
+            with self.assertRaises(OSError):
+                sink.push(rate_limit_samples(DockerRateLimit(100, 80 - timestamp)), timestamp)
+
+        # Oldest samples are dropped when too many are pending
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(len(sink.pending), 4)
+        self.assertEqual(sink.pending[0][1], 0)
+
+    def test_pusher(self) -> None:
+        url, requests = self.helper_start_server()
+        requestor = FakeDockerHubRequestor(remaining=100, cache_ttl=0)
+        pusher = Pusher(requestor, [PushgatewaySink(url, create_session())], interval=1)
+
+        for push in range(4):
+            if push % 2:
+                requestor.consume()
+            pusher.push_once()
+
+        # Rate limit is only pushed when it changed
+        self.assertEqual(requestor.upstream_calls, 4)
+        self.assertEqual(len(requests), 3)
+        self.assertIn(b'docker_hub_rate_limit_remaining{identifier="127.0.0.1"} 98\n', requests[-1][3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import io
+import json
+import threading
+import unittest
+from contextlib import redirect_stderr
+
+from typing import List
+
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
+from docker_rate_limit_check.output_format import RateLimitStreamFormat
+from docker_rate_limit_check.query_watch import RateLimitStreamer
+from docker_rate_limit_check.query_watch import format_records
+from docker_rate_limit_check.query_watch import rate_limit_records
+
+
+class TestQueryWatch(unittest.TestCase):
+    def test_format_records(self) -> None:
+        group = DockerRateLimitGroup({
+            'team a': DockerRateLimit(rate_limit_max=100, rate_limit_remaining=80),
+            'ci': DockerRateLimit(
+                rate_limit_max=200,
+                rate_limit_remaining=150,
+                identifier='127.0.0.1'),
+        })
+        records = rate_limit_records(group)
+
+        lines = format_records(records, 0, RateLimitStreamFormat.NDJSON).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1]), {
+            'time': '1970-01-01T00:00:00+00:00',
+            'account': 'ci',
+            'rate_limit_max': 200,
+            'rate_limit_remaining': 150,
+            'identifier': '127.0.0.1',
+            'rate_limit_used': 50,
+        })
+
+        lines = format_records(records, 0, RateLimitStreamFormat.LINE).splitlines()
+        self.assertEqual(
+            lines[0],
+            'time=1970-01-01T00:00:00+00:00 account="team a" rate_limit_max=100 '
+            'rate_limit_remaining=80 identifier= rate_limit_used=20')
+
+    def test_streamer(self) -> None:
+        # Remaining pulls by refresh, second refresh fails
+        remaining = [80, None, 80, 79]
+        refreshes: List[int] = []
+
+        def get_rate_limit() -> DockerRateLimit:
+            current = remaining[len(refreshes)]
+            refreshes.append(len(refreshes))
+            if current is None:
+                raise ConnectionError('Docker Hub unreachable')
+            return DockerRateLimit(rate_limit_max=100, rate_limit_remaining=current)
+
+        output = io.StringIO()
+        streamer = RateLimitStreamer(
+            get_rate_limit,
+            interval=0,
+            changes_only=True,
+            output=output)
+
+        # Failed refreshes are reported but do not stop the stream, unchanged
+        # rate limits are skipped
+        with redirect_stderr(io.StringIO()) as errors:
+            written = [streamer.refresh_once() for _ in range(4)]
+        self.assertEqual(written, [True, False, False, True])
+        self.assertIn('Docker Hub unreachable', errors.getvalue())
+        self.assertEqual(
+            [json.loads(line)['rate_limit_remaining'] for line in output.getvalue().splitlines()],
+            [80, 79])
+
+    def test_streamer_stop(self) -> None:
+        def get_rate_limit() -> DockerRateLimit:
+            streamer.stop()
+            return DockerRateLimit(rate_limit_max=100, rate_limit_remaining=80)
+
+        # Stopping ends the wait for the next refresh
+        output = io.StringIO()
+        streamer = RateLimitStreamer(get_rate_limit, interval=60, output=output)
+        thread = threading.Thread(target=streamer.run)
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+import gzip
+import unittest
+import zlib
+from unittest.mock import patch
+
+from docker_rate_limit_check import response_cache
+from docker_rate_limit_check.docker_hub_requestor import DockerHubRequestor
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimit
+from docker_rate_limit_check.docker_rate_limit import DockerRateLimitGroup
+from docker_rate_limit_check.output_format import RateLimitOutputFormat
+from docker_rate_limit_check.response_cache import ResponseCache
+from docker_rate_limit_check.response_cache import conditional_response
+from docker_rate_limit_check.response_cache import etag_matches
+from docker_rate_limit_check.response_cache import freshness_headers
+from docker_rate_limit_check.response_cache import negotiate_encoding
+from docker_rate_limit_check.response_cache import render_response
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.rate_limit = DockerRateLimit(rate_limit_max=300, rate_limit_remaining=20)
+
+    def test_render_response(self) -> None:
+        response = render_response(self.rate_limit, RateLimitOutputFormat.JSON)
+        self.assertEqual(response.body, (self.rate_limit.to_json() + '\n').encode('utf-8'))
+        self.assertEqual(response.headers, {
+            'Content-Length': str(len(response.body)),
+            'Content-Type': 'application/json',
+            'ETag': response.headers['ETag'],
+        })
+
+        response = render_response(self.rate_limit, RateLimitOutputFormat.PROMETHEUS)
+        self.assertEqual(
+            response.headers['Content-Type'],
+            'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_cache(self) -> None:
+        cache = ResponseCache()
+
+        # Every format is rendered once
+        json_response = cache.get(self.rate_limit, RateLimitOutputFormat.JSON)
+        yaml_response = cache.get(self.rate_limit, RateLimitOutputFormat.YAML)
+        self.assertIs(cache.get(self.rate_limit, RateLimitOutputFormat.JSON), json_response)
+        self.assertIs(cache.get(self.rate_limit, RateLimitOutputFormat.YAML), yaml_response)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 2)
+
+        # Refreshed rate limit invalidates rendered responses even if equal
+        refreshed = DockerRateLimit(rate_limit_max=300, rate_limit_remaining=20)
+        response = cache.get(refreshed, RateLimitOutputFormat.JSON)
+        self.assertIsNot(response, json_response)
+        self.assertEqual(response, json_response)
+        self.assertEqual(cache.misses, 3)
+
+    def test_etag_matches(self) -> None:
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('W/"abc"', '"abc"'))
+        self.assertTrue(etag_matches('"xyz", "abc"', '"abc"'))
+        self.assertTrue(etag_matches(' * ', '"abc"'))
+        self.assertFalse(etag_matches('"xyz"', '"abc"'))
+        self.assertFalse(etag_matches('abc', '"abc"'))
+
+    def test_freshness_headers(self) -> None:
+        requestor = DockerHubRequestor(cache_ttl=60, stale_while_revalidate=30)
+        requestor.store_in_cache(self.rate_limit)
+        self.assertEqual(freshness_headers(requestor), {
+            'Cache-Control': 'max-age=60, stale-while-revalidate=30',
+            'Age': '0',
+        })
+
+        # Expired information is not fresh for clients either
+        requestor.cache_ttl = 0
+        requestor.stale_while_revalidate = 0
+        requestor.stale_if_error = 120
+        self.assertEqual(
+            freshness_headers(requestor)['Cache-Control'],
+            'max-age=0, stale-if-error=120')
+
+    def test_conditional_response(self) -> None:
+        response = render_response(self.rate_limit, RateLimitOutputFormat.JSON)
+        etag = response.headers['ETag']
+        cache_headers = {'Age': '3'}
+
+        status, headers, body = conditional_response(response, cache_headers, None)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers, {**response.headers, 'Age': '3'})
+        self.assertEqual(body, response.body)
+
+        status, headers, body = conditional_response(response, cache_headers, etag)
+        self.assertEqual(status, 304)
+        self.assertEqual(headers, {'ETag': etag, 'Age': '3'})
+        self.assertEqual(body, b'')
+
+    def test_negotiate_encoding(self) -> None:
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding('gzip;q=0, deflate;q=0'))
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'gzip')
+        self.assertEqual(negotiate_encoding('deflate, gzip;q=0.5'), 'deflate')
+        self.assertEqual(negotiate_encoding('GZIP;Q=0.8'), 'gzip')
+        self.assertEqual(negotiate_encoding('*'), 'gzip')
+        self.assertEqual(negotiate_encoding('gzip;q=0, *'), 'deflate')
+
+    def test_compression(self) -> None:
+        group = DockerRateLimitGroup({
+            f'account-{index}': DockerRateLimit(rate_limit_max=200, rate_limit_remaining=index)
+            for index in range(50)
+        })
+        cache = ResponseCache(compression_min_size=1024)
+
+        # Compressed responses are cached per format and content coding
+        plain = cache.get(group, RateLimitOutputFormat.JSON)
+        gzipped = cache.get(group, RateLimitOutputFormat.JSON, 'gzip')
+        deflated = cache.get(group, RateLimitOutputFormat.JSON, 'deflate')
+        self.assertIs(cache.get(group, RateLimitOutputFormat.JSON, 'gzip'), gzipped)
+        self.assertEqual(gzip.decompress(gzipped.body), plain.body)
+        self.assertEqual(zlib.decompress(deflated.body), plain.body)
+        self.assertEqual(gzipped.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzipped.headers['Content-Length'], str(len(gzipped.body)))
+        self.assertEqual(gzipped.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(plain.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        etags = {response.headers['ETag'] for response in (plain, gzipped, deflated)}
+        self.assertEqual(len(etags), 3)
+
+        # Not modified response tells caches that it varies
+        _, headers, _ = conditional_response(gzipped, {}, gzipped.headers['ETag'])
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+        # Small responses are not compressed
+        small = cache.get(self.rate_limit, RateLimitOutputFormat.JSON, 'gzip')
+        self.assertEqual(small, render_response(self.rate_limit, RateLimitOutputFormat.JSON))
+
+        # Compression can be disabled
+        cache = ResponseCache(compression_min_size=None)
+        self.assertEqual(
+            cache.get(group, RateLimitOutputFormat.JSON, 'gzip'),
+            render_response(group, RateLimitOutputFormat.JSON))
+
+    def test_compression_exporter_metrics(self) -> None:
+        group = DockerRateLimitGroup({
+            f'account-{index}': DockerRateLimit(rate_limit_max=200, rate_limit_remaining=index)
+            for index in range(50)
+        })
+        cache = ResponseCache(compression_min_size=1024)
+        plain = cache.get(group, RateLimitOutputFormat.PROMETHEUS).body
+
+        # Rate limit is compressed once per refresh and content coding,
+        # only the metrics of the exporter are compressed for every scrape
+        with patch.object(
+                response_cache,
+                'compress_prefix',
+                wraps=response_cache.compress_prefix) as compress_prefix:
+            for scrape in range(5):
+                metrics = f'exporter_requests_total {scrape}\n'
+                for encoding, decompress in (('gzip', gzip.decompress), ('deflate', zlib.decompress)):
+                    response = cache.get_with_exporter_metrics(group, metrics, encoding)
+                    self.assertEqual(decompress(response.body), plain + metrics.encode())
+                    self.assertEqual(response.headers['Content-Encoding'], encoding)
+                    self.assertEqual(response.headers['Content-Length'], str(len(response.body)))
+                    self.assertNotIn('ETag', response.headers)
+            self.assertEqual(compress_prefix.call_count, 2)
+
+            refreshed = DockerRateLimitGroup(dict(group.rate_limits))
+            cache.get_with_exporter_metrics(refreshed, '', 'gzip')
+            self.assertEqual(compress_prefix.call_count, 3)
+
+        # Uncompressed response contains the same
+        response = cache.get_with_exporter_metrics(group, 'exporter_requests_total 5\n')
+        self.assertEqual(response.body, plain + b'exporter_requests_total 5\n')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')